@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from django.contrib.messages import constants as messages
 
@@ -53,6 +54,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.metricas.MetricasMiddleware',
+    'core.roteador.FixarPrimarioMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,15 +68,23 @@ ROOT_URLCONF = 'CRM.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates com medição do tempo de renderização (core.metricas)
+        'BACKEND': 'core.metricas.DjangoTemplatesMedidos',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates compilados uma vez por processo. Em DEBUG o autoreload
+            # do runserver limpa o cache quando um template é alterado.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -84,12 +95,78 @@ WSGI_APPLICATION = 'CRM.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Perfil escolhido por DB_PERFIL: 'sqlite' (padrão) ou 'postgres'.
+# Em ambos a conexão é reaproveitada entre requisições (DB_CONN_MAX_AGE segundos).
+DB_PERFIL = os.environ.get('DB_PERFIL', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_PERFIL == 'postgres':
+    # Requer psycopg (pip install "psycopg[binary,pool]")
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'crm'),
+            'USER': os.environ.get('DB_USER', 'crm'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Testa a conexão reaproveitada antes de usá-la em uma nova requisição
+            'CONN_HEALTH_CHECKS': True,
+            # Cursores no servidor para QuerySet.iterator() (exportações). Desligar
+            # quando houver um pgbouncer em modo transaction na frente do banco.
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_SEM_CURSOR_SERVIDOR') == '1',
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # Pool do psycopg dentro do processo; não combina com conexões persistentes
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 20)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Espera até 20s por um lock em vez de falhar com "database is locked"
+                'timeout': 20,
+                # Escritas pegam o lock no BEGIN: evita o deadlock de duas transações
+                # que leram e depois tentam escrever ao mesmo tempo
+                'transaction_mode': 'IMMEDIATE',
+                # Aplicado a cada conexão nova: WAL (leitores não bloqueiam o escritor),
+                # fsync só nos checkpoints, 256MB de mmap e 64MB de cache de páginas
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA cache_size=-65536;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
     }
-}
+
+# Réplicas de leitura (core.roteador): DB_REPLICAS com os arquivos SQLite ou os
+# hosts PostgreSQL das réplicas, separados por vírgula. Viram os aliases
+# replica1, replica2...
+DB_REPLICAS = []
+for _numero, _destino in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _replica = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default']['OPTIONS'])}
+    _replica['HOST' if DB_PERFIL == 'postgres' else 'NAME'] = _destino.strip()
+    # Nos testes a réplica aponta para o banco de teste do principal
+    _replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{_numero}'] = _replica
+    DB_REPLICAS.append(f'replica{_numero}')
+
+DATABASE_ROUTERS = ['core.roteador.RoteadorReplicas']
+DB_REPLICA_ATRASO_MAXIMO = 5  # segundos; réplica mais atrasada que isso não recebe leituras
+DB_REPLICA_FIXAR_PRIMARIO = 10  # segundos lendo do principal depois de uma escrita
 
 
 # Password validation
@@ -149,3 +226,81 @@ X_FRAME_OPTIONS = 'DENY'
 # EMAIL_USE_TLS = True
 # EMAIL_HOST_USER = 'seu_email'
 # EMAIL_HOST_PASSWORD = 'sua_senha'
+
+# Cache de CEP (ViaCEP)
+CEP_CACHE_TTL = 30 * 24 * 60 * 60  # 30 dias
+CEP_CACHE_TTL_NEGATIVO = 60 * 60  # CEPs inexistentes: 1 hora
+CEP_CACHE_MAX_ITENS = 10000
+CEP_UPSTREAM_URL = os.environ.get('CEP_UPSTREAM_URL', 'https://viacep.com.br/ws')
+CEP_UPSTREAM_TIMEOUT = 5
+CEP_UPSTREAM_CONCORRENCIA = 10  # chamadas simultâneas ao ViaCEP por processo
+CEP_CIRCUITO_FALHAS = 5  # falhas seguidas até abrir o circuito
+CEP_CIRCUITO_TEMPO = 30  # segundos com o circuito aberto
+
+# Contadores do dashboard (core.contadores): tempo em cache, em segundos
+CONTADORES_CACHE_TIMEOUT = 30
+# Linhas por contador: gravações simultâneas somam em linhas diferentes
+CONTADORES_FATIAS = 8
+
+# Linhas já renderizadas das listas de clientes e atendimentos ({% cache %}).
+# A chave inclui updated_at, então edições aparecem na hora; o tempo só limita
+# quanto uma linha sem acesso ocupa o cache. Em segundos.
+LINHAS_CACHE_TIMEOUT = 60 * 60
+
+# Autocomplete de clientes (core.busca.sugerir_clientes): tempo em cache, em segundos
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+
+# Agenda e horários livres (core.agenda): expediente padrão, duração de cada
+# horário em minutos e dias da semana atendidos (0 = segunda)
+AGENDA_ABERTURA = '08:00'
+AGENDA_FECHAMENTO = '18:00'
+AGENDA_DURACAO = 30
+AGENDA_DIAS_SEMANA = (0, 1, 2, 3, 4)
+# Horários ocupados de cada dia em cache, em segundos (invalidados a cada alteração)
+AGENDA_CACHE_TIMEOUT = 10 * 60
+# Maior intervalo aceito em /api/v1/agenda/livres/, em dias
+AGENDA_DIAS_MAXIMO = 62
+
+# Arquivamento (core.arquivo, manage.py arquivar_atendimentos): atendimentos
+# concluídos ou cancelados há mais que esse número de dias saem da tabela
+# principal; lote = atendimentos movidos por transação
+ARQUIVO_DIAS = 180
+ARQUIVO_LOTE = 1000
+
+# Exclusão de clientes (core.exclusao): clientes com mais atendimentos do que
+# o limite são só ocultados na hora e removidos por manage.py purgar_clientes;
+# lote = atendimentos apagados por transação
+EXCLUSAO_LIMITE_IMEDIATO = 500
+EXCLUSAO_LOTE = 1000
+
+# Lembretes e atrasados (core.lembretes, manage.py processar_agendados).
+# Backends: core.lembretes.ConsoleBackend, ArquivoBackend (LEMBRETES_ARQUIVO,
+# uma mensagem JSON por linha) ou EmailBackend (EMAIL_* acima)
+LEMBRETES_BACKEND = 'core.lembretes.ConsoleBackend'
+LEMBRETES_ARQUIVO = BASE_DIR / 'lembretes.jsonl'
+LEMBRETES_ANTECEDENCIA = 24  # horas
+LEMBRETES_LOTE = 1000
+LEMBRETES_MAX_TENTATIVAS = 5
+LEMBRETES_RETENCAO_DIAS = 30
+# Minutos depois do horário até um agendado ser marcado como atrasado
+ATRASO_TOLERANCIA = 30
+
+# Cadastros duplicados (core.duplicados, manage.py find_duplicate_clientes):
+# vizinhos comparados em cada chave de bloco e pontuação mínima de um par
+DUPLICADOS_JANELA = 20
+DUPLICADOS_PONTUACAO_MINIMA = 0.7
+# Nomes com essa similaridade (0 a 1) entram no relatório mesmo abaixo da
+# pontuação mínima: a mesma pessoa cadastrada sem nenhum outro dado em comum
+DUPLICADOS_SIMILARIDADE_NOME = 0.9
+DUPLICADOS_LOTE = 1000
+
+# API JSON (core.api): registros por chamada nas operações em lote
+API_LOTE_MAXIMO = 1000
+
+# Métricas por view (core.metricas), expostas em /metricas/ no formato do Prometheus
+METRICAS_ATIVAS = True
+# Consulta repetida esse número de vezes em uma requisição conta como suspeita de N+1
+METRICAS_LIMITE_REPETICOES = 10
+# /metricas/ exige o cabeçalho "Authorization: Bearer <token>"; sem token
+# definido, só responde com DEBUG ligado
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
@@ -1,16 +1,181 @@
 from django.contrib import admin
-from .models import Cliente, Atendimento
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from . import arquivo, busca, contadores, duplicados, exclusao
+from .models import Cliente, Atendimento, AtendimentoArquivado, Lembrete, ParDuplicado, TokenApi
+from .paginacao import contar_em_cache
+
+
+class ContagemEstimadaPaginator(Paginator):
+    """
+    Paginator do admin que não faz COUNT(*) a cada página: sem filtros usa os
+    contadores do dashboard; com filtros, a contagem fica em cache por um minuto.
+    """
+    TOTAIS = {
+        Cliente: 'clientes_count',
+        Atendimento: 'atendimentos_count',
+        AtendimentoArquivado: 'arquivados_count',
+    }
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        # O manager padrão já filtra os clientes excluídos (core.exclusao): só
+        # conta como filtro o que o admin acrescentar
+        padrao = queryset.model._default_manager.all().query.where
+        if len(queryset.query.where.children) <= len(padrao.children) and queryset.model in self.TOTAIS:
+            return contadores.dashboard()[self.TOTAIS[queryset.model]]
+        return contar_em_cache(queryset)
+
+
+class CidadeFilter(admin.SimpleListFilter):
+    title = 'cidade'
+    parameter_name = 'cidade'
+
+    def lookups(self, request, model_admin):
+        # Cidades do estado escolhido (ou de todos), guardadas em cache por 10 minutos
+        estado = request.GET.get('estado__exact', '')
+        chave = f'admin:cidades:{estado}'
+        cidades = cache.get(chave)
+        if cidades is None:
+            queryset = Cliente.objects.order_by('cidade')
+            if estado:
+                queryset = queryset.filter(estado=estado)
+            cidades = list(queryset.values_list('cidade', flat=True).distinct())
+            cache.set(chave, cidades, 600)
+        return [(cidade, cidade) for cidade in cidades]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(cidade=self.value())
+        return queryset
+
+
+class AdminEstimado(admin.ModelAdmin):
+    paginator = ContagemEstimadaPaginator
+    # Não mostra "N de M" (evita um segundo COUNT sobre a tabela inteira)
+    show_full_result_count = False
+
 
 @admin.register(Cliente)
-class ClienteAdmin(admin.ModelAdmin):
+class ClienteAdmin(AdminEstimado):
     list_display = ['nome', 'email', 'telefone', 'cidade', 'estado', 'created_at']
-    list_filter = ['estado', 'cidade', 'created_at']
+    list_filter = ['estado', CidadeFilter]
+    date_hierarchy = 'created_at'
     search_fields = ['nome', 'email', 'cpf']
     readonly_fields = ['created_at', 'updated_at']
 
+    # Exclusão em lotes (core.exclusao) em vez do collector do Django
+    def delete_model(self, request, obj):
+        exclusao.excluir_cliente(obj)
+
+    def delete_queryset(self, request, queryset):
+        for cliente in queryset:
+            exclusao.excluir_cliente(cliente)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Mesma busca da lista de clientes (FTS e dígitos de CPF/telefone/CEP)
+        if not search_term:
+            return queryset, False
+        return busca.filtrar_clientes(queryset, search_term), False
+
 @admin.register(Atendimento)
-class AtendimentoAdmin(admin.ModelAdmin):
+class AtendimentoAdmin(AdminEstimado):
     list_display = ['cliente', 'data_hora', 'status', 'usuario', 'created_at']
-    list_filter = ['status', 'data_hora', 'usuario']
+    list_filter = ['status', 'usuario']
+    list_select_related = ['cliente', 'usuario']
+    autocomplete_fields = ['cliente', 'usuario']
+    date_hierarchy = 'data_hora'
+    search_fields = ['cliente__nome', 'descricao']
+    readonly_fields = ['created_at', 'updated_at']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return busca.filtrar_atendimentos(queryset, search_term), False
+
+@admin.register(AtendimentoArquivado)
+class AtendimentoArquivadoAdmin(AdminEstimado):
+    """Somente leitura: o arquivo só muda pelo arquivamento e pela restauração (core.arquivo)."""
+    list_display = ['cliente', 'data_hora', 'status', 'usuario', 'arquivado_em']
+    list_filter = ['status']
+    list_select_related = ['cliente', 'usuario']
+    date_hierarchy = 'data_hora'
     search_fields = ['cliente__nome', 'descricao']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    actions = ['restaurar']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return busca.filtrar_atendimentos(queryset, search_term), False
+
+    @admin.action(description='Restaurar para a lista de atendimentos')
+    def restaurar(self, request, queryset):
+        # restaurar() produz o total acumulado a cada lote
+        restaurados = max(arquivo.restaurar(queryset), default=0)
+        self.message_user(request, f'{restaurados} atendimento(s) restaurado(s).')
+
+@admin.register(Lembrete)
+class LembreteAdmin(AdminEstimado):
+    """Somente leitura: a fila é mantida por core.lembretes."""
+    list_display = ['atendimento_id', 'data_hora', 'situacao', 'tentativas', 'erro', 'processado_em']
+    list_filter = ['situacao']
+    date_hierarchy = 'data_hora'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ParDuplicado)
+class ParDuplicadoAdmin(AdminEstimado):
+    """Relatório de cadastros duplicados, refeito por manage.py find_duplicate_clientes."""
+    list_display = ['cliente', 'duplicado', 'pontuacao', 'motivos', 'descartado', 'encontrado_em']
+    list_filter = ['descartado']
+    list_select_related = ['cliente', 'duplicado']
+    actions = ['mesclar', 'descartar']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Mesclar no cadastro mais antigo')
+    def mesclar(self, request, queryset):
+        mesclados = movidos = 0
+        for par in list(queryset.filter(descartado=False).select_related('cliente', 'duplicado')):
+            # Um par anterior pode ter levado um destes clientes (e este par junto)
+            if not ParDuplicado.objects.filter(pk=par.pk).exists():
+                continue
+            movidos += duplicados.mesclar(par.cliente, par.duplicado)
+            mesclados += 1
+        self.message_user(request, f'{mesclados} cadastro(s) mesclado(s), {movidos} atendimento(s) transferido(s).')
+
+    @admin.action(description='Marcar como não duplicado')
+    def descartar(self, request, queryset):
+        descartados = queryset.update(descartado=True)
+        self.message_user(request, f'{descartados} par(es) descartado(s).')
+
+@admin.register(TokenApi)
+class TokenApiAdmin(admin.ModelAdmin):
+    """Tokens são criados por manage.py criar_token_api; aqui só se consulta e revoga (exclui)."""
+    list_display = ['nome', 'usuario', 'created_at']
+    list_select_related = ['usuario']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,159 @@
+"""
+Agenda de atendimentos e horários livres.
+
+Os horários ocupados de cada dia (minutos desde a meia-noite, no fuso local)
+vêm de uma consulta por intervalo no índice único de slot, que só os
+atendimentos ativos preenchem, e ficam em cache por dia. A chave do cache
+leva a versão de atendimentos (core.contadores), que muda a cada gravação:
+nenhum processo reaproveita horários de antes de uma alteração, mesmo com o
+cache local de cada processo. Os horários livres são calculados em memória a
+partir desses minutos, do expediente e da duração pedidos.
+"""
+import bisect
+import math
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_time
+
+from . import contadores
+from .models import Atendimento
+
+
+def _chave(dia, versao):
+    return f'agenda:ocupados:{versao}:{dia.isoformat()}'
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _dias(inicio, fim):
+    return [inicio + timedelta(days=n) for n in range((fim - inicio).days + 1)]
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _em_utc(data_hora):
+    """data_hora em UTC, sem fuso (contas de minutos sem conversão por linha)."""
+    if timezone.is_aware(data_hora):
+        return data_hora.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return data_hora
+
+
+def _valores_brutos(consulta):
+    """
+    Primeira coluna de `consulta` lida direto do cursor. Os conversores do ORM
+    (make_aware linha a linha) custam o dobro da própria consulta quando são
+    dezenas de milhares de horários; o driver já devolve datetime em UTC
+    (sem fuso no SQLite, com fuso no PostgreSQL).
+    """
+    sql, params = consulta.query.sql_with_params()
+    with connections[consulta.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        for linha in cursor:
+            yield linha[0]
+
+
+def ocupados(inicio, fim):
+    """
+    {dia: [minutos ocupados, em ordem]} de `inicio` a `fim` (inclusive). Os dias
+    que não estão no cache saem todos de uma única consulta.
+    """
+    dias = _dias(inicio, fim)
+    # Lida antes dos horários: uma gravação no meio só deixa a entrada velha sem uso
+    versao, = contadores.versoes('atendimento')
+    em_cache = cache.get_many([_chave(dia, versao) for dia in dias])
+    resultado = {dia: em_cache.get(_chave(dia, versao)) for dia in dias}
+    faltando = [dia for dia, minutos in resultado.items() if minutos is None]
+    if faltando:
+        lidos = {dia: [] for dia in faltando}
+        # Início de cada dia do intervalo em UTC (o driver devolve os horários em
+        # UTC): cada horário cai no dia corrente ou num seguinte, já que vêm em ordem
+        dias = _dias(faltando[0], faltando[-1])
+        inicios = [_em_utc(_inicio_do_dia(dia)) for dia in (*dias, dias[-1] + timedelta(days=1))]
+        consulta = (
+            Atendimento.objects
+            .filter(slot__gte=_inicio_do_dia(dias[0]), slot__lt=_inicio_do_dia(dias[-1] + timedelta(days=1)))
+            .order_by('slot')
+            .values_list('slot')
+        )
+        fuso = timezone.get_current_timezone()
+        indice = 0
+        for slot in _valores_brutos(consulta):
+            slot = _em_utc(slot)
+            while slot >= inicios[indice + 1]:
+                indice += 1
+            minutos = lidos.get(dias[indice])
+            if minutos is None:
+                continue
+            if inicios[indice + 1] - inicios[indice] == timedelta(days=1):
+                minutos.append((slot - inicios[indice]).seconds // 60)
+            else:
+                # Dia de mudança de horário de verão: converte de verdade
+                minutos.append(_minutos(slot.replace(tzinfo=dt_timezone.utc).astimezone(fuso)))
+        cache.set_many({_chave(dia, versao): minutos for dia, minutos in lidos.items()}, settings.AGENDA_CACHE_TIMEOUT)
+        resultado.update(lidos)
+    return resultado
+
+
+def horarios_livres(inicio, fim, abertura=None, fechamento=None, duracao=None):
+    """
+    {dia: [time, ...]}: horários de `duracao` minutos entre `abertura` e
+    `fechamento` que não se sobrepõem a um atendimento ativo, nos dias de expediente
+    (AGENDA_DIAS_SEMANA) de `inicio` a `fim`. Horários que já passaram não
+    entram. Os padrões vêm de AGENDA_ABERTURA, AGENDA_FECHAMENTO e AGENDA_DURACAO.
+    """
+    abertura = _minutos(abertura or parse_time(settings.AGENDA_ABERTURA))
+    fechamento = _minutos(fechamento or parse_time(settings.AGENDA_FECHAMENTO))
+    duracao = duracao or settings.AGENDA_DURACAO
+    agora = timezone.localtime()
+    hoje = agora.date()
+    expediente = [dia for dia in _dias(max(inicio, hoje), fim) if dia.weekday() in settings.AGENDA_DIAS_SEMANA]
+
+    livres = {dia: [] for dia in _dias(inicio, fim)}
+    if not expediente:
+        return livres
+    por_dia = ocupados(expediente[0], expediente[-1])
+    for dia in expediente:
+        minutos = por_dia[dia]
+        primeiro = abertura
+        if dia == hoje:
+            # Primeiro horário da grade que ainda não começou
+            passados = max(_minutos(agora) + 1 - abertura, 0)
+            primeiro = abertura + math.ceil(passados / duracao) * duracao
+        for comeco in range(primeiro, fechamento - duracao + 1, duracao):
+            # Cada atendimento ocupa `duracao` minutos a partir do seu horário:
+            # o horário está livre se nenhum começa em (comeco - duracao, comeco + duracao)
+            posicao = bisect.bisect_right(minutos, comeco - duracao)
+            if posicao < len(minutos) and minutos[posicao] < comeco + duracao:
+                continue
+            livres[dia].append(time(comeco // 60, comeco % 60))
+    return livres
+
+
+def inicio_da_semana(dia):
+    return dia - timedelta(days=dia.weekday())
+
+
+def atendimentos_por_dia(inicio, fim):
+    """
+    {dia: [atendimentos]} de `inicio` a `fim` (inclusive), em ordem de horário:
+    uma consulta por intervalo em data_hora, agrupada em memória.
+    """
+    dias = {dia: [] for dia in _dias(inicio, fim)}
+    atendimentos = (
+        Atendimento.objects
+        .filter(data_hora__gte=_inicio_do_dia(inicio), data_hora__lt=_inicio_do_dia(fim + timedelta(days=1)))
+        .select_related('cliente', 'usuario')
+        .only('data_hora', 'status', 'descricao', 'cliente__nome', 'usuario__first_name', 'usuario__last_name')
+        .order_by('data_hora', 'id')
+    )
+    for atendimento in atendimentos:
+        dias[timezone.localdate(atendimento.data_hora)].append(atendimento)
+    return dias
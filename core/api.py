@@ -0,0 +1,406 @@
+"""
+API JSON de clientes e atendimentos (/api/v1/).
+
+Listagem paginada por cursor (keyset, em ordem de id), com os filtros da
+lista e seleção de campos (?campos=nome,email), consulta por id e operações
+em lote: criação, alteração e troca de status de até API_LOTE_MAXIMO
+registros por chamada.
+
+Cada lote é validado com as regras dos formulários (ver core.importacao:
+consultas de duplicidade, cliente e horário feitas uma vez para o lote todo)
+e gravado em uma única transação: ou todos os registros são gravados, ou
+nenhum, e a resposta traz os erros de cada registro pela posição na lista.
+
+Sistemas integrados se autenticam com "Authorization: Token <chave>" (ver
+TokenApi), sem sessão nem CSRF. Chamadas do navegador continuam com a sessão
+do login e o token CSRF.
+"""
+import hashlib
+import json
+import secrets
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+
+from . import busca
+from .forms import AtendimentoForm, ClienteForm
+from .importacao import (
+    ValidadorAtendimentos, ValidadorClientes, atualizar_atendimentos, atualizar_clientes,
+    gravar_status, horarios_ocupados, inserir_atendimentos, inserir_clientes,
+)
+from .models import Atendimento, Cliente, TokenApi
+from .paginacao import KeysetPaginator
+
+MODELOS = {'clientes': Cliente, 'atendimentos': Atendimento}
+
+# Campos que podem ser pedidos em ?campos= (id vem sempre)
+CAMPOS = {
+    'clientes': (
+        'id', 'nome', 'email', 'telefone', 'cpf', 'cep', 'logradouro', 'numero',
+        'complemento', 'bairro', 'cidade', 'estado', 'created_at', 'updated_at',
+    ),
+    'atendimentos': ('id', 'cliente', 'usuario', 'data_hora', 'descricao', 'status', 'created_at', 'updated_at'),
+}
+
+# Campos aceitos na criação e na alteração: os do formulário correspondente
+CAMPOS_GRAVAVEIS = {
+    'clientes': tuple(ClienteForm.base_fields),
+    'atendimentos': tuple(AtendimentoForm.base_fields),
+}
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+MENSAGEM_CONFLITO = (
+    'Outra gravação usou o mesmo CPF, email ou horário durante a chamada. '
+    'Nenhum registro foi gravado; envie o lote de novo.'
+)
+MENSAGEM_CSRF = 'Token CSRF ausente ou incorreto (cabeçalho X-CSRFToken).'
+
+
+class RequisicaoInvalida(Exception):
+    """Parâmetros ou corpo inválidos; a mensagem vai na resposta 400."""
+
+
+class ErrosDeValidacao(Exception):
+    """Registros do lote recusados: lista de {'indice': n, 'erros': {campo: [...]}}."""
+
+    def __init__(self, erros):
+        super().__init__(erros)
+        self.erros = erros
+
+
+# ---------- autenticação ----------
+def _hash(chave):
+    return hashlib.sha256(chave.encode()).hexdigest()
+
+
+def criar_token(usuario, nome):
+    """Cria um TokenApi para `usuario` e retorna a chave, que não fica guardada."""
+    chave = secrets.token_urlsafe(32)
+    TokenApi.objects.create(usuario=usuario, nome=nome, chave_hash=_hash(chave))
+    return chave
+
+
+def usuario_do_token(cabecalho):
+    """Usuário ativo dono da chave em "Token <chave>", ou None."""
+    tipo, _, chave = cabecalho.partition(' ')
+    if tipo.lower() != 'token' or not chave.strip():
+        return None
+    token = TokenApi.objects.select_related('usuario').filter(chave_hash=_hash(chave.strip())).first()
+    if token is None or not token.usuario.is_active:
+        return None
+    return token.usuario
+
+
+def _recusa_csrf(request):
+    """
+    A resposta 403 do CsrfViewMiddleware para uma chamada com sessão, ou None
+    se o CSRF confere. O motivo fica no log django.security.csrf.
+    """
+    verificacao = CsrfViewMiddleware(lambda request: None)
+    verificacao.process_request(request)
+    return verificacao.process_view(request, None, (), {})
+
+
+def endpoint(view):
+    """
+    Decorator das views da API: exige um token ou o login (401 em JSON, sem
+    redirecionar para a tela de login), confere o CSRF só nas chamadas com
+    sessão e transforma os erros deste módulo em respostas.
+    """
+    @csrf_exempt
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        cabecalho = request.headers.get('Authorization')
+        if cabecalho:
+            usuario = usuario_do_token(cabecalho)
+            if usuario is None:
+                return JsonResponse({'erro': 'Token inválido.'}, status=401)
+            request.user = usuario
+        elif not request.user.is_authenticated:
+            return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+        elif _recusa_csrf(request) is not None:
+            return JsonResponse({'erro': MENSAGEM_CSRF}, status=403)
+        try:
+            return view(request, *args, **kwargs)
+        except RequisicaoInvalida as e:
+            return JsonResponse({'erro': str(e)}, status=400)
+        except ErrosDeValidacao as e:
+            return JsonResponse({'erros': e.erros}, status=400)
+        except IntegrityError:
+            return JsonResponse({'erro': MENSAGEM_CONFLITO}, status=409)
+    return _view
+
+
+# ---------- leitura ----------
+def campos_pedidos(modelo, parametros):
+    pedidos = [campo.strip() for campo in parametros.get('campos', '').split(',') if campo.strip()]
+    if not pedidos:
+        return CAMPOS[modelo]
+    desconhecidos = set(pedidos) - set(CAMPOS[modelo])
+    if desconhecidos:
+        raise RequisicaoInvalida(f'Campos desconhecidos: {", ".join(sorted(desconhecidos))}.')
+    return tuple(dict.fromkeys(('id', *pedidos)))
+
+
+def _inteiro(parametros, nome, padrao=None):
+    valor = parametros.get(nome)
+    if not valor:
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        raise RequisicaoInvalida(f'{nome}: informe um número inteiro.')
+
+
+def _data_hora(parametros, nome):
+    valor = parametros.get(nome)
+    if not valor:
+        return None
+    try:
+        data_hora = parse_datetime(valor)
+    except ValueError:
+        data_hora = None
+    if data_hora is None:
+        raise RequisicaoInvalida(f'{nome}: use o formato ISO 8601 (ex.: 2025-01-31T14:00).')
+    return timezone.make_aware(data_hora) if timezone.is_naive(data_hora) else data_hora
+
+
+def queryset_api(modelo, parametros):
+    """
+    Filtros da lista (?search=, e ?status= nos atendimentos) mais ?estado= e
+    ?cidade= nos clientes e ?cliente=, ?usuario=, ?inicio= e ?fim= (data_hora)
+    nos atendimentos.
+    """
+    if modelo == 'clientes':
+        queryset = busca.clientes_da_lista(parametros)
+        for campo in ('estado', 'cidade'):
+            if parametros.get(campo):
+                queryset = queryset.filter(**{campo: parametros[campo]})
+        return queryset
+
+    queryset = busca.atendimentos_da_lista(parametros)
+    for campo in ('cliente', 'usuario'):
+        valor = _inteiro(parametros, campo)
+        if valor is not None:
+            queryset = queryset.filter(**{f'{campo}_id': valor})
+    inicio = _data_hora(parametros, 'inicio')
+    if inicio:
+        queryset = queryset.filter(data_hora__gte=inicio)
+    fim = _data_hora(parametros, 'fim')
+    if fim:
+        queryset = queryset.filter(data_hora__lt=fim)
+    return queryset
+
+
+def serializar(obj, campos):
+    dados = {}
+    for campo in campos:
+        valor = getattr(obj, obj._meta.get_field(campo).attname)
+        if isinstance(valor, datetime):
+            valor = timezone.localtime(valor).isoformat()
+        dados[campo] = valor
+    return dados
+
+
+def listar(modelo, parametros):
+    """Uma página da listagem: {'resultados': [...], 'proximo': cursor, 'anterior': cursor}."""
+    campos = campos_pedidos(modelo, parametros)
+    limite = min(max(_inteiro(parametros, 'limite', LIMITE_PADRAO), 1), LIMITE_MAXIMO)
+    # only(): só as colunas pedidas saem do banco
+    queryset = queryset_api(modelo, parametros).only(*campos)
+    pagina = KeysetPaginator(queryset, ('id',), limite).get_page(parametros.get('cursor'))
+    return {
+        'resultados': [serializar(obj, campos) for obj in pagina],
+        'proximo': pagina.next_cursor,
+        'anterior': pagina.previous_cursor,
+    }
+
+
+def obter(modelo, pk, parametros):
+    campos = campos_pedidos(modelo, parametros)
+    obj = MODELOS[modelo].objects.only(*campos).filter(pk=pk).first()
+    return serializar(obj, campos) if obj is not None else None
+
+
+# ---------- escrita ----------
+def ler_json(corpo):
+    try:
+        return json.loads(corpo)
+    except ValueError:
+        raise RequisicaoInvalida('O corpo da requisição não é um JSON válido.')
+
+
+def _verificar_tamanho(quantidade):
+    maximo = settings.API_LOTE_MAXIMO
+    if quantidade > maximo:
+        raise RequisicaoInvalida(f'Envie no máximo {maximo} registros por chamada.')
+
+
+def ler_lote(corpo):
+    lote = ler_json(corpo)
+    if not isinstance(lote, list) or not lote:
+        raise RequisicaoInvalida('Envie uma lista JSON com os registros.')
+    _verificar_tamanho(len(lote))
+    return lote
+
+
+def _erro(indice, campo, mensagem, codigo='invalido'):
+    return {'indice': indice, 'erros': {campo: [{'message': mensagem, 'code': codigo}]}}
+
+
+def _falhar_se(erros):
+    if erros:
+        raise ErrosDeValidacao(sorted(erros, key=lambda erro: erro['indice']))
+
+
+def _rejeitados(rejeitados):
+    return [{'indice': indice, 'erros': erros} for indice, erros in rejeitados]
+
+
+def _campos_desconhecidos(indice, item, aceitos):
+    desconhecidos = set(item) - set(aceitos)
+    if desconhecidos:
+        return {'indice': indice, 'erros': {
+            campo: [{'message': 'Campo desconhecido.', 'code': 'desconhecido'}] for campo in sorted(desconhecidos)
+        }}
+    return None
+
+
+def _novos(modelo, lote):
+    linhas, erros = [], []
+    for indice, item in enumerate(lote):
+        if not isinstance(item, dict):
+            erros.append(_erro(indice, '__all__', 'Cada registro deve ser um objeto JSON.'))
+            continue
+        erro = _campos_desconhecidos(indice, item, CAMPOS_GRAVAVEIS[modelo])
+        if erro:
+            erros.append(erro)
+            continue
+        linhas.append((indice, item))
+    return linhas, erros
+
+
+def _alteracoes(modelo, lote):
+    """
+    Carrega os registros do lote com uma consulta e junta os valores atuais aos
+    enviados (alteração parcial: só os campos enviados mudam).
+    """
+    aceitos = CAMPOS_GRAVAVEIS[modelo]
+    ids = [item.get('id') for item in lote if isinstance(item, dict)]
+    existentes = MODELOS[modelo].objects.in_bulk([pk for pk in ids if isinstance(pk, int)])
+    linhas, instancias, erros = [], {}, []
+    vistos = set()
+    for indice, item in enumerate(lote):
+        if not isinstance(item, dict):
+            erros.append(_erro(indice, '__all__', 'Cada registro deve ser um objeto JSON.'))
+            continue
+        pk = item.get('id')
+        if not isinstance(pk, int):
+            erros.append(_erro(indice, 'id', 'Informe o id do registro.', 'required'))
+            continue
+        if pk not in existentes:
+            erros.append(_erro(indice, 'id', 'Registro não encontrado.', 'nao_encontrado'))
+            continue
+        if pk in vistos:
+            erros.append(_erro(indice, 'id', 'Registro repetido no lote.', 'repetido'))
+            continue
+        vistos.add(pk)
+        alteracoes = {campo: valor for campo, valor in item.items() if campo != 'id'}
+        erro = _campos_desconhecidos(indice, alteracoes, aceitos)
+        if erro:
+            erros.append(erro)
+            continue
+        instancia = existentes[pk]
+        dados = {campo: getattr(instancia, instancia._meta.get_field(campo).attname) for campo in aceitos}
+        dados.update(alteracoes)
+        linhas.append((indice, dados))
+        instancias[indice] = instancia
+    return linhas, instancias, erros
+
+
+def criar(modelo, lote, usuario):
+    """Cria os registros do lote. Os atendimentos ficam com `usuario` como atendente."""
+    linhas, erros = _novos(modelo, lote)
+    with transaction.atomic():
+        if modelo == 'clientes':
+            validos, rejeitados = ValidadorClientes().validar_lote(linhas)
+        else:
+            validos, rejeitados = ValidadorAtendimentos(usuario).validar_lote(linhas)
+        _falhar_se(erros + _rejeitados(rejeitados))
+        objetos = [obj for _, obj in validos]
+        if modelo == 'clientes':
+            inserir_clientes(objetos)
+        else:
+            inserir_atendimentos(objetos)
+    return {'criados': len(objetos), 'ids': [obj.pk for obj in objetos]}
+
+
+def alterar(modelo, lote):
+    """Altera os registros do lote; cada item traz o id e os campos que mudam."""
+    with transaction.atomic():
+        linhas, instancias, erros = _alteracoes(modelo, lote)
+        if modelo == 'clientes':
+            validos, rejeitados = ValidadorClientes().validar_lote(linhas, instancias)
+        else:
+            validos, rejeitados = ValidadorAtendimentos().validar_lote(linhas, instancias)
+        _falhar_se(erros + _rejeitados(rejeitados))
+        objetos = [obj for _, obj in validos]
+        # Só as colunas enviadas em algum item entram no UPDATE
+        campos = [campo for campo in CAMPOS_GRAVAVEIS[modelo] if any(campo in item for item in lote)]
+        if modelo == 'clientes':
+            atualizar_clientes(objetos, campos)
+        else:
+            atualizar_atendimentos(objetos, campos)
+    return {'alterados': len(objetos)}
+
+
+def alterar_status(dados):
+    """
+    {"ids": [...], "status": "concluido"}. Diferente de alterar(), não recusa
+    atendimentos no passado (concluir um atendimento que já aconteceu é o caso
+    comum); só confere se o horário está livre quando o status é ativo.
+    """
+    if not isinstance(dados, dict):
+        raise RequisicaoInvalida('Envie um objeto JSON com "ids" e "status".')
+    status = dados.get('status')
+    if status not in dict(Atendimento.STATUS_CHOICES):
+        opcoes = ', '.join(valor for valor, _ in Atendimento.STATUS_CHOICES)
+        raise RequisicaoInvalida(f'status: escolha entre {opcoes}.')
+    ids = dados.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+        raise RequisicaoInvalida('ids: envie uma lista com os ids dos atendimentos.')
+    _verificar_tamanho(len(ids))
+
+    with transaction.atomic():
+        atendimentos = Atendimento.objects.only('id', 'data_hora', 'status').in_bulk(ids)
+        erros = [
+            _erro(indice, 'id', 'Registro não encontrado.', 'nao_encontrado')
+            for indice, pk in enumerate(ids) if pk not in atendimentos
+        ]
+        for atendimento in atendimentos.values():
+            atendimento.status = status
+            atendimento.slot = Atendimento.calcular_slot(atendimento.data_hora, status)
+        ocupados = horarios_ocupados((atendimento.slot for atendimento in atendimentos.values()), excluir=ids)
+        vistos = set()
+        for indice, pk in enumerate(ids):
+            atendimento = atendimentos.get(pk)
+            if atendimento is None or pk in vistos:
+                continue
+            vistos.add(pk)
+            if atendimento.slot is None:
+                continue
+            if atendimento.slot in ocupados:
+                erros.append(_erro(indice, 'status', AtendimentoForm.MENSAGEM_CONFLITO, 'conflito'))
+            ocupados.add(atendimento.slot)
+        _falhar_se(erros)
+        gravar_status(list(atendimentos.values()), status)
+    return {'alterados': len(atendimentos)}
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import busca, relatorios, signals  # noqa: F401 (registra os receptores)
+        post_migrate.connect(busca.garantir_triggers, sender=self)
+        post_migrate.connect(relatorios.garantir_triggers, sender=self)
@@ -0,0 +1,124 @@
+"""
+Arquivamento de atendimentos encerrados.
+
+Atendimentos concluídos ou cancelados há mais de ARQUIVO_DIAS dias saem de
+core_atendimento e vão para core_atendimentoarquivado (AtendimentoArquivado),
+com o mesmo id. A lista, o dashboard, a agenda e a verificação de conflito
+consultam só a tabela de atendimentos, cujo tamanho passa a depender do
+movimento recente e não de todo o histórico.
+
+Cada lote é movido em uma transação (INSERT ... SELECT seguido de DELETE pelos
+mesmos ids): se o comando for interrompido, os lotes já gravados ficam
+arquivados e a próxima execução continua de onde parou. restaurar() faz o
+caminho inverso.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import contadores
+from .models import Atendimento, AtendimentoArquivado
+
+STATUS_ARQUIVAVEIS = Atendimento.STATUS_ENCERRADOS
+
+# Colunas copiadas entre as duas tabelas (as de AtendimentoArquivado menos
+# arquivado_em; slot fica NULL, já que só atendimentos encerrados são movidos)
+COLUNAS = [
+    campo.column for campo in AtendimentoArquivado._meta.concrete_fields
+    if campo.name != 'arquivado_em'
+]
+
+
+def data_de_corte(dias=None):
+    """
+    Início do dia, `dias` dias atrás (padrão: ARQUIVO_DIAS). Nunca entra o dia
+    de hoje, então os contadores por dia do dashboard não mudam.
+    """
+    dias = settings.ARQUIVO_DIAS if dias is None else dias
+    return timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=dias), time.min))
+
+
+def arquivaveis(corte):
+    return Atendimento.objects.filter(status__in=STATUS_ARQUIVAVEIS, data_hora__lt=corte)
+
+
+def _mover(origem, destino, ids, extra=None):
+    """Copia as linhas `ids` de `origem` para `destino` e as apaga de `origem`."""
+    qn = connection.ops.quote_name
+    colunas = ', '.join(qn(coluna) for coluna in COLUNAS)
+    extra = extra or {}
+    nomes_extra = ''.join(f', {qn(coluna)}' for coluna in extra)
+    valores_extra = ', %s' * len(extra)
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {qn(destino)} ({colunas}{nomes_extra}) '
+            f'SELECT {colunas}{valores_extra} FROM {qn(origem)} WHERE id IN ({marcadores})',
+            [*extra.values(), *ids],
+        )
+        cursor.execute(f'DELETE FROM {qn(origem)} WHERE id IN ({marcadores})', ids)
+        return cursor.rowcount
+
+
+def _registrar(movidos, arquivados):
+    sinal = 1 if arquivados else -1
+    contadores.incrementar(contadores.ATENDIMENTOS, -sinal * movidos)
+    contadores.incrementar(contadores.ARQUIVADOS, sinal * movidos)
+    contadores.nova_versao('atendimento')
+
+
+def arquivar_lote(corte, tamanho=None):
+    """Arquiva até `tamanho` atendimentos encerrados antes de `corte`. Retorna quantos."""
+    tamanho = tamanho or settings.ARQUIVO_LOTE
+    with transaction.atomic():
+        ids = list(arquivaveis(corte).order_by().values_list('id', flat=True)[:tamanho])
+        if not ids:
+            return 0
+        agora = connection.ops.adapt_datetimefield_value(timezone.now())
+        movidos = _mover(
+            Atendimento._meta.db_table, AtendimentoArquivado._meta.db_table, ids,
+            {AtendimentoArquivado._meta.get_field('arquivado_em').column: agora},
+        )
+        _registrar(movidos, arquivados=True)
+    return movidos
+
+
+def restaurar_lote(arquivados, tamanho=None):
+    """
+    Devolve à tabela de atendimentos até `tamanho` atendimentos do queryset
+    `arquivados` (de AtendimentoArquivado). Retorna quantos.
+    """
+    tamanho = tamanho or settings.ARQUIVO_LOTE
+    with transaction.atomic():
+        ids = list(arquivados.order_by().values_list('id', flat=True)[:tamanho])
+        if not ids:
+            return 0
+        movidos = _mover(AtendimentoArquivado._meta.db_table, Atendimento._meta.db_table, ids)
+        _registrar(movidos, arquivados=False)
+    return movidos
+
+
+def _em_lotes(funcao, argumento, tamanho, max_lotes):
+    total = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        movidos = funcao(argumento, tamanho)
+        if not movidos:
+            break
+        total += movidos
+        lotes += 1
+        yield total
+
+
+def arquivar(corte, tamanho=None, max_lotes=None):
+    """
+    Arquiva em lotes tudo o que for arquivável antes de `corte`. Gerador: a
+    cada lote gravado produz o total movido até ali.
+    """
+    return _em_lotes(arquivar_lote, corte, tamanho, max_lotes)
+
+
+def restaurar(arquivados, tamanho=None, max_lotes=None):
+    """Restaura em lotes os atendimentos de `arquivados`; produz o total a cada lote."""
+    return _em_lotes(restaurar_lote, arquivados, tamanho, max_lotes)
@@ -0,0 +1,349 @@
+"""
+Busca textual das listas de clientes e atendimentos.
+
+No SQLite a busca usa os índices FTS5 criados na migração 0004 (mantidos por
+triggers), sem acentos e por prefixo de palavra: "jose sil" encontra
+"José da Silva". Nos outros bancos cai no icontains de antes.
+"""
+import hashlib
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import Atendimento, AtendimentoArquivado, Cliente, so_digitos
+
+TABELAS_FTS = {
+    'cliente': 'core_cliente_fts',
+    'atendimento': 'core_atendimento_fts',
+    'arquivado': 'core_atendimentoarquivado_fts',
+}
+
+# Os triggers de clientes consultam atendimentos e vice-versa. Quando o Django
+# recria uma das tabelas no SQLite (o que acontece em várias alterações de
+# schema), os triggers precisam ser removidos antes e recriados depois; cada
+# migração leva a sua cópia do SQL (veja 0013_duplicados). Mudanças aqui
+# precisam de uma migração que recrie os triggers alterados.
+SQL_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ai AFTER INSERT ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ad AFTER DELETE ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_au AFTER UPDATE OF nome, email, cpf, telefone ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ai AFTER INSERT ON core_atendimento BEGIN
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ad AFTER DELETE ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_au AFTER UPDATE OF cliente_id, descricao ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_atendimento_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimento_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimento WHERE cliente_id = new.id);
+    END
+    """,
+    # Arquivo de atendimentos (core.arquivo): as linhas entram e saem, e só
+    # mudam de cliente na mesclagem de duplicados (core.duplicados)
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_ai AFTER INSERT ON core_atendimentoarquivado BEGIN
+        INSERT INTO core_atendimentoarquivado_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_ad AFTER DELETE ON core_atendimentoarquivado BEGIN
+        DELETE FROM core_atendimentoarquivado_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_au AFTER UPDATE OF cliente_id ON core_atendimentoarquivado BEGIN
+        UPDATE core_atendimentoarquivado_fts SET cliente_nome = (SELECT nome FROM core_cliente WHERE id = new.cliente_id)
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_arquivado_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimentoarquivado_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimentoarquivado WHERE cliente_id = new.id);
+    END
+    """,
+]
+
+NOMES_TRIGGERS = [
+    'core_cliente_fts_ai', 'core_cliente_fts_ad', 'core_cliente_fts_au',
+    'core_atendimento_fts_ai', 'core_atendimento_fts_ad', 'core_atendimento_fts_au',
+    'core_cliente_nome_atendimento_fts_au',
+    'core_atendimentoarquivado_fts_ai', 'core_atendimentoarquivado_fts_ad', 'core_atendimentoarquivado_fts_au',
+    'core_cliente_nome_arquivado_fts_au',
+]
+
+SQL_RECONSTRUIR = [
+    "INSERT INTO core_cliente_fts(core_cliente_fts) VALUES ('rebuild')",
+    'DELETE FROM core_atendimento_fts',
+    """
+    INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+    SELECT a.id, c.nome, a.descricao FROM core_atendimento a JOIN core_cliente c ON c.id = a.cliente_id
+    """,
+    'DELETE FROM core_atendimentoarquivado_fts',
+    """
+    INSERT INTO core_atendimentoarquivado_fts(rowid, cliente_nome, descricao)
+    SELECT a.id, c.nome, a.descricao FROM core_atendimentoarquivado a JOIN core_cliente c ON c.id = a.cliente_id
+    """,
+    "INSERT INTO core_cliente_fts(core_cliente_fts) VALUES ('optimize')",
+    "INSERT INTO core_atendimento_fts(core_atendimento_fts) VALUES ('optimize')",
+    "INSERT INTO core_atendimentoarquivado_fts(core_atendimentoarquivado_fts) VALUES ('optimize')",
+]
+
+
+def fts_disponivel():
+    return connection.vendor == 'sqlite'
+
+
+def consulta_fts(texto):
+    """
+    Converte o texto digitado em uma consulta FTS5: cada palavra vira um termo
+    de prefixo entre aspas, o que também neutraliza a sintaxe do FTS5
+    (AND, OR, NEAR, *, aspas) vinda do usuário.
+    """
+    termos = re.findall(r'\w+', texto)
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def _ids_fts(tabela, consulta):
+    return RawSQL(f'SELECT rowid FROM {tabela} WHERE {tabela} MATCH %s', (consulta,))
+
+
+def prefixo_q(campo, prefixo, tamanho):
+    """
+    Filtro por prefixo em uma coluna só de dígitos como intervalo
+    (campo >= prefixo AND campo < prefixo + ':'), que usa o índice em qualquer
+    banco. ':' é o caractere seguinte ao '9' na tabela ASCII.
+    """
+    if len(prefixo) >= tamanho:
+        return Q(**{campo: prefixo})
+    return Q(**{f'{campo}__gte': prefixo, f'{campo}__lt': prefixo + ':'})
+
+
+def busca_por_documento(texto):
+    """Dígitos do texto, se ele for só um CPF, telefone ou CEP (com ou sem máscara)."""
+    if re.fullmatch(r'[\d\s().\-/]+', texto):
+        return so_digitos(texto)
+    return ''
+
+
+def filtrar_clientes(queryset, texto):
+    consulta = consulta_fts(texto)
+    digitos = busca_por_documento(texto)
+    if fts_disponivel() and consulta:
+        filtro = Q(id__in=_ids_fts(TABELAS_FTS['cliente'], consulta))
+    else:
+        filtro = (
+            Q(nome__icontains=texto) |
+            Q(email__icontains=texto) |
+            Q(cpf__icontains=texto) |
+            Q(telefone__icontains=texto)
+        )
+    if digitos:
+        filtro |= (
+            prefixo_q('cpf_digitos', digitos, 11) |
+            prefixo_q('telefone_digitos', digitos, 11) |
+            prefixo_q('cep_digitos', digitos, 8)
+        )
+    return queryset.filter(filtro)
+
+
+def filtrar_atendimentos(queryset, texto):
+    """Filtra atendimentos ou atendimentos arquivados (cada tabela tem o seu índice FTS)."""
+    consulta = consulta_fts(texto)
+    if fts_disponivel() and consulta:
+        tabela = TABELAS_FTS['arquivado' if queryset.model is AtendimentoArquivado else 'atendimento']
+        return queryset.filter(id__in=_ids_fts(tabela, consulta))
+    return queryset.filter(
+        Q(cliente__nome__icontains=texto) |
+        Q(descricao__icontains=texto)
+    )
+
+
+def clientes_da_lista(parametros, todos=False):
+    """
+    Clientes com os filtros da lista (?search=); usado também na exportação.
+    `todos` inclui os excluídos à espera da remoção (core.exclusao).
+    """
+    clientes = (Cliente.todos if todos else Cliente.objects).all()
+    search = parametros.get('search', '')
+    if search:
+        clientes = filtrar_clientes(clientes, search)
+    return clientes
+
+
+def com_historico(parametros):
+    """?historico=1: a lista e a exportação de atendimentos incluem o arquivo."""
+    return parametros.get('historico') == '1'
+
+
+def atendimentos_da_lista(parametros, arquivados=False, todos=False):
+    """
+    Atendimentos com os filtros da lista (?search=&status=); usado também na
+    exportação. Com `arquivados`, os mesmos filtros sobre o arquivo; `todos`
+    inclui os de clientes excluídos à espera da remoção (core.exclusao).
+    """
+    modelo = AtendimentoArquivado if arquivados else Atendimento
+    atendimentos = (modelo.todos if todos else modelo.objects).all()
+    status = parametros.get('status', '')
+    if arquivados and status and status not in Atendimento.STATUS_ENCERRADOS:
+        # O arquivo só tem atendimentos encerrados (core.arquivo)
+        return atendimentos.none()
+    search = parametros.get('search', '')
+    if search:
+        atendimentos = filtrar_atendimentos(atendimentos, search)
+    if status:
+        atendimentos = atendimentos.filter(status=status)
+    return atendimentos
+
+
+def _prefixo_texto_q(campo, prefixo):
+    # Intervalo [prefixo, prefixo + maior caractere Unicode): usa o índice do campo
+    return Q(**{f'{campo}__gte': prefixo, f'{campo}__lt': prefixo + '\U0010ffff'})
+
+
+def _buscar_clientes(texto, limite):
+    campos = ('id', 'nome', 'cpf', 'email')
+    digitos = busca_por_documento(texto)
+    if digitos:
+        clientes = Cliente.objects.filter(prefixo_q('cpf_digitos', digitos, 11)).order_by('cpf_digitos')
+    elif '@' in texto:
+        # Os emails ficam como foram digitados: compara em minúsculas dos dois lados
+        clientes = (
+            Cliente.objects.alias(email_minusculo=Lower('email'))
+            .filter(_prefixo_texto_q('email_minusculo', texto.lower()))
+            .order_by('email_minusculo')
+        )
+    elif fts_disponivel():
+        ids = ids_ranqueados('cliente', texto, limite)
+        por_id = {cliente['id']: cliente for cliente in Cliente.objects.filter(id__in=ids).values(*campos)}
+        return [por_id[pk] for pk in ids if pk in por_id]
+    else:
+        clientes = Cliente.objects.filter(nome__istartswith=texto).order_by('nome', 'id')
+    return list(clientes.values(*campos)[:limite])
+
+
+def sugerir_clientes(texto, limite=10):
+    """
+    Clientes para o autocomplete do formulário de atendimento: por prefixo do
+    CPF (só dígitos), do email (com '@') ou das palavras do nome (FTS). As
+    respostas ficam alguns segundos em cache.
+    """
+    texto = ' '.join(texto.split())
+    if len(texto) < 2:
+        return []
+    chave = 'busca:clientes:%s:%d' % (hashlib.md5(texto.lower().encode()).hexdigest(), limite)
+    timeout = getattr(settings, 'AUTOCOMPLETE_CACHE_TIMEOUT', 30)
+    return cache.get_or_set(chave, lambda: _buscar_clientes(texto, limite), timeout)
+
+
+def ids_ranqueados(modelo, texto, limite=50):
+    """
+    Ids que casam com `texto`, do mais relevante para o menos relevante (bm25).
+    `modelo` é 'cliente' ou 'atendimento'.
+    """
+    consulta = consulta_fts(texto)
+    if not (fts_disponivel() and consulta):
+        return []
+    tabela = TABELAS_FTS[modelo]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {tabela} WHERE {tabela} MATCH %s ORDER BY rank LIMIT %s',
+            [consulta, limite],
+        )
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def ranquear(queryset, modelo, texto, limite=50):
+    """
+    Os `limite` resultados mais relevantes do queryset para `texto`, em ordem
+    de relevância (lista de objetos).
+    """
+    ids = ids_ranqueados(modelo, texto, limite)
+    objetos = queryset.in_bulk(ids)
+    return [objetos[pk] for pk in ids if pk in objetos]
+
+
+def _fts_instalado(cursor):
+    cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s)" % ', '.join(['%s'] * len(TABELAS_FTS)),
+        list(TABELAS_FTS.values()),
+    )
+    return cursor.fetchone()[0] == len(TABELAS_FTS)
+
+
+def garantir_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Receptor de post_migrate: recria os triggers de sincronização que faltarem."""
+    conexao = connections[using]
+    if conexao.vendor != 'sqlite':
+        return
+    with conexao.cursor() as cursor:
+        if not _fts_instalado(cursor):
+            return
+        for sql in SQL_TRIGGERS:
+            cursor.execute(sql)
+
+
+@contextmanager
+def indexacao_adiada():
+    """
+    Para cargas grandes: remove os triggers durante o bloco e, no fim, recria os
+    triggers e reconstrói os índices FTS de uma vez (bem mais rápido do que
+    atualizar o índice linha a linha).
+    """
+    if not fts_disponivel():
+        yield
+        return
+    with connection.cursor() as cursor:
+        for nome in NOMES_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {nome}')
+    try:
+        yield
+    finally:
+        garantir_triggers()
+        reconstruir_indices()
+
+
+def reconstruir_indices():
+    if not fts_disponivel():
+        return False
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in SQL_RECONSTRUIR:
+            cursor.execute(sql)
+    return True
@@ -0,0 +1,369 @@
+"""
+Consulta de CEP com cache em dois níveis.
+
+1. Memória do processo (LRU com limite de itens);
+2. Tabela CepCache no banco, com data da consulta e expiração por TTL.
+
+Antes do cache do banco é consultada a base local de CEPs (CepLocal, carregada
+com `manage.py carregar_ceps`). O ViaCEP só é consultado quando o CEP não está
+na base local nem em cache, ou quando a entrada em cache expirou. Se o
+ViaCEP estiver lento ou fora do ar, a entrada expirada continua sendo usada.
+
+As chamadas ao ViaCEP compartilham um pool de conexões keep-alive, têm um
+limite de concorrência e passam por um circuit breaker. A versão assíncrona
+(aconsultar_cep) ainda agrupa consultas simultâneas do mesmo CEP em uma única
+chamada (single-flight).
+"""
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metricas
+from .models import CepCache, CepLocal
+
+CAMPOS = ('logradouro', 'bairro', 'cidade', 'estado')
+
+
+class FalhaUpstream(Exception):
+    pass
+
+
+class Entrada:
+    __slots__ = ('dados', 'consultado_em', 'expira_em')
+
+    def __init__(self, dados, consultado_em):
+        # dados é None quando o ViaCEP respondeu {"erro": true}
+        self.dados = dados
+        self.consultado_em = consultado_em
+        ttl = _config('CEP_CACHE_TTL') if dados is not None else _config('CEP_CACHE_TTL_NEGATIVO')
+        self.expira_em = consultado_em + ttl
+
+    def valida(self, agora):
+        return agora < self.expira_em
+
+
+class CacheLRU:
+    def __init__(self, max_itens):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None:
+                self._itens.move_to_end(chave)
+            return entrada
+
+    def set(self, chave, entrada):
+        with self._lock:
+            self._itens[chave] = entrada
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class Estatisticas:
+    CONTADORES = (
+        'hits_memoria', 'hits_banco', 'hits_base_local', 'misses', 'stale', 'erros_upstream',
+        'deduplicadas', 'circuito_aberto',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.zerar()
+
+    def incrementar(self, nome):
+        with self._lock:
+            self._valores[nome] += 1
+
+    def zerar(self):
+        with self._lock:
+            self._valores = dict.fromkeys(self.CONTADORES, 0)
+
+    def como_dict(self):
+        with self._lock:
+            return dict(self._valores)
+
+
+class CircuitBreaker:
+    """
+    Abre depois de `limite_falhas` falhas seguidas e recusa chamadas por
+    `tempo_aberto` segundos. Depois disso deixa passar uma chamada de teste
+    (meio-aberto): se ela funcionar o circuito fecha, senão abre de novo.
+    """
+
+    def __init__(self, limite_falhas, tempo_aberto):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self._lock = threading.Lock()
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._testando = False
+
+    def permitir(self):
+        with self._lock:
+            if self.falhas < self.limite_falhas:
+                return True
+            if time.monotonic() < self.aberto_ate or self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self._testando = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            self._testando = False
+            if self.falhas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self.falhas < self.limite_falhas:
+                return 'fechado'
+            if time.monotonic() < self.aberto_ate:
+                return 'aberto'
+            return 'meio-aberto'
+
+
+DEFAULTS = {
+    'CEP_CACHE_TTL': 30 * 24 * 60 * 60,
+    'CEP_CACHE_TTL_NEGATIVO': 60 * 60,
+    'CEP_CACHE_MAX_ITENS': 10000,
+    'CEP_UPSTREAM_URL': 'https://viacep.com.br/ws',
+    'CEP_UPSTREAM_TIMEOUT': 5,
+    'CEP_UPSTREAM_CONCORRENCIA': 10,
+    'CEP_UPSTREAM_ESPERA': 0.5,
+    'CEP_CIRCUITO_FALHAS': 5,
+    'CEP_CIRCUITO_TEMPO': 30,
+}
+
+
+def _config(nome):
+    return getattr(settings, nome, DEFAULTS[nome])
+
+
+memoria = CacheLRU(_config('CEP_CACHE_MAX_ITENS'))
+estatisticas = Estatisticas()
+circuito = CircuitBreaker(_config('CEP_CIRCUITO_FALHAS'), _config('CEP_CIRCUITO_TEMPO'))
+_vagas_upstream = threading.BoundedSemaphore(_config('CEP_UPSTREAM_CONCORRENCIA'))
+# Threads próprias para as chamadas da versão assíncrona: o pool padrão do
+# asgiref tem só cpu+4 threads e limitaria a concorrência abaixo da configurada
+_executor_upstream = ThreadPoolExecutor(
+    max_workers=_config('CEP_UPSTREAM_CONCORRENCIA'), thread_name_prefix='viacep',
+)
+
+
+def _criar_sessao():
+    # Uma sessão por processo: as conexões com o ViaCEP ficam abertas (keep-alive)
+    # e são reaproveitadas entre requisições.
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_config('CEP_UPSTREAM_CONCORRENCIA'))
+    sessao.mount('http://', adapter)
+    sessao.mount('https://', adapter)
+    return sessao
+
+
+_sessao = _criar_sessao()
+
+
+def normalizar_cep(cep):
+    return ''.join(c for c in cep if c.isdigit())
+
+
+def buscar_base_local(cep):
+    return CepLocal.objects.filter(pk=int(cep)).values(*CAMPOS).first()
+
+
+def buscar_por_prefixo(prefixo, limite=10):
+    """
+    CEPs da base local que começam com `prefixo` (1 a 8 dígitos), em ordem.
+    O prefixo vira um intervalo da chave primária, então a consulta não
+    depende do tamanho da base.
+    """
+    prefixo = normalizar_cep(prefixo)[:8]
+    if not prefixo:
+        return CepLocal.objects.none()
+    return CepLocal.objects.filter(
+        cep__gte=int(prefixo.ljust(8, '0')),
+        cep__lte=int(prefixo.ljust(8, '9')),
+    ).order_by('cep')[:limite]
+
+
+def _carregar_do_banco(cep):
+    # hits_banco conta as duas fontes; hits_base_local só a base local
+    dados = buscar_base_local(cep)
+    if dados is not None:
+        estatisticas.incrementar('hits_base_local')
+        return Entrada(dados, time.time())
+    registro = CepCache.objects.filter(cep=cep).first()
+    if registro is None:
+        return None
+    dados = {campo: getattr(registro, campo) for campo in CAMPOS} if registro.encontrado else None
+    return Entrada(dados, registro.consultado_em.timestamp())
+
+
+def _salvar(cep, entrada):
+    memoria.set(cep, entrada)
+    dados = entrada.dados or dict.fromkeys(CAMPOS, '')
+    CepCache.objects.update_or_create(
+        cep=cep,
+        defaults={
+            **dados,
+            'encontrado': entrada.dados is not None,
+            'consultado_em': datetime.fromtimestamp(entrada.consultado_em, tz=dt_timezone.utc),
+        },
+    )
+
+
+def _converter_resposta(data):
+    if data.get('erro'):
+        return None
+    return {
+        'logradouro': data.get('logradouro', ''),
+        'bairro': data.get('bairro', ''),
+        'cidade': data.get('localidade', ''),
+        'estado': data.get('uf', ''),
+    }
+
+
+def _consultar_upstream(cep):
+    if not _vagas_upstream.acquire(timeout=_config('CEP_UPSTREAM_ESPERA')):
+        raise FalhaUpstream('Limite de conexões com o ViaCEP atingido')
+    try:
+        if not circuito.permitir():
+            estatisticas.incrementar('circuito_aberto')
+            raise FalhaUpstream('Circuito aberto')
+        try:
+            with metricas.medir_upstream('viacep'):
+                response = _sessao.get(
+                    f"{_config('CEP_UPSTREAM_URL').rstrip('/')}/{cep}/json/",
+                    timeout=_config('CEP_UPSTREAM_TIMEOUT'),
+                )
+            if response.status_code != 200:
+                raise FalhaUpstream(f'ViaCEP respondeu {response.status_code}')
+            dados = _converter_resposta(response.json())
+        except FalhaUpstream:
+            circuito.registrar_falha()
+            raise
+        except (requests.RequestException, ValueError) as e:
+            circuito.registrar_falha()
+            raise FalhaUpstream(str(e)) from e
+    finally:
+        _vagas_upstream.release()
+    circuito.registrar_sucesso()
+    return dados
+
+
+def _resultado_da_falha(entrada):
+    estatisticas.incrementar('erros_upstream')
+    if entrada is not None:
+        # Melhor um endereço antigo do que nenhum
+        estatisticas.incrementar('stale')
+        return entrada.dados
+    estatisticas.incrementar('misses')
+    return None
+
+
+def consultar_cep(cep):
+    """
+    Retorna um dict com logradouro, bairro, cidade e estado, ou None se o CEP
+    não existir (ou não puder ser resolvido).
+    """
+    agora = time.time()
+    entrada = memoria.get(cep)
+    if entrada is not None and entrada.valida(agora):
+        estatisticas.incrementar('hits_memoria')
+        return entrada.dados
+
+    if entrada is None:
+        entrada = _carregar_do_banco(cep)
+        if entrada is not None:
+            memoria.set(cep, entrada)
+            if entrada.valida(agora):
+                estatisticas.incrementar('hits_banco')
+                return entrada.dados
+
+    try:
+        dados = _consultar_upstream(cep)
+    except FalhaUpstream:
+        return _resultado_da_falha(entrada)
+
+    estatisticas.incrementar('misses')
+    _salvar(cep, Entrada(dados, agora))
+    return dados
+
+
+# ========== VERSÃO ASSÍNCRONA ==========
+# Consultas em andamento por event loop: {loop: {cep: Task}}
+_em_andamento = weakref.WeakKeyDictionary()
+
+
+async def _aresolver(cep, entrada):
+    agora = time.time()
+    if entrada is None:
+        entrada = await sync_to_async(_carregar_do_banco)(cep)
+        if entrada is not None:
+            memoria.set(cep, entrada)
+            if entrada.valida(agora):
+                estatisticas.incrementar('hits_banco')
+                return entrada.dados
+
+    try:
+        # Roda fora da thread do event loop; o pool de conexões é o mesmo da versão
+        # síncrona. O contexto vai junto para as métricas da requisição.
+        contexto = contextvars.copy_context()
+        dados = await asyncio.get_running_loop().run_in_executor(
+            _executor_upstream, contexto.run, _consultar_upstream, cep,
+        )
+    except FalhaUpstream:
+        return _resultado_da_falha(entrada)
+
+    estatisticas.incrementar('misses')
+    await sync_to_async(_salvar)(cep, Entrada(dados, agora))
+    return dados
+
+
+async def aconsultar_cep(cep):
+    """
+    Versão assíncrona de consultar_cep. Requisições simultâneas para o mesmo
+    CEP aguardam uma única consulta.
+    """
+    entrada = memoria.get(cep)
+    if entrada is not None and entrada.valida(time.time()):
+        estatisticas.incrementar('hits_memoria')
+        return entrada.dados
+
+    tarefas = _em_andamento.setdefault(asyncio.get_running_loop(), {})
+    tarefa = tarefas.get(cep)
+    if tarefa is None:
+        tarefa = asyncio.ensure_future(_aresolver(cep, entrada))
+        tarefas[cep] = tarefa
+        tarefa.add_done_callback(lambda _: tarefas.pop(cep, None))
+    else:
+        estatisticas.incrementar('deduplicadas')
+    # shield: se um cliente desconectar, a consulta continua para os demais
+    return await asyncio.shield(tarefa)
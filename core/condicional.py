@@ -0,0 +1,78 @@
+"""
+GET condicional (ETag / Last-Modified) para o dashboard e as listas.
+
+O ETag combina as versões das tabelas exibidas (contadores.estado(), que
+mudam a cada inserção, alteração ou exclusão) com tudo o que muda a página
+para o mesmo navegador: view, filtros e cursor da querystring, usuário e
+cookie CSRF. A versão dos usuários entra sempre: o menu mostra o nome de quem
+está logado e as listas, o de quem atendeu. Quando o navegador manda o mesmo ETag, o decorator condition()
+do Django responde 304 antes de a view rodar: nem a consulta da lista nem o
+template são executados.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from . import contadores
+
+
+def _cacheavel(request):
+    # Mensagens pendentes (ex.: "Cliente cadastrado com sucesso!") aparecem uma
+    # vez só; a página com elas não pode ser reaproveitada. len() não as consome.
+    return not len(messages.get_messages(request))
+
+
+def _estado(request, modelos):
+    # ETag e Last-Modified usam os mesmos valores: uma consulta por requisição
+    if not hasattr(request, '_estado_condicional'):
+        request._estado_condicional = contadores.estado(*modelos)
+    return request._estado_condicional
+
+
+def _etag(request, modelos, extra=''):
+    if not _cacheavel(request):
+        return None
+    partes = [
+        request.resolver_match.view_name,
+        request.GET.urlencode(),
+        str(request.user.pk),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        extra,
+        *(str(versao) for versao, _ in _estado(request, modelos)),
+    ]
+    return hashlib.md5('|'.join(partes).encode()).hexdigest()
+
+
+def _ultima_alteracao(request, modelos):
+    if not _cacheavel(request):
+        return None
+    horario = max(horario for _, horario in _estado(request, modelos))
+    if not horario:
+        return None
+    return datetime.fromtimestamp(horario / 1000, tz=dt_timezone.utc)
+
+
+def condicional(*modelos, extra=None):
+    """
+    Decorator de views que listam `modelos` ('cliente', 'atendimento').
+    `extra(request)` acrescenta ao ETag algo que muda a página sem alterar o
+    banco (ex.: a passagem do tempo no dashboard).
+    """
+    modelos = (*modelos, 'usuario')
+    def etag(request, *args, **kwargs):
+        return _etag(request, modelos, extra(request) if extra else '')
+
+    def ultima_alteracao(request, *args, **kwargs):
+        # Com um `extra` o conteúdo muda sem alteração no banco: só o ETag vale
+        return None if extra else _ultima_alteracao(request, modelos)
+
+    return condition(etag_func=etag, last_modified_func=ultima_alteracao)
+
+
+def minuto_atual(request):
+    """Os "próximos atendimentos" do dashboard dependem da hora: o ETag vale por um minuto."""
+    return timezone.now().strftime('%Y-%m-%dT%H:%M')
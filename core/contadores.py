@@ -0,0 +1,203 @@
+"""
+Contadores do dashboard.
+
+Os totais de clientes, de atendimentos (e dos arquivados, ver core.arquivo) e
+de atendimentos por dia ficam na
+tabela Contador e são atualizados incrementalmente pelos sinais (core.signals).
+O dashboard lê os valores do cache ou, no máximo, com uma consulta por
+chave primária. reconciliar() recalcula tudo a partir das tabelas e deve rodar
+periodicamente (manage.py reconciliar_contadores) para corrigir desvios, por
+exemplo de alterações feitas direto no banco.
+
+Cada contador é dividido em CONTADORES_FATIAS linhas ("atendimentos",
+"atendimentos#1", "atendimentos#2", ...): cada gravação soma em uma delas,
+sorteada, e a leitura soma todas. Assim gravações simultâneas raramente
+esperam pelo lock da mesma linha (no PostgreSQL; no SQLite as gravações já
+são uma de cada vez).
+"""
+import random
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Atendimento, AtendimentoArquivado, Cliente, Contador
+
+CLIENTES = 'clientes'
+ATENDIMENTOS = 'atendimentos'
+ARQUIVADOS = 'atendimentos_arquivados'
+PREFIXO_DIA = 'atendimentos_dia:'
+# Versão de cada tabela, usada nos ETags (core.condicional). Também é dividida
+# em fatias: cada alteração grava em uma delas o horário em milissegundos, e
+# sempre soma ao menos 1. A versão é a soma das fatias; o maior valor é o
+# horário da última alteração.
+VERSOES = {
+    'cliente': 'versao:cliente',
+    'atendimento': 'versao:atendimento',
+    'usuario': 'versao:usuario',
+}
+
+
+def fatias(chave):
+    """Chaves das linhas de `chave`; a primeira é a própria chave."""
+    return [chave, *(f'{chave}#{numero}' for numero in range(1, settings.CONTADORES_FATIAS))]
+
+
+def _fatia(chave):
+    return random.choice(fatias(chave))
+
+
+def somar(chaves):
+    """{chave: soma das fatias} das `chaves` que têm alguma linha, em uma consulta."""
+    por_fatia = {fatia: chave for chave in chaves for fatia in fatias(chave)}
+    somas = {}
+    for fatia, valor in Contador.objects.filter(pk__in=list(por_fatia)).values_list('chave', 'valor'):
+        chave = por_fatia[fatia]
+        somas[chave] = somas.get(chave, 0) + valor
+    return somas
+
+
+def chave_dia(dia):
+    return f'{PREFIXO_DIA}{dia.isoformat()}'
+
+
+def dia_local(data_hora):
+    return timezone.localdate(data_hora)
+
+
+def _chave_cache(dia):
+    return f'contadores:dashboard:{dia.isoformat()}'
+
+
+def _intervalo_do_dia(dia):
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def invalidar_cache():
+    # Só depois do commit: antes disso outra requisição poderia ler os valores
+    # antigos do banco e colocá-los de volta no cache
+    transaction.on_commit(lambda: cache.delete(_chave_cache(timezone.localdate())))
+
+
+def incrementar(chave, delta=1):
+    fatia = _fatia(chave)
+    if not Contador.objects.filter(pk=fatia).update(valor=F('valor') + delta):
+        _, criado = Contador.objects.get_or_create(pk=fatia, defaults={'valor': delta})
+        if not criado:
+            Contador.objects.filter(pk=fatia).update(valor=F('valor') + delta)
+    invalidar_cache()
+
+
+def nova_versao(*modelos):
+    """Marca `modelos` ('cliente', 'atendimento', 'usuario') como alterados; cobre também exclusões."""
+    agora = int(timezone.now().timestamp() * 1000)
+    for modelo in modelos:
+        fatia = _fatia(VERSOES[modelo])
+        if not Contador.objects.filter(pk=fatia).update(valor=Greatest(F('valor') + 1, agora)):
+            Contador.objects.get_or_create(pk=fatia, defaults={'valor': agora})
+
+
+def estado(*modelos):
+    """
+    [(versão, horário da última alteração em ms)] de `modelos`, lidos direto do
+    banco em uma consulta: um valor em cache de outro processo poderia gerar
+    um 304 errado.
+    """
+    chaves = [VERSOES[modelo] for modelo in modelos]
+    por_fatia = {fatia: chave for chave in chaves for fatia in fatias(chave)}
+    lidos = {chave: (0, 0) for chave in chaves}
+    for fatia, valor in Contador.objects.filter(pk__in=list(por_fatia)).values_list('chave', 'valor'):
+        soma, maximo = lidos[por_fatia[fatia]]
+        lidos[por_fatia[fatia]] = (soma + valor, max(maximo, valor))
+    return [lidos[chave] for chave in chaves]
+
+
+def versoes(*modelos):
+    """Versões atuais de `modelos`; mudam a cada alteração."""
+    return [versao for versao, _ in estado(*modelos)]
+
+
+def contar_agora(dia=None):
+    """
+    Os números do dashboard calculados direto das tabelas, em uma consulta.
+    Cada subconsulta usa um índice: a contagem do dia é um intervalo em data_hora.
+    Clientes excluídos à espera da remoção (core.exclusao) e os seus
+    atendimentos não entram.
+    """
+    inicio, fim = _intervalo_do_dia(dia or timezone.localdate())
+    cliente = connection.ops.quote_name(Cliente._meta.db_table)
+    atendimento = connection.ops.quote_name(Atendimento._meta.db_table)
+    arquivado = connection.ops.quote_name(AtendimentoArquivado._meta.db_table)
+    visivel = f'cliente_id NOT IN (SELECT id FROM {cliente} WHERE excluido_em IS NOT NULL)'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT (SELECT COUNT(*) FROM {cliente} WHERE excluido_em IS NULL), '
+            f'(SELECT COUNT(*) FROM {atendimento} WHERE {visivel}), '
+            f'(SELECT COUNT(*) FROM {atendimento} WHERE data_hora >= %s AND data_hora < %s AND {visivel}), '
+            f'(SELECT COUNT(*) FROM {arquivado} WHERE {visivel})',
+            [connection.ops.adapt_datetimefield_value(inicio), connection.ops.adapt_datetimefield_value(fim)],
+        )
+        clientes, atendimentos, hoje, arquivados = cursor.fetchone()
+    return {
+        'clientes_count': clientes,
+        'atendimentos_count': atendimentos,
+        'atendimentos_hoje': hoje,
+        'arquivados_count': arquivados,
+    }
+
+
+def reconciliar():
+    """Recalcula os contadores. Dias passados são descartados; só hoje em diante importa."""
+    hoje = timezone.localdate()
+    inicio, _ = _intervalo_do_dia(hoje)
+    with transaction.atomic():
+        totais = contar_agora(hoje)
+        por_dia = (
+            Atendimento.objects.filter(data_hora__gte=inicio)
+            .annotate(dia=TruncDate('data_hora'))
+            .values('dia')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        Contador.objects.filter(pk__startswith=PREFIXO_DIA).delete()
+        Contador.objects.bulk_create(
+            [Contador(chave=chave_dia(linha['dia']), valor=linha['n']) for linha in por_dia]
+        )
+        for chave, valor in (
+            (CLIENTES, totais['clientes_count']),
+            (ATENDIMENTOS, totais['atendimentos_count']),
+            (ARQUIVADOS, totais['arquivados_count']),
+        ):
+            # O total vai para a primeira fatia; as demais voltam a zero
+            Contador.objects.filter(pk__in=fatias(chave)[1:]).delete()
+            Contador.objects.update_or_create(pk=chave, defaults={'valor': valor})
+        invalidar_cache()
+    return totais
+
+
+def dashboard():
+    hoje = timezone.localdate()
+    valores = cache.get(_chave_cache(hoje))
+    if valores is not None:
+        return valores
+
+    chave_hoje = chave_dia(hoje)
+    lidos = somar([CLIENTES, ATENDIMENTOS, ARQUIVADOS, chave_hoje])
+    if CLIENTES not in lidos or ATENDIMENTOS not in lidos:
+        # Primeira execução (ou tabela de contadores apagada)
+        valores = reconciliar()
+    else:
+        valores = {
+            'clientes_count': lidos[CLIENTES],
+            'atendimentos_count': lidos[ATENDIMENTOS],
+            'atendimentos_hoje': lidos.get(chave_hoje, 0),
+            'arquivados_count': lidos.get(ARQUIVADOS, 0),
+        }
+    cache.set(_chave_cache(hoje), valores, getattr(settings, 'CONTADORES_CACHE_TIMEOUT', 30))
+    return valores
@@ -0,0 +1,229 @@
+"""
+Cadastros duplicados de clientes.
+
+CPF e e-mail são únicos, mas a mesma pessoa aparece como "Jose da Silva" e
+"José Silva" com e-mails diferentes. Comparar todos os pares é inviável, então
+os candidatos saem de chaves de bloco, cada uma lida em ordem de um índice:
+
+- nome: o nome normalizado (Cliente.nome_chave); cada cliente é comparado com
+  os DUPLICADOS_JANELA anteriores na ordem do índice (vizinhança ordenada);
+- telefone: mesmos dígitos de telefone;
+- endereço: mesmo CEP e número.
+
+Nos blocos de telefone e endereço só se comparam clientes da mesma chave, e
+também no máximo com os DUPLICADOS_JANELA anteriores, para que um bloco
+enorme (um telefone de empresa, um prédio) não vire uma comparação de todos
+com todos. A memória fica limitada à janela e a um lote de pares (no
+endereço, também aos clientes de um mesmo CEP, reordenados pelo número
+normalizado).
+
+Cada candidato recebe uma pontuação: a similaridade de trigramas dos nomes
+(como a do pg_trgm) mais pesos para telefone igual, mesmo endereço e e-mail
+parecido. Os pares acima de DUPLICADOS_PONTUACAO_MINIMA vão para ParDuplicado,
+o relatório do admin, onde podem ser mesclados ou descartados. Nomes quase
+iguais (similaridade de ao menos DUPLICADOS_SIMILARIDADE_NOME) bastam para o
+par entrar no relatório, com a pontuação que tiver: "Jose da Silva" e "José
+Silva" com e-mails diferentes não têm mais nada em comum.
+"""
+import re
+from collections import deque
+from itertools import chain, groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import contadores
+from .models import Atendimento, AtendimentoArquivado, Cliente, ParDuplicado
+
+PESO_NOME = 0.5
+PESO_TELEFONE = 0.25
+PESO_ENDERECO = 0.25
+PESO_EMAIL = 0.2
+# Similaridade a partir da qual nome e e-mail entram nos motivos do par
+SIMILARIDADE_MOTIVO = 0.5
+
+CAMPOS = ('id', 'nome_chave', 'telefone_digitos', 'cep_digitos', 'numero', 'email')
+
+
+def _endereco(cep_digitos, numero):
+    numero = re.sub(r'[^0-9A-Z]', '', numero.upper())
+    return (cep_digitos, numero) if cep_digitos and numero not in ('', 'SN') else None
+
+
+def _por_endereco(linhas):
+    """
+    Linhas em ordem de CEP e número normalizado: "10A" e "10 A" ficam juntos.
+    O índice só ordena pelo CEP; cada CEP é reordenado em memória.
+    """
+    for _, mesmo_cep in groupby(linhas, key=lambda linha: linha[3]):
+        yield from sorted(mesmo_cep, key=lambda linha: (_endereco(linha[3], linha[4]) or (), linha[0]))
+
+
+# Chaves de bloco: ordem de leitura (coberta por um índice), o valor da chave
+# em uma linha de CAMPOS e, se preciso, a função que completa a ordem pelo
+# mesmo valor. Com valor, só se comparam clientes que o tenham igual. Sem
+# valor (nome), cada cliente é comparado com os anteriores.
+CHAVES = {
+    'nome': (('nome_chave', 'id'), None, None),
+    'telefone': (('telefone_digitos', 'id'), lambda linha: linha[2], None),
+    'endereco': (('cep_digitos', 'id'), lambda linha: _endereco(linha[3], linha[4]), _por_endereco),
+}
+
+
+def trigramas(texto):
+    """Trigramas de cada palavra com dois espaços antes e um depois, como no pg_trgm."""
+    resultado = set()
+    for palavra in texto.split():
+        palavra = f'  {palavra} '
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return frozenset(resultado)
+
+
+def similaridade(a, b):
+    """Trigramas em comum sobre o total (0 a 1)."""
+    if not a or not b:
+        return 0.0
+    comuns = len(a & b)
+    return comuns / (len(a) + len(b) - comuns)
+
+
+class Registro:
+    __slots__ = ('id', 'nome', 'telefone', 'endereco', '_email')
+
+    def __init__(self, id, nome_chave, telefone_digitos, cep_digitos, numero, email):
+        self.id = id
+        self.nome = trigramas(nome_chave)
+        self.telefone = telefone_digitos
+        self.endereco = _endereco(cep_digitos, numero)
+        self._email = email
+
+    @property
+    def email(self):
+        # Trigramas da parte local do e-mail, calculados só se o par chegar a precisar
+        if isinstance(self._email, str):
+            self._email = trigramas(re.sub(r'[^a-z0-9]', '', self._email.split('@')[0].lower()))
+        return self._email
+
+
+def pontuar(a, b, minimo=0.0, nome_suficiente=None):
+    """
+    (pontuação de 0 a 1, motivos) de dois Registros, ou None se o par não
+    chega a `minimo` e a similaridade dos nomes é menor que `nome_suficiente`.
+    """
+    nome = similaridade(a.nome, b.nome)
+    telefone = bool(a.telefone) and a.telefone == b.telefone
+    endereco = a.endereco is not None and a.endereco == b.endereco
+    pontuacao = PESO_NOME * nome + PESO_TELEFONE * telefone + PESO_ENDERECO * endereco
+    nome_basta = nome_suficiente is not None and nome >= nome_suficiente
+    # Nem com o e-mail igual chegaria ao mínimo: não calcula os trigramas do e-mail
+    if pontuacao + PESO_EMAIL < minimo and not nome_basta:
+        return None
+    email = similaridade(a.email, b.email)
+    pontuacao = min(pontuacao + PESO_EMAIL * email, 1.0)
+    if pontuacao < minimo and not nome_basta:
+        return None
+    motivos = [
+        motivo for motivo, presente in (
+            ('nome', nome >= SIMILARIDADE_MOTIVO),
+            ('telefone', telefone),
+            ('endereço', endereco),
+            ('e-mail', email >= SIMILARIDADE_MOTIVO),
+        ) if presente
+    ]
+    return pontuacao, ', '.join(motivos)
+
+
+def _blocos(linhas, valor):
+    """Grupos de linhas consecutivas com o mesmo `valor`, só os de dois ou mais clientes."""
+    for chave_bloco, bloco in groupby(linhas, key=valor):
+        if not chave_bloco:
+            continue
+        primeiro = next(bloco)
+        segundo = next(bloco, None)
+        if segundo is not None:
+            yield chain((primeiro, segundo), bloco)
+
+
+def candidatos(chave, janela=None):
+    """
+    Gerador de pares (Registro, Registro) da chave de bloco `chave`, lendo os
+    clientes em ordem do índice; guarda só os `janela` últimos em memória.
+    """
+    janela = janela or settings.DUPLICADOS_JANELA
+    ordem, valor, reordenar = CHAVES[chave]
+    clientes = Cliente.objects.order_by(*ordem).values_list(*CAMPOS).iterator(chunk_size=2000)
+    if reordenar:
+        clientes = reordenar(clientes)
+    # Blocos de um cliente só (a maioria) nem viram Registro
+    blocos = [clientes] if valor is None else _blocos(clientes, valor)
+    for bloco in blocos:
+        anteriores = deque(maxlen=janela)
+        for linha in bloco:
+            registro = Registro(*linha)
+            if not registro.nome:
+                continue
+            for anterior in anteriores:
+                yield anterior, registro
+            anteriores.append(registro)
+
+
+def _gravar(pares):
+    ParDuplicado.objects.bulk_create(
+        pares, update_conflicts=True, unique_fields=['cliente', 'duplicado'],
+        update_fields=['pontuacao', 'motivos', 'encontrado_em'],
+    )
+
+
+def encontrar(janela=None, minimo=None, tamanho=None):
+    """
+    Refaz o relatório de duplicados. Gerador: a cada chave de bloco produz
+    (chave, comparações, pares gravados). Os pares que não voltarem a aparecer
+    saem do relatório no fim; os descartados no admin continuam descartados.
+    """
+    minimo = settings.DUPLICADOS_PONTUACAO_MINIMA if minimo is None else minimo
+    nome_suficiente = settings.DUPLICADOS_SIMILARIDADE_NOME
+    tamanho = tamanho or settings.DUPLICADOS_LOTE
+    inicio = timezone.now()
+    for chave in CHAVES:
+        comparacoes = gravados = 0
+        lote = []
+        for a, b in candidatos(chave, janela):
+            comparacoes += 1
+            resultado = pontuar(a, b, minimo, nome_suficiente)
+            if resultado is None:
+                continue
+            pontuacao, motivos = resultado
+            cliente, duplicado = sorted((a.id, b.id))
+            lote.append(ParDuplicado(
+                cliente_id=cliente, duplicado_id=duplicado, pontuacao=round(pontuacao, 3),
+                motivos=motivos, encontrado_em=inicio,
+            ))
+            if len(lote) >= tamanho:
+                _gravar(lote)
+                gravados += len(lote)
+                lote = []
+        if lote:
+            _gravar(lote)
+            gravados += len(lote)
+        yield chave, comparacoes, gravados
+    ParDuplicado.objects.filter(descartado=False, encontrado_em__lt=inicio).delete()
+
+
+def mesclar(destino, origem):
+    """
+    Junta o cadastro `origem` ao de `destino`: os atendimentos (e os
+    arquivados) passam para `destino` com um UPDATE por tabela e `origem` é
+    excluído. Os dados de `destino` não mudam. Retorna quantos atendimentos
+    mudaram de cliente.
+    """
+    if destino.pk == origem.pk:
+        raise ValueError('Não é possível mesclar um cliente com ele mesmo.')
+    with transaction.atomic():
+        movidos = Atendimento.todos.filter(cliente_id=origem.pk).update(cliente_id=destino.pk, updated_at=timezone.now())
+        movidos += AtendimentoArquivado.todos.filter(cliente_id=origem.pk).update(cliente_id=destino.pk)
+        if movidos:
+            contadores.nova_versao('atendimento')
+        # Sem atendimentos, a exclusão só leva os pares de duplicados de `origem`
+        origem.delete()
+    return movidos
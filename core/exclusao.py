@@ -0,0 +1,127 @@
+"""
+Exclusão de clientes.
+
+cliente.delete() passa pelo collector do Django: carrega todos os atendimentos
+do cliente e dispara os sinais de cada um, tudo em uma transação que segura a
+escrita do banco. Aqui a exclusão é feita em duas etapas:
+
+1. ocultar(): marca excluido_em. Os managers padrão de Cliente, Atendimento e
+   AtendimentoArquivado deixam de enxergar o cliente e os seus atendimentos.
+   Os horários futuros são liberados e os contadores já descontam tudo. Só os
+   atendimentos de hoje em diante são lidos; o histórico entra apenas em
+   contagens feitas no índice.
+2. purgar(): apaga os atendimentos e o cliente com DELETEs por lotes de ids,
+   cada lote em uma transação curta. Clientes com até
+   EXCLUSAO_LIMITE_IMEDIATO atendimentos são purgados na hora; os demais
+   ficam para manage.py purgar_clientes (via cron).
+"""
+from collections import Counter
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import contadores
+from .models import Atendimento, AtendimentoArquivado, Cliente, ParDuplicado
+
+
+def _apagar(modelo, ids):
+    qn = connection.ops.quote_name
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(modelo._meta.db_table)} WHERE id IN ({marcadores})', ids)
+        return cursor.rowcount
+
+
+def _esquecer_duplicados(cliente_id):
+    # Pares do relatório de duplicados (core.duplicados); o DELETE direto do
+    # cliente não passa pela cascata do Django
+    ParDuplicado.objects.filter(Q(cliente_id=cliente_id) | Q(duplicado_id=cliente_id)).delete()
+
+
+def ocultar(cliente):
+    """
+    Esconde `cliente` e os seus atendimentos. Retorna quantos atendimentos
+    (da tabela principal e do arquivo) ficam para purgar(), ou None se o
+    cliente já estava excluído.
+    """
+    agora = timezone.now()
+    inicio_hoje = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    with transaction.atomic():
+        if not Cliente.objects.filter(pk=cliente.pk).update(excluido_em=agora, updated_at=agora):
+            return None
+        cliente.excluido_em = agora
+        _esquecer_duplicados(cliente.pk)
+        atendimentos = Atendimento.todos.filter(cliente_id=cliente.pk).order_by()
+        # Só de hoje em diante (índice cliente, data_hora): é o que os contadores
+        # por dia e a agenda usam; horários passados não podem mais ser agendados
+        futuros = atendimentos.filter(data_hora__gte=inicio_hoje)
+        por_dia = Counter()
+        com_slot = False
+        for data_hora, slot in futuros.values_list('data_hora', 'slot'):
+            por_dia[contadores.dia_local(data_hora)] += 1
+            com_slot = com_slot or slot is not None
+        if com_slot:
+            futuros.filter(slot__isnull=False).update(slot=None, updated_at=agora)
+        for dia, n in por_dia.items():
+            contadores.incrementar(contadores.chave_dia(dia), -n)
+        # Contagens só no índice de cliente_id
+        total = atendimentos.count()
+        arquivados = AtendimentoArquivado.todos.filter(cliente_id=cliente.pk).count()
+        contadores.incrementar(contadores.CLIENTES, -1)
+        if total:
+            contadores.incrementar(contadores.ATENDIMENTOS, -total)
+        if arquivados:
+            contadores.incrementar(contadores.ARQUIVADOS, -arquivados)
+        contadores.nova_versao('cliente', 'atendimento')
+    return total + arquivados
+
+
+def purgar(cliente_id, tamanho=None):
+    """
+    Remove de vez um cliente já oculto: atendimentos e arquivados em lotes de
+    `tamanho` (padrão: EXCLUSAO_LOTE), depois o próprio cliente. Pode ser
+    interrompido e repetido. Retorna quantos atendimentos foram apagados.
+    """
+    tamanho = tamanho or settings.EXCLUSAO_LOTE
+    if not Cliente.todos.filter(pk=cliente_id, excluido_em__isnull=False).exists():
+        return 0
+    apagados = 0
+    for modelo in (Atendimento, AtendimentoArquivado):
+        while True:
+            with transaction.atomic():
+                ids = list(modelo.todos.filter(cliente_id=cliente_id).order_by().values_list('id', flat=True)[:tamanho])
+                if not ids:
+                    break
+                apagados += _apagar(modelo, ids)
+    with transaction.atomic():
+        _esquecer_duplicados(cliente_id)
+        _apagar(Cliente, [cliente_id])
+    return apagados
+
+
+def excluir_cliente(cliente):
+    """
+    Exclusão pela interface: oculta o cliente e, se ele tiver poucos
+    atendimentos, já os remove. Retorna True se a remoção ficou para
+    purgar_pendentes().
+    """
+    pendentes = ocultar(cliente)
+    if pendentes is None:
+        # Excluído por outra requisição, que cuida da remoção
+        return False
+    if pendentes > settings.EXCLUSAO_LIMITE_IMEDIATO:
+        return True
+    purgar(cliente.pk)
+    return False
+
+
+def purgar_pendentes(tamanho=None, max_clientes=None):
+    """Purga os clientes ocultos, dos mais antigos aos mais novos; produz (cliente_id, apagados)."""
+    pendentes = Cliente.todos.filter(excluido_em__isnull=False).order_by('excluido_em').values_list('pk', flat=True)
+    if max_clientes is not None:
+        pendentes = pendentes[:max_clientes]
+    for cliente_id in list(pendentes):
+        yield cliente_id, purgar(cliente_id, tamanho)
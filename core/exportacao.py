@@ -0,0 +1,153 @@
+"""
+Exportação de clientes e atendimentos em CSV ou JSONL.
+
+As linhas são lidas com values_list().iterator(chunk_size=...) e geradas aos
+poucos, então a memória usada não depende do tamanho da exportação. O
+cabeçalho do CSV sai antes da consulta ao banco, e cada bloco gerado pode ser
+comprimido com gzip sem montar o arquivo inteiro.
+"""
+import csv
+import heapq
+import json
+import zlib
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from . import busca
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# (nome da coluna, campo para values_list)
+COLUNAS = {
+    'clientes': [
+        ('id', 'id'),
+        ('nome', 'nome'),
+        ('email', 'email'),
+        ('telefone', 'telefone'),
+        ('cpf', 'cpf'),
+        ('cep', 'cep'),
+        ('logradouro', 'logradouro'),
+        ('numero', 'numero'),
+        ('complemento', 'complemento'),
+        ('bairro', 'bairro'),
+        ('cidade', 'cidade'),
+        ('estado', 'estado'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ],
+    'atendimentos': [
+        ('id', 'id'),
+        ('data_hora', 'data_hora'),
+        ('status', 'status'),
+        ('descricao', 'descricao'),
+        ('cliente_id', 'cliente_id'),
+        ('cliente_nome', 'cliente__nome'),
+        ('cliente_cpf', 'cliente__cpf'),
+        ('cliente_email', 'cliente__email'),
+        ('usuario_id', 'usuario_id'),
+        ('usuario', 'usuario__username'),
+        ('usuario_nome', 'usuario__first_name'),
+        ('usuario_sobrenome', 'usuario__last_name'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ],
+}
+
+CHUNK_SIZE = 2000
+# Tamanho aproximado (em bytes) de cada bloco entregue ao StreamingHttpResponse
+TAMANHO_BLOCO = 64 * 1024
+
+
+def queryset_exportacao(modelo, parametros, arquivados=False):
+    """values_list() com os mesmos filtros da lista correspondente, em ordem de id."""
+    if modelo == 'clientes':
+        queryset = busca.clientes_da_lista(parametros)
+    else:
+        queryset = busca.atendimentos_da_lista(parametros, arquivados)
+    campos = [campo for _, campo in COLUNAS[modelo]]
+    return queryset.order_by('id').values_list(*campos)
+
+
+def linhas_exportacao(modelo, parametros, chunk_size=CHUNK_SIZE):
+    """
+    Linhas exportadas, em ordem de id. Com ?historico=1 os atendimentos
+    arquivados entram intercalados (as duas consultas são lidas em paralelo).
+    """
+    linhas = queryset_exportacao(modelo, parametros).iterator(chunk_size=chunk_size)
+    if modelo == 'clientes' or not busca.com_historico(parametros):
+        return linhas
+    arquivadas = queryset_exportacao(modelo, parametros, arquivados=True).iterator(chunk_size=chunk_size)
+    return heapq.merge(linhas, arquivadas, key=lambda linha: linha[0])
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    return valor
+
+
+class _Eco:
+    # csv.writer escreve aqui; writerow() devolve a linha formatada
+    def write(self, texto):
+        return texto
+
+
+def _linhas_csv(nomes, linhas):
+    writer = csv.writer(_Eco())
+    yield writer.writerow(nomes)
+    for linha in linhas:
+        yield writer.writerow([_valor(valor) for valor in linha])
+
+
+def _linhas_jsonl(nomes, linhas):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for linha in linhas:
+        yield encoder.encode(dict(zip(nomes, map(_valor, linha)))) + '\n'
+
+
+def _em_blocos(textos):
+    """Agrupa as linhas em blocos de ~TAMANHO_BLOCO bytes; o primeiro sai na hora."""
+    bloco, tamanho = [], 0
+    primeiro = True
+    for texto in textos:
+        dados = texto.encode('utf-8')
+        bloco.append(dados)
+        tamanho += len(dados)
+        if primeiro or tamanho >= TAMANHO_BLOCO:
+            yield b''.join(bloco)
+            bloco, tamanho = [], 0
+            primeiro = False
+    if bloco:
+        yield b''.join(bloco)
+
+
+def _gzip(blocos):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for bloco in blocos:
+        # Z_SYNC_FLUSH: o que já foi gerado sai agora, sem esperar o fim do arquivo
+        dados = compressor.compress(bloco) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def exportar(modelo, parametros, formato='csv', gzip=False, chunk_size=CHUNK_SIZE):
+    """
+    Gerador de blocos de bytes com a exportação de `modelo` ('clientes' ou
+    'atendimentos') filtrada por `parametros` (search, status, historico).
+    """
+    nomes = [nome for nome, _ in COLUNAS[modelo]]
+    linhas = linhas_exportacao(modelo, parametros, chunk_size)
+    textos = _linhas_csv(nomes, linhas) if formato == 'csv' else _linhas_jsonl(nomes, linhas)
+    blocos = _em_blocos(textos)
+    return _gzip(blocos) if gzip else blocos
+
+
+def nome_arquivo(modelo, formato, gzip=False):
+    data = timezone.localdate().strftime('%Y%m%d')
+    return f'{modelo}-{data}.{formato}' + ('.gz' if gzip else '')
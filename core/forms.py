@@ -3,6 +3,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from .models import Cliente, Atendimento
 import re
 
@@ -67,7 +68,9 @@ class ClienteForm(forms.ModelForm):
                 #'pattern': '[0-9]{5}[0-9]{3}',
                 #'data-mask': '00000-000',
                 'required': True,
-                'maxlength': '9'
+                'maxlength': '9',
+                'list': 'ceps-sugeridos',
+                'autocomplete': 'off'
             }),
             'logradouro': forms.TextInput(attrs={
                 'class': 'form-control', 
@@ -108,6 +111,15 @@ class ClienteForm(forms.ModelForm):
             ]),
         }
     
+    MENSAGEM_CPF_DUPLICADO = 'Este CPF já está cadastrado.'
+    MENSAGEM_EMAIL_DUPLICADO = 'Este email já está cadastrado.'
+    
+    def __init__(self, *args, verificar_unicidade=True, **kwargs):
+        # verificar_unicidade=False deixa as consultas de CPF/email duplicado para
+        # quem valida vários clientes de uma vez (ver core.importacao)
+        self.verificar_unicidade = verificar_unicidade
+        super().__init__(*args, **kwargs)
+    
     def clean_telefone(self):
         telefone = self.cleaned_data.get('telefone')
         if telefone:
@@ -149,32 +161,45 @@ class ClienteForm(forms.ModelForm):
                 raise ValidationError('CPF inválido.')
             
             # Algoritmo de validação do CPF
-            #if not self.validar_cpf(cpf_numbers):
-            #    raise ValidationError('CPF inválido.')
-            
-            # Verifica se o CPF já existe (exceto para o próprio registro)
-            existing_cpf = Cliente.objects.filter(cpf=cpf)
-            if self.instance and self.instance.pk:
-                existing_cpf = existing_cpf.exclude(pk=self.instance.pk)
+            if not self.validar_cpf(cpf_numbers):
+                raise ValidationError('CPF inválido.')
             
-            if existing_cpf.exists():
-                raise ValidationError('Este CPF já está cadastrado.')
+            # Verifica se o CPF já existe (exceto para o próprio registro).
+            # A busca é pelos dígitos: "12345678900" e "123.456.789-00" são o mesmo CPF
+            if self.verificar_unicidade:
+                existing_cpf = Cliente.todos.filter(cpf_digitos=cpf_numbers)
+                if self.instance and self.instance.pk:
+                    existing_cpf = existing_cpf.exclude(pk=self.instance.pk)
+                
+                if existing_cpf.exists():
+                    raise ValidationError(self.MENSAGEM_CPF_DUPLICADO)
         
         return cpf
     
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if email:
-            # Verifica se o email já existe (exceto para o próprio registro)
-            existing_email = Cliente.objects.filter(email=email)
+        if email and self.verificar_unicidade:
+            # Verifica se o email já existe (exceto para o próprio registro).
+            # Cliente.todos: um cliente excluído ainda ocupa o email até ser removido
+            existing_email = Cliente.todos.filter(email=email)
             if self.instance and self.instance.pk:
                 existing_email = existing_email.exclude(pk=self.instance.pk)
             
             if existing_email.exists():
-                raise ValidationError('Este email já está cadastrado.')
+                raise ValidationError(self.MENSAGEM_EMAIL_DUPLICADO)
         
         return email
     
+    def validate_unique(self):
+        # CPF e email já foram verificados em clean_cpf/clean_email; não repete as consultas
+        if not self.verificar_unicidade:
+            return
+        exclude = self._get_validation_exclusions() | {'cpf', 'email'}
+        try:
+            self.instance.validate_unique(exclude=exclude)
+        except ValidationError as e:
+            self._update_errors(e)
+    
     def clean_estado(self):
         estado = self.cleaned_data.get('estado')
         if not estado:
@@ -211,12 +236,31 @@ class ClienteForm(forms.ModelForm):
         
         return True
 
+class ClienteAutocompleteWidget(forms.HiddenInput):
+    """
+    Guarda o id do cliente em um campo oculto e mostra uma caixa de texto com
+    sugestões vindas de /api/clientes/ (ver atendimento_form.html). Só o
+    cliente selecionado é consultado para montar o formulário.
+    """
+    template_name = 'core/widgets/cliente_autocomplete.html'
+    
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        rotulo = ''
+        if value not in (None, ''):
+            cliente = Cliente.objects.filter(pk=value).values('nome', 'cpf').first() if str(value).isdigit() else None
+            if cliente:
+                rotulo = f"{cliente['nome']} ({cliente['cpf']})"
+        context['widget']['rotulo'] = rotulo
+        context['widget']['url'] = reverse('sugerir_clientes')
+        return context
+
 class AtendimentoForm(forms.ModelForm):
     class Meta:
         model = Atendimento
         fields = ['cliente', 'data_hora', 'descricao', 'status']
         widgets = {
-            'cliente': forms.Select(attrs={'class': 'form-control', 'required': True}),
+            'cliente': ClienteAutocompleteWidget(),
             'data_hora': forms.DateTimeInput(attrs={
                 'class': 'form-control', 
                 'type': 'datetime-local',
@@ -231,10 +275,16 @@ class AtendimentoForm(forms.ModelForm):
             'status': forms.Select(attrs={'class': 'form-control', 'required': True}),
         }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, verificar_conflito=True, **kwargs):
+        # verificar_conflito=False deixa a consulta de horário ocupado para quem
+        # valida vários atendimentos de uma vez (ver core.importacao)
+        self.verificar_conflito = verificar_conflito
         super().__init__(*args, **kwargs)
-        self.fields['cliente'].queryset = Cliente.objects.all().order_by('nome')
-        self.fields['cliente'].empty_label = "Selecione um cliente..."
+        # Sem ordenação nem choices: a validação busca só o pk enviado
+        self.fields['cliente'].queryset = Cliente.objects.all()
+        self.fields['cliente'].error_messages['invalid_choice'] = 'Selecione um cliente da lista.'
+    
+    MENSAGEM_CONFLITO = 'Já existe um atendimento agendado para este horário.'
     
     def clean_data_hora(self):
         data_hora = self.cleaned_data.get('data_hora')
@@ -242,4 +292,17 @@ class AtendimentoForm(forms.ModelForm):
             from django.utils import timezone
             if data_hora < timezone.now():
                 raise ValidationError('A data e hora não podem ser no passado.')
-        return data_hora
\ No newline at end of file
+        return data_hora
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        # Verificação antecipada do conflito de horário (busca exata no índice de slot).
+        # A garantia de verdade é a restrição única do banco; ver salvar_atendimento().
+        slot = Atendimento.calcular_slot(cleaned_data.get('data_hora'), cleaned_data.get('status'))
+        if slot is not None and self.verificar_conflito:
+            conflito = Atendimento.objects.filter(slot=slot)
+            if self.instance and self.instance.pk:
+                conflito = conflito.exclude(pk=self.instance.pk)
+            if conflito.exists():
+                self.add_error('data_hora', ValidationError(self.MENSAGEM_CONFLITO, code='conflito'))
+        return cleaned_data
\ No newline at end of file
@@ -0,0 +1,337 @@
+"""
+Validação e gravação de clientes e atendimentos em lote.
+
+Cada linha passa pelo ClienteForm ou AtendimentoForm (mesmas regras do
+cadastro, inclusive validar_cpf), mas as verificações que consultam o banco
+(CPF/email duplicado, cliente existente, horário ocupado) são feitas uma vez
+por lote, com uma única consulta, em vez de uma ou duas por linha.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import contadores
+from .forms import AtendimentoForm, ClienteForm
+from .models import Atendimento, Cliente
+
+# Linhas por comando SQL no bulk_create/bulk_update
+TAMANHO_LOTE_SQL = 500
+
+# Campos gravados pelo bulk_update (todos, menos id e as datas de criação e alteração)
+CAMPOS_CLIENTE = [
+    campo.name for campo in Cliente._meta.concrete_fields if not campo.primary_key and campo.name not in ('created_at', 'updated_at')
+]
+CAMPOS_ATENDIMENTO = [
+    campo.name for campo in Atendimento._meta.concrete_fields if not campo.primary_key and campo.name not in ('created_at', 'updated_at')
+]
+
+
+def erros_como_texto(erros):
+    partes = []
+    for campo, mensagens in erros.items():
+        texto = ' '.join(mensagem['message'] for mensagem in mensagens)
+        partes.append(texto if campo == '__all__' else f'{campo}: {texto}')
+    return '; '.join(partes)
+
+
+class ValidadorClientes:
+    """
+    Valida lotes de clientes. Guarda os CPFs e emails já aceitos para recusar
+    também duplicatas dentro do próprio arquivo (ou entre lotes).
+    """
+
+    def __init__(self):
+        self.cpfs_aceitos = set()
+        self.emails_aceitos = set()
+        # Um único form reaproveitado para todas as linhas: criar um ClienteForm
+        # faz deepcopy de todos os campos e widgets, o que custava mais do que a
+        # própria validação.
+        self._form = ClienteForm({}, verificar_unicidade=False)
+
+    def _validar(self, dados, instancia=None):
+        form = self._form
+        form.data = dados
+        form.instance = instancia if instancia is not None else Cliente()
+        form._errors = None
+        return form
+
+    def validar_lote(self, linhas, instancias=None):
+        """
+        `linhas` é uma lista de (identificador, dados). Retorna (validos, rejeitados):
+        validos é uma lista de (identificador, Cliente não salvo) e rejeitados uma
+        lista de (identificador, erros), com erros no formato de
+        form.errors.get_json_data().
+
+        Para alterações, `instancias` mapeia o identificador ao Cliente existente,
+        que recebe os dados validados; os CPFs e emails atuais desses clientes
+        não contam como duplicados.
+        """
+        instancias = instancias or {}
+        candidatos = []
+        rejeitados = []
+        for identificador, dados in linhas:
+            form = self._validar(dados, instancias.get(identificador))
+            if not form.is_valid():
+                rejeitados.append((identificador, form.errors.get_json_data()))
+                continue
+            cliente = form.instance
+            cliente.atualizar_derivados()
+            candidatos.append((identificador, cliente))
+
+        if not candidatos:
+            return [], rejeitados
+
+        cpfs = {cliente.cpf_digitos for _, cliente in candidatos}
+        emails = {cliente.email for _, cliente in candidatos}
+        existentes = (
+            Cliente.todos.filter(Q(cpf_digitos__in=cpfs) | Q(email__in=emails))
+            .exclude(pk__in=[cliente.pk for cliente in instancias.values()])
+            .values_list('cpf_digitos', 'email')
+        )
+        cpfs_existentes = set(self.cpfs_aceitos)
+        emails_existentes = set(self.emails_aceitos)
+        for cpf, email in existentes:
+            cpfs_existentes.add(cpf)
+            emails_existentes.add(email)
+
+        validos = []
+        for identificador, cliente in candidatos:
+            erros = {}
+            if cliente.cpf_digitos in cpfs_existentes:
+                erros['cpf'] = [{'message': ClienteForm.MENSAGEM_CPF_DUPLICADO, 'code': 'duplicado'}]
+            if cliente.email in emails_existentes:
+                erros['email'] = [{'message': ClienteForm.MENSAGEM_EMAIL_DUPLICADO, 'code': 'duplicado'}]
+            if erros:
+                rejeitados.append((identificador, erros))
+                continue
+            cpfs_existentes.add(cliente.cpf_digitos)
+            emails_existentes.add(cliente.email)
+            self.cpfs_aceitos.add(cliente.cpf_digitos)
+            self.emails_aceitos.add(cliente.email)
+            validos.append((identificador, cliente))
+        return validos, rejeitados
+
+
+def horarios_ocupados(slots, excluir=()):
+    """Quais dos `slots` já estão ocupados por atendimentos ativos (fora os ids em `excluir`)."""
+    slots = {slot for slot in slots if slot is not None}
+    if not slots:
+        return set()
+    return set(Atendimento.objects.filter(slot__in=slots).exclude(pk__in=excluir).values_list('slot', flat=True))
+
+
+class ValidadorAtendimentos:
+    """
+    Valida lotes de atendimentos. A existência dos clientes e os horários
+    ocupados (slot, como em AtendimentoForm.clean()) são verificados com uma
+    consulta cada para o lote inteiro.
+    """
+
+    def __init__(self, usuario=None):
+        # Usuário que atende os atendimentos novos
+        self.usuario = usuario
+        self._form = AtendimentoForm({}, verificar_conflito=False)
+        # O ModelChoiceField buscaria o cliente de cada linha; sem ele no form,
+        # a existência é conferida em validar_lote() para todas de uma vez
+        self._campo_cliente = self._form.fields.pop('cliente')
+
+    def _validar(self, dados, instancia=None):
+        form = self._form
+        form.data = dados
+        form.instance = instancia if instancia is not None else Atendimento(usuario=self.usuario)
+        form._errors = None
+        return form
+
+    def _erro_cliente(self, codigo):
+        return {'message': self._campo_cliente.error_messages[codigo], 'code': codigo}
+
+    def _cliente_id(self, valor):
+        """Retorna (id, erro) para o valor de 'cliente' enviado."""
+        if valor in self._campo_cliente.empty_values:
+            return None, self._erro_cliente('required')
+        try:
+            return int(valor), None
+        except (TypeError, ValueError):
+            return None, self._erro_cliente('invalid_choice')
+
+    def validar_lote(self, linhas, instancias=None):
+        """
+        Mesmo formato de ValidadorClientes.validar_lote(). Os atendimentos válidos
+        já vêm com cliente_id e slot preenchidos.
+        """
+        instancias = instancias or {}
+        candidatos = []
+        rejeitados = []
+        for identificador, dados in linhas:
+            cliente_id, erro_cliente = self._cliente_id(dados.get('cliente'))
+            form = self._validar(dados, instancias.get(identificador))
+            erros = {} if form.is_valid() else form.errors.get_json_data()
+            if erro_cliente:
+                erros['cliente'] = [erro_cliente]
+            if erros:
+                rejeitados.append((identificador, erros))
+                continue
+            atendimento = form.instance
+            atendimento.cliente_id = cliente_id
+            atendimento.slot = Atendimento.calcular_slot(atendimento.data_hora, atendimento.status)
+            candidatos.append((identificador, atendimento))
+
+        if not candidatos:
+            return [], rejeitados
+
+        clientes = set(
+            Cliente.objects.filter(pk__in={atendimento.cliente_id for _, atendimento in candidatos})
+            .values_list('pk', flat=True)
+        )
+        ocupados = horarios_ocupados(
+            {atendimento.slot for _, atendimento in candidatos},
+            excluir=[atendimento.pk for atendimento in instancias.values()],
+        )
+
+        validos = []
+        for identificador, atendimento in candidatos:
+            erros = {}
+            if atendimento.cliente_id not in clientes:
+                erros['cliente'] = [self._erro_cliente('invalid_choice')]
+            if atendimento.slot is not None and atendimento.slot in ocupados:
+                erros['data_hora'] = [{'message': AtendimentoForm.MENSAGEM_CONFLITO, 'code': 'conflito'}]
+            if erros:
+                rejeitados.append((identificador, erros))
+                continue
+            if atendimento.slot is not None:
+                ocupados.add(atendimento.slot)
+            validos.append((identificador, atendimento))
+        return validos, rejeitados
+
+
+def inserir_clientes(clientes):
+    """
+    Insere os clientes com bulk_create em uma transação e atualiza os contadores.
+    Levanta IntegrityError (sem gravar nenhum) se algum CPF/email já existir.
+    """
+    with transaction.atomic():
+        Cliente.objects.bulk_create(clientes)
+        contadores.incrementar(contadores.CLIENTES, len(clientes))
+        contadores.nova_versao('cliente')
+
+
+def gravar_clientes(validos):
+    """
+    Insere os clientes com inserir_clientes(). Se outra requisição cadastrou o
+    mesmo CPF/email nesse meio tempo, o lote é refeito linha a linha para
+    separar só os conflitantes. Retorna (gravados, rejeitados).
+    """
+    if not validos:
+        return [], []
+    try:
+        inserir_clientes([cliente for _, cliente in validos])
+        return validos, []
+    except IntegrityError:
+        pass
+
+    gravados, rejeitados = [], []
+    for identificador, cliente in validos:
+        try:
+            with transaction.atomic():
+                cliente.pk = None
+                cliente.save()
+            gravados.append((identificador, cliente))
+        except IntegrityError:
+            rejeitados.append((identificador, {
+                '__all__': [{'message': 'CPF ou email já cadastrado.', 'code': 'duplicado'}],
+            }))
+    return gravados, rejeitados
+
+
+def _marcar_alterados(modelo, objetos):
+    # Um UPDATE só para updated_at (igual para todos) sai mais barato do que
+    # mais uma coluna no CASE WHEN por linha do bulk_update
+    agora = timezone.now()
+    for obj in objetos:
+        obj.updated_at = agora
+    modelo.objects.filter(pk__in=[obj.pk for obj in objetos]).update(updated_at=agora)
+
+
+def atualizar_clientes(clientes, campos=None):
+    """Grava clientes alterados com um bulk_update em uma transação (só `campos`, se informado)."""
+    if campos:
+        # As versões só com dígitos e o nome normalizado acompanham o campo original
+        derivados = Cliente.CAMPOS_DERIVADOS
+        campos = [*campos, *(derivados[campo] for campo in campos if campo in derivados)]
+    else:
+        campos = CAMPOS_CLIENTE
+    with transaction.atomic():
+        Cliente.objects.bulk_update(clientes, campos, batch_size=TAMANHO_LOTE_SQL)
+        _marcar_alterados(Cliente, clientes)
+        contadores.nova_versao('cliente')
+
+
+def _contar_por_dia(por_dia):
+    for dia, delta in por_dia.items():
+        if delta:
+            contadores.incrementar(contadores.chave_dia(dia), delta)
+
+
+def inserir_atendimentos(atendimentos):
+    """
+    Insere os atendimentos com bulk_create em uma transação e atualiza os
+    contadores. Levanta IntegrityError (sem gravar nenhum) se algum horário
+    foi ocupado depois da validação.
+    """
+    with transaction.atomic():
+        Atendimento.objects.bulk_create(atendimentos, batch_size=TAMANHO_LOTE_SQL)
+        contadores.incrementar(contadores.ATENDIMENTOS, len(atendimentos))
+        por_dia = Counter(contadores.dia_local(atendimento.data_hora) for atendimento in atendimentos)
+        _contar_por_dia(por_dia)
+        contadores.nova_versao('atendimento')
+
+
+def atualizar_atendimentos(atendimentos, campos=None):
+    """
+    Grava atendimentos alterados com um bulk_update em uma transação (só
+    `campos`, se informado). Os sinais não rodam no bulk_update: os contadores
+    por dia são ajustados aqui quando a data muda.
+    """
+    por_dia = Counter()
+    for atendimento in atendimentos:
+        original = atendimento.valor_original('data_hora')
+        dia = contadores.dia_local(atendimento.data_hora)
+        if original is not None and contadores.dia_local(original) != dia:
+            por_dia[contadores.dia_local(original)] -= 1
+            por_dia[dia] += 1
+    if not campos:
+        campos = CAMPOS_ATENDIMENTO
+    elif 'data_hora' in campos or 'status' in campos:
+        campos = [*campos, 'slot']
+    with transaction.atomic():
+        if 'slot' in campos:
+            # Libera os horários antes de gravar os novos: trocas de horário
+            # dentro do lote não esbarram na restrição única no meio do UPDATE
+            Atendimento.objects.filter(pk__in=[atendimento.pk for atendimento in atendimentos]).update(slot=None)
+        Atendimento.objects.bulk_update(atendimentos, campos, batch_size=TAMANHO_LOTE_SQL)
+        _marcar_alterados(Atendimento, atendimentos)
+        _contar_por_dia(por_dia)
+        contadores.nova_versao('atendimento')
+    for atendimento in atendimentos:
+        atendimento._originais = {campo: atendimento.__dict__.get(campo) for campo in Atendimento.CAMPOS_RASTREADOS}
+
+
+def gravar_status(atendimentos, status):
+    """
+    Troca o status de `atendimentos` (com o slot já calculado) com UPDATEs por
+    conjunto: o mesmo status para todos e o slot igual à própria data_hora
+    quando ela não tem segundos, o caso comum. Só os demais passam pelo
+    bulk_update.
+    """
+    ids = [atendimento.pk for atendimento in atendimentos]
+    with transaction.atomic():
+        Atendimento.objects.filter(pk__in=ids).update(status=status, slot=None)
+        if status in Atendimento.STATUS_ATIVOS:
+            exatos = [atendimento.pk for atendimento in atendimentos if atendimento.slot == atendimento.data_hora]
+            Atendimento.objects.filter(pk__in=exatos).update(slot=F('data_hora'))
+            outros = [atendimento for atendimento in atendimentos if atendimento.slot != atendimento.data_hora]
+            Atendimento.objects.bulk_update(outros, ['slot'], batch_size=TAMANHO_LOTE_SQL)
+        _marcar_alterados(Atendimento, atendimentos)
+        contadores.nova_versao('atendimento')
@@ -0,0 +1,265 @@
+"""
+Lembretes de atendimentos e marcação de atrasados (manage.py processar_agendados).
+
+O worker roda em três etapas, todas em lotes pelo índice (status, data_hora) e
+em transações curtas, sem carregar tudo de uma vez:
+
+1. marcar_atrasados(): agendados cujo horário passou há mais de
+   ATRASO_TOLERANCIA minutos passam para 'atrasado', com um UPDATE por lote
+   (o horário na agenda é liberado, como em qualquer status inativo).
+2. enfileirar(): cria um Lembrete para cada agendado das próximas
+   LEMBRETES_ANTECEDENCIA horas. A restrição única (atendimento, data_hora)
+   deixa a etapa idempotente; remarcar o atendimento gera um lembrete novo.
+3. enviar(): entrega os lembretes pendentes, em ordem de id, pelo backend de
+   LEMBRETES_BACKEND. O lembrete só é marcado como enviado depois da entrega:
+   uma interrupção no meio de um lote pode repetir mensagens desse lote, mas
+   nenhuma se perde.
+
+Qualquer etapa pode ser interrompida e executada de novo, porque recomeça do
+que ainda está pendente no banco. Rode uma instância do worker por vez.
+"""
+import json
+import sys
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import contadores
+from .models import Atendimento, Lembrete
+
+Mensagem = namedtuple('Mensagem', 'lembrete_id destinatario assunto texto')
+
+ASSUNTO = 'Lembrete do seu atendimento'
+
+
+class BackendBase:
+    """
+    Entrega as mensagens uma a uma com enviar_uma(). Backends que mandam tudo
+    de uma vez sobrescrevem enviar().
+    """
+
+    def enviar(self, mensagens):
+        """Entrega `mensagens`; retorna {lembrete_id: erro} das que falharam."""
+        falhas = {}
+        for mensagem in mensagens:
+            try:
+                self.enviar_uma(mensagem)
+            except Exception as e:
+                falhas[mensagem.lembrete_id] = str(e) or e.__class__.__name__
+        return falhas
+
+    def enviar_uma(self, mensagem):
+        raise NotImplementedError
+
+
+class ConsoleBackend(BackendBase):
+    """Escreve as mensagens na saída padrão (desenvolvimento)."""
+
+    def __init__(self, saida=None):
+        self.saida = saida or sys.stdout
+
+    def enviar_uma(self, mensagem):
+        self.saida.write(f'Para: {mensagem.destinatario}\nAssunto: {mensagem.assunto}\n\n{mensagem.texto}\n\n')
+
+
+class ArquivoBackend(BackendBase):
+    """Acrescenta as mensagens, uma por linha em JSON, ao arquivo LEMBRETES_ARQUIVO."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or settings.LEMBRETES_ARQUIVO
+
+    def enviar(self, mensagens):
+        # Um lote inteiro por escrita: ou vai tudo, ou o lote volta como falha
+        try:
+            with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+                arquivo.writelines(json.dumps(m._asdict(), ensure_ascii=False) + '\n' for m in mensagens)
+        except OSError as e:
+            return {m.lembrete_id: str(e) for m in mensagens}
+        return {}
+
+
+class EmailBackend(BackendBase):
+    """E-mail pela configuração de e-mail do Django, em uma conexão por lote."""
+
+    def enviar(self, mensagens):
+        falhas = {}
+        with mail.get_connection() as conexao:
+            for mensagem in mensagens:
+                email = mail.EmailMessage(mensagem.assunto, mensagem.texto, to=[mensagem.destinatario], connection=conexao)
+                try:
+                    email.send()
+                except Exception as e:
+                    falhas[mensagem.lembrete_id] = str(e) or e.__class__.__name__
+        return falhas
+
+
+def obter_backend():
+    return import_string(settings.LEMBRETES_BACKEND)()
+
+
+def atrasados(agora=None):
+    limite = (agora or timezone.now()) - timedelta(minutes=settings.ATRASO_TOLERANCIA)
+    return Atendimento.objects.filter(status='agendado', data_hora__lt=limite)
+
+
+def marcar_atrasados_lote(agora=None, tamanho=None):
+    """Marca como atrasados até `tamanho` agendados vencidos, os mais antigos primeiro. Retorna quantos."""
+    tamanho = tamanho or settings.LEMBRETES_LOTE
+    with transaction.atomic():
+        # Os marcados saem do filtro: cada lote recomeça do início do índice
+        linhas = list(atrasados(agora).order_by('data_hora').values_list('id', 'data_hora')[:tamanho])
+        if not linhas:
+            return 0
+        marcados = Atendimento.todos.filter(pk__in=[pk for pk, _ in linhas], status='agendado').update(
+            status='atrasado', slot=None, updated_at=timezone.now(),
+        )
+        contadores.nova_versao('atendimento')
+    return marcados
+
+
+def marcar_atrasados(agora=None, tamanho=None, max_lotes=None):
+    """Gerador: marca os atrasados em lotes e produz o total a cada lote."""
+    agora = agora or timezone.now()
+    total = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        marcados = marcar_atrasados_lote(agora, tamanho)
+        if not marcados:
+            break
+        total += marcados
+        lotes += 1
+        yield total
+
+
+def a_lembrar(inicio, fim):
+    return Atendimento.objects.filter(status='agendado', data_hora__gte=inicio, data_hora__lt=fim)
+
+
+def enfileirar(agora=None, tamanho=None):
+    """
+    Gerador: cria os lembretes dos agendados das próximas LEMBRETES_ANTECEDENCIA
+    horas e produz o total de lembretes novos a cada lote. Percorre o índice por
+    cursor (data_hora, id), então cada lote lê só as suas linhas.
+    """
+    agora = agora or timezone.now()
+    tamanho = tamanho or settings.LEMBRETES_LOTE
+    fim = agora + timedelta(hours=settings.LEMBRETES_ANTECEDENCIA)
+    inicio, ultimo_id = agora, None
+    total = 0
+    while True:
+        lote = a_lembrar(inicio, fim)
+        if ultimo_id is not None:
+            lote = lote.filter(Q(data_hora__gt=inicio) | Q(id__gt=ultimo_id))
+        linhas = list(lote.order_by('data_hora', 'id').values_list('id', 'data_hora')[:tamanho])
+        if not linhas:
+            break
+        ultimo_id, inicio = linhas[-1]
+        existentes = set(
+            Lembrete.objects.filter(atendimento_id__in=[pk for pk, _ in linhas]).values_list('atendimento_id', 'data_hora')
+        )
+        novos = [
+            Lembrete(atendimento_id=pk, data_hora=data_hora)
+            for pk, data_hora in linhas if (pk, data_hora) not in existentes
+        ]
+        if novos:
+            # ignore_conflicts: outra execução pode ter criado o mesmo lembrete agora
+            Lembrete.objects.bulk_create(novos, ignore_conflicts=True)
+        total += len(novos)
+        yield total
+
+
+def _mensagem(lembrete, atendimento):
+    data_hora = timezone.localtime(atendimento.data_hora)
+    texto = (
+        f'Olá, {atendimento.cliente.nome}!\n'
+        f'Lembramos que o seu atendimento está marcado para {data_hora:%d/%m/%Y} às {data_hora:%H:%M}.'
+    )
+    return Mensagem(lembrete.pk, atendimento.cliente.email, ASSUNTO, texto)
+
+
+def enviar_lote(backend, depois_de=0, tamanho=None):
+    """
+    Entrega até `tamanho` lembretes pendentes com id maior que `depois_de`.
+    Retorna (último id, enviados, descartados, falhas), ou None se não havia
+    nenhum. Lembretes de atendimentos que deixaram de estar agendados para
+    aquele horário são descartados; os que falham voltam para a fila até
+    LEMBRETES_MAX_TENTATIVAS.
+    """
+    tamanho = tamanho or settings.LEMBRETES_LOTE
+    lembretes = list(
+        Lembrete.objects.filter(situacao='pendente', id__gt=depois_de).order_by('id')
+        .only('id', 'atendimento_id', 'data_hora', 'tentativas')[:tamanho]
+    )
+    if not lembretes:
+        return None
+    atendimentos = (
+        Atendimento.objects.select_related('cliente')
+        .only('data_hora', 'status', 'cliente__nome', 'cliente__email')
+        .in_bulk([lembrete.atendimento_id for lembrete in lembretes])
+    )
+    agora = timezone.now()
+    mensagens, descartados = [], []
+    for lembrete in lembretes:
+        atendimento = atendimentos.get(lembrete.atendimento_id)
+        if (atendimento is None or atendimento.status != 'agendado'
+                or atendimento.data_hora != lembrete.data_hora or atendimento.data_hora <= agora):
+            descartados.append(lembrete.pk)
+        else:
+            mensagens.append(_mensagem(lembrete, atendimento))
+    falhas = backend.enviar(mensagens) if mensagens else {}
+    enviados = [mensagem.lembrete_id for mensagem in mensagens if mensagem.lembrete_id not in falhas]
+
+    agora = timezone.now()
+    with transaction.atomic():
+        Lembrete.objects.filter(pk__in=enviados).update(
+            situacao='enviado', tentativas=F('tentativas') + 1, erro='', processado_em=agora,
+        )
+        Lembrete.objects.filter(pk__in=descartados).update(situacao='descartado', processado_em=agora)
+        tentativas = {lembrete.pk: lembrete.tentativas + 1 for lembrete in lembretes}
+        for pk, erro in falhas.items():
+            esgotado = tentativas[pk] >= settings.LEMBRETES_MAX_TENTATIVAS
+            Lembrete.objects.filter(pk=pk).update(
+                tentativas=tentativas[pk],
+                erro=erro[:200],
+                situacao='falhou' if esgotado else 'pendente',
+                processado_em=agora if esgotado else None,
+            )
+    return lembretes[-1].pk, len(enviados), len(descartados), len(falhas)
+
+
+def enviar(backend=None, tamanho=None):
+    """
+    Gerador: entrega todos os lembretes pendentes e produz os totais
+    (enviados, descartados, falhas) a cada lote. Os que falham ficam para a
+    próxima execução.
+    """
+    backend = backend or obter_backend()
+    ultimo = 0
+    enviados = descartados = falhas = 0
+    while True:
+        resultado = enviar_lote(backend, ultimo, tamanho)
+        if resultado is None:
+            break
+        ultimo, lote_enviados, lote_descartados, lote_falhas = resultado
+        enviados += lote_enviados
+        descartados += lote_descartados
+        falhas += lote_falhas
+        yield enviados, descartados, falhas
+
+
+def limpar(dias=None, tamanho=None):
+    """Apaga em lotes os lembretes processados há mais de `dias` dias (padrão: LEMBRETES_RETENCAO_DIAS). Retorna quantos."""
+    dias = settings.LEMBRETES_RETENCAO_DIAS if dias is None else dias
+    tamanho = tamanho or settings.LEMBRETES_LOTE
+    corte = timezone.now() - timedelta(days=dias)
+    total = 0
+    while True:
+        ids = list(Lembrete.objects.filter(processado_em__lt=corte).order_by().values_list('id', flat=True)[:tamanho])
+        if not ids:
+            return total
+        total += Lembrete.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import arquivo
+
+
+class Command(BaseCommand):
+    help = (
+        'Move os atendimentos concluídos ou cancelados antigos para o arquivo, em lotes '
+        '(rodar periodicamente, ex.: via cron; pode ser interrompido e retomado)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.ARQUIVO_DIAS,
+                            help='Arquiva o que terminou antes de hoje menos esse número de dias')
+        parser.add_argument('--lote', type=int, default=settings.ARQUIVO_LOTE, help='Atendimentos movidos por transação')
+        parser.add_argument('--max-lotes', type=int, default=None, help='Para depois desse número de lotes')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0 or options['lote'] < 1:
+            raise CommandError('--dias não pode ser negativo e --lote deve ser positivo.')
+        corte = arquivo.data_de_corte(options['dias'])
+        self.stdout.write(f'Arquivando atendimentos encerrados antes de {corte:%d/%m/%Y}...')
+        inicio = time.monotonic()
+        total = 0
+        for total in arquivo.arquivar(corte, options['lote'], options['max_lotes']):
+            duracao = time.monotonic() - inicio
+            self.stdout.write(f'{total} atendimentos arquivados ({total / duracao if duracao else total:.0f}/s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} atendimentos arquivados em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,99 @@
+import statistics
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from core.models import Atendimento, Cliente
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a vazão de escrita com vários workers simultâneos no banco configurado '
+        '(DB_PERFIL). Cria clientes e atendimentos temporários e os remove no fim.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--operacoes', type=int, default=100, help='Transações por worker')
+
+    def handle(self, *args, **options):
+        workers, operacoes = options['workers'], options['operacoes']
+        marca = uuid.uuid4().hex[:8]
+        usuario, _ = User.objects.get_or_create(username='benchmark_escrita')
+        inicio_slots = timezone.now().replace(second=0, microsecond=0) + timedelta(days=3650)
+
+        latencias, erros = [], []
+        lock = threading.Lock()
+        barreira = threading.Barrier(workers)
+
+        def worker(numero):
+            barreira.wait()
+            proprias, falhas = [], []
+            try:
+                for i in range(operacoes):
+                    sequencia = numero * operacoes + i
+                    inicio = time.perf_counter()
+                    try:
+                        # Uma transação típica do sistema: cadastro de cliente + atendimento
+                        with transaction.atomic():
+                            cliente = Cliente.objects.create(
+                                nome=f'Benchmark {marca} {sequencia}',
+                                email=f'bench-{marca}-{sequencia}@exemplo.com',
+                                telefone='(11) 90000-0000',
+                                cpf=f'99{sequencia:09d}',
+                                cep='01001-000', logradouro='Praça da Sé', numero='1',
+                                bairro='Sé', cidade='São Paulo', estado='SP',
+                            )
+                            Atendimento.objects.create(
+                                cliente=cliente, usuario=usuario, descricao='benchmark',
+                                data_hora=inicio_slots + timedelta(minutes=sequencia),
+                            )
+                    except OperationalError as e:
+                        falhas.append(str(e))
+                    else:
+                        proprias.append(time.perf_counter() - inicio)
+            finally:
+                connections.close_all()
+                with lock:
+                    latencias.extend(proprias)
+                    erros.extend(falhas)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+
+        # Remove os dados criados (os atendimentos vão junto pelo CASCADE)
+        Cliente.objects.filter(email__startswith=f'bench-{marca}-').delete()
+
+        self.stdout.write(f'Perfil: {self._perfil()}')
+        self.stdout.write(f'Workers: {workers}, transações: {workers * operacoes}, duração: {duracao:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Vazão: {len(latencias) / duracao:.0f} transações/s'))
+        if latencias:
+            latencias.sort()
+            self.stdout.write(
+                f'Latência: p50 {statistics.median(latencias) * 1000:.1f}ms, '
+                f'p95 {latencias[int(len(latencias) * 0.95) - 1] * 1000:.1f}ms, '
+                f'máx {latencias[-1] * 1000:.1f}ms'
+            )
+        if erros:
+            self.stdout.write(self.style.ERROR(f'{len(erros)} transações falharam, ex.: {erros[0]}'))
+
+    def _perfil(self):
+        if connection.vendor != 'sqlite':
+            return f'{connection.vendor} (CONN_MAX_AGE={connection.settings_dict["CONN_MAX_AGE"]})'
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+        return f'sqlite (journal_mode={journal}, synchronous={synchronous})'
@@ -0,0 +1,179 @@
+import json
+import statistics
+import subprocess
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import Atendimento, Cliente
+from core.paginacao import KeysetPaginator
+
+# Cliente usado no cenário de POST (a transação é desfeita no fim)
+CLIENTE_POST = {
+    'nome': 'Benchmark Views', 'email': 'benchmark.views@exemplo.com.br', 'telefone': '(11) 98765-4321',
+    'cpf': '529.982.247-25', 'cep': '01310-100', 'logradouro': 'Avenida Paulista', 'numero': '1000',
+    'complemento': '', 'bairro': 'Bela Vista', 'cidade': 'São Paulo', 'estado': 'SP',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede tempo, número de consultas e tempo de SQL de cada view do core no banco '
+        'configurado (use seed_crm para gerar volume) e grava o resultado em JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções medidas por cenário (após uma de aquecimento)')
+        parser.add_argument('--sem-cache', action='store_true', help='Limpa o cache antes de cada execução')
+        parser.add_argument('--saida', help='Arquivo JSON de saída (padrão: benchmark-<commit>.json)')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para comparar')
+
+    def handle(self, *args, **options):
+        usuario, _ = User.objects.get_or_create(username='benchmark_views')
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(usuario)
+
+        resultados = {}
+        for nome, metodo, url, dados in self._cenarios():
+            resultados[nome] = self._medir(metodo, url, dados, options['repeticoes'], options['sem_cache'])
+            r = resultados[nome]
+            self.stdout.write(
+                f'{nome:32} {r["tempo_ms"]:9.1f}ms  {r["consultas"]:3d} consultas  {r["tempo_sql_ms"]:9.1f}ms SQL'
+                f'  {r["tempo_template_ms"]:7.1f}ms template'
+            )
+
+        commit = self._commit()
+        relatorio = {
+            'commit': commit,
+            'data': timezone.now().isoformat(),
+            'banco': connections['default'].vendor,
+            'clientes': Cliente.objects.count(),
+            'atendimentos': Atendimento.objects.count(),
+            'repeticoes': options['repeticoes'],
+            'sem_cache': options['sem_cache'],
+            'resultados': resultados,
+        }
+        saida = options['saida'] or f'benchmark-{commit or "local"}.json'
+        with open(saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Resultados gravados em {saida}'))
+
+        if options['comparar']:
+            self._comparar(options['comparar'], relatorio)
+
+    def _cenarios(self):
+        cenarios = [
+            ('dashboard', 'get', '/', None),
+            ('cliente_list', 'get', '/clientes/', None),
+            ('cliente_list_busca_nome', 'get', '/clientes/?search=silva', None),
+            ('cliente_list_busca_cpf', 'get', '/clientes/?search=123.45', None),
+            ('cliente_list_pagina_profunda', 'get', self._pagina_profunda('/clientes/', Cliente.objects.all(), ('nome', 'id')), None),
+            ('atendimento_list', 'get', '/atendimentos/', None),
+            ('atendimento_list_busca', 'get', '/atendimentos/?search=revisao', None),
+            ('atendimento_list_status', 'get', '/atendimentos/?status=agendado', None),
+            ('atendimento_list_historico', 'get', '/atendimentos/?historico=1', None),
+            ('atendimento_list_busca_historico', 'get', '/atendimentos/?historico=1&search=revisao', None),
+            ('atendimento_list_pagina_profunda', 'get', self._pagina_profunda('/atendimentos/', Atendimento.objects.all(), ('data_hora', 'id')), None),
+            ('cliente_create_form', 'get', '/clientes/novo/', None),
+            ('cliente_create_post', 'post', '/clientes/novo/', CLIENTE_POST),
+            ('atendimento_create_form', 'get', '/atendimentos/novo/', None),
+            ('agenda_dia', 'get', '/agenda/?modo=dia', None),
+            ('horarios_livres_30_dias', 'get', self._horarios_livres(30), None),
+        ]
+        cliente = Cliente.objects.order_by('id').values_list('id', flat=True).first()
+        if cliente is not None:
+            # Um minuto bem no futuro, livre com quase certeza
+            data_hora = timezone.localtime() + timedelta(days=3000, minutes=7)
+            cenarios.append(('atendimento_create_post', 'post', '/atendimentos/novo/', {
+                'cliente': cliente, 'data_hora': data_hora.strftime('%Y-%m-%dT%H:%M'),
+                'descricao': 'Benchmark', 'status': 'agendado',
+            }))
+        return cenarios
+
+    def _horarios_livres(self, dias):
+        hoje = timezone.localdate()
+        return f'/api/v1/agenda/livres/?inicio={hoje.isoformat()}&fim={(hoje + timedelta(days=dias - 1)).isoformat()}'
+
+    def _pagina_profunda(self, url, queryset, ordenacao):
+        # Cursor apontando para o meio da lista (equivalente à página N/2 com OFFSET)
+        total = queryset.count()
+        if total < 2:
+            return url
+        paginator = KeysetPaginator(queryset, ordenacao, 1)
+        meio = queryset.order_by(*ordenacao)[total // 2]
+        return f'{url}?cursor={paginator.codificar_cursor(paginator._valores(meio), "p")}'
+
+    def _medir(self, metodo, url, dados, repeticoes, sem_cache):
+        tempos, tempos_sql, tempos_template = [], [], []
+        consultas = 0
+        for execucao in range(repeticoes + 1):
+            if sem_cache:
+                cache.clear()
+            with ExitStack() as pilha:
+                capturas = [pilha.enter_context(CaptureQueriesContext(conexao)) for conexao in connections.all()]
+                inicio = time.perf_counter()
+                if metodo == 'post':
+                    # POSTs gravam de verdade dentro da transação, que é desfeita no fim
+                    with transaction.atomic():
+                        response = self.client.post(url, dados)
+                        transaction.set_rollback(True)
+                else:
+                    response = self.client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                duracao = time.perf_counter() - inicio
+            if response.status_code >= 400:
+                raise CommandError(f'{url} respondeu {response.status_code}')
+            if execucao == 0:
+                continue  # aquecimento
+            consultas = sum(len(captura) for captura in capturas)
+            tempos.append(duracao * 1000)
+            tempos_sql.append(sum(float(q['time']) for captura in capturas for q in captura.captured_queries) * 1000)
+            # Medido pelo MetricasMiddleware (zero com METRICAS_ATIVAS desligado)
+            medicao = getattr(response.wsgi_request, 'medicao', None)
+            tempos_template.append(medicao.tempo_template * 1000 if medicao else 0)
+        return {
+            'tempo_ms': round(statistics.median(tempos), 2),
+            'tempo_min_ms': round(min(tempos), 2),
+            'tempo_max_ms': round(max(tempos), 2),
+            'consultas': consultas,
+            'tempo_sql_ms': round(statistics.median(tempos_sql), 2),
+            'tempo_template_ms': round(statistics.median(tempos_template), 2),
+        }
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _comparar(self, arquivo, atual):
+        try:
+            with open(arquivo, encoding='utf-8') as entrada:
+                anterior = json.load(entrada)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Não foi possível ler {arquivo}: {e}')
+        self.stdout.write(f'\nComparação com {anterior.get("commit") or arquivo}:')
+        for nome, r in atual['resultados'].items():
+            antes = anterior['resultados'].get(nome)
+            if antes is None:
+                continue
+            variacao = (r['tempo_ms'] - antes['tempo_ms']) / antes['tempo_ms'] * 100 if antes['tempo_ms'] else 0
+            linha = (
+                f'{nome:32} {antes["tempo_ms"]:9.1f} -> {r["tempo_ms"]:9.1f}ms ({variacao:+.0f}%)  '
+                f'consultas {antes["consultas"]} -> {r["consultas"]}'
+            )
+            if 'tempo_template_ms' in antes:
+                linha += f'  template {antes["tempo_template_ms"]:.1f} -> {r["tempo_template_ms"]:.1f}ms'
+            piorou = variacao > 20 or r['consultas'] > antes['consultas']
+            self.stdout.write(self.style.WARNING(linha) if piorou else linha)
@@ -0,0 +1,111 @@
+import csv
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import CepLocal
+
+# Nomes de coluna aceitos para cada campo (comparados em minúsculas)
+COLUNAS = {
+    'cep': ('cep',),
+    'logradouro': ('logradouro', 'endereco', 'endereço', 'rua'),
+    'bairro': ('bairro',),
+    'cidade': ('cidade', 'localidade', 'municipio', 'município'),
+    'estado': ('estado', 'uf'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Carrega uma base nacional de CEPs (CSV, opcionalmente .gz) na tabela CepLocal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo CSV com cabeçalho (cep, logradouro, bairro, cidade, uf)')
+        parser.add_argument('--delimitador', default=None, help='Separador de colunas (padrão: detectado pelo cabeçalho)')
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas por transação')
+        parser.add_argument('--limpar', action='store_true', help='Apaga a base local antes de carregar')
+
+    def handle(self, *args, **options):
+        abrir = gzip.open if options['arquivo'].endswith('.gz') else open
+        try:
+            arquivo = abrir(options['arquivo'], 'rt', encoding=options['encoding'], newline='')
+        except OSError as e:
+            raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+
+        with arquivo:
+            cabecalho = arquivo.readline()
+            delimitador = options['delimitador'] or (';' if cabecalho.count(';') > cabecalho.count(',') else ',')
+            indices = self._mapear_colunas(next(csv.reader([cabecalho], delimiter=delimitador)))
+
+            if options['limpar']:
+                CepLocal.objects.all().delete()
+
+            inicio = time.monotonic()
+            total = ignoradas = 0
+            lote = []
+            # O arquivo é lido linha a linha; só um lote fica em memória por vez
+            for linha in csv.reader(arquivo, delimiter=delimitador):
+                registro = self._converter(linha, indices)
+                if registro is None:
+                    ignoradas += 1
+                    continue
+                lote.append(registro)
+                if len(lote) >= options['lote']:
+                    total += self._gravar(lote)
+                    lote = []
+                    if total % 100000 < options['lote']:
+                        self.stdout.write(f'{total} CEPs carregados...')
+            if lote:
+                total += self._gravar(lote)
+
+        duracao = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} CEPs carregados em {duracao:.1f}s '
+            f'({total / duracao if duracao else total:.0f} linhas/s); {ignoradas} linhas ignoradas.'
+        ))
+
+    def _mapear_colunas(self, cabecalho):
+        nomes = [nome.strip().lower() for nome in cabecalho]
+        indices = {}
+        for campo, aliases in COLUNAS.items():
+            for alias in aliases:
+                if alias in nomes:
+                    indices[campo] = nomes.index(alias)
+                    break
+        faltando = {'cep', 'cidade', 'estado'} - indices.keys()
+        if faltando:
+            raise CommandError(f'Colunas obrigatórias ausentes no cabeçalho: {", ".join(sorted(faltando))}')
+        return indices
+
+    def _converter(self, linha, indices):
+        try:
+            valores = {campo: linha[indice].strip() for campo, indice in indices.items()}
+        except IndexError:
+            return None
+        cep = ''.join(c for c in valores.pop('cep') if c.isdigit())
+        if len(cep) != 8:
+            return None
+        return (
+            int(cep),
+            valores.get('logradouro', '')[:200],
+            valores.get('bairro', '')[:100],
+            valores['cidade'][:100],
+            valores['estado'].upper()[:2],
+        )
+
+    def _gravar(self, lote):
+        # executemany com upsert: bem mais rápido que bulk_create para milhões de
+        # linhas, e recarregar o mesmo arquivo apenas atualiza os registros.
+        # A sintaxe ON CONFLICT funciona tanto no SQLite quanto no PostgreSQL.
+        tabela = connection.ops.quote_name(CepLocal._meta.db_table)
+        sql = (
+            f'INSERT INTO {tabela} (cep, logradouro, bairro, cidade, estado) '
+            'VALUES (%s, %s, %s, %s, %s) '
+            'ON CONFLICT (cep) DO UPDATE SET logradouro = excluded.logradouro, '
+            'bairro = excluded.bairro, cidade = excluded.cidade, estado = excluded.estado'
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, lote)
+        return len(lote)
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core import api
+
+
+class Command(BaseCommand):
+    help = 'Cria um token de acesso à API (/api/v1/) para um usuário; a chave é mostrada só uma vez'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usuario', help='username do dono do token (os atendimentos criados ficam em nome dele)')
+        parser.add_argument('--nome', default='', help='identificação do sistema que vai usar o token')
+
+    def handle(self, *args, **options):
+        usuario = User.objects.filter(username=options['usuario'], is_active=True).first()
+        if usuario is None:
+            raise CommandError(f'Usuário ativo "{options["usuario"]}" não encontrado.')
+        chave = api.criar_token(usuario, options['nome'] or 'Integração')
+        self.stdout.write(self.style.SUCCESS('Token criado. Guarde a chave; ela não será mostrada de novo:'))
+        self.stdout.write(chave)
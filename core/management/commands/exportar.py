@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import exportacao
+
+
+class Command(BaseCommand):
+    help = 'Exporta clientes ou atendimentos em CSV ou JSONL, sem carregar tudo em memória'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(exportacao.COLUNAS))
+        parser.add_argument('--formato', choices=sorted(exportacao.FORMATOS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Comprime a saída com gzip')
+        parser.add_argument('--search', default='', help='Mesmo filtro de busca da lista')
+        parser.add_argument('--status', default='', help='Filtra atendimentos pelo status')
+        parser.add_argument(
+            '--historico', action='store_true',
+            help='Inclui os atendimentos arquivados (como ?historico=1 na exportação da lista)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=exportacao.CHUNK_SIZE)
+        parser.add_argument('-o', '--saida', help='Arquivo de destino (padrão: saída padrão)')
+
+    def handle(self, *args, **options):
+        parametros = {
+            'search': options['search'],
+            'status': options['status'],
+            'historico': '1' if options['historico'] else '',
+        }
+        blocos = exportacao.exportar(
+            options['modelo'], parametros, options['formato'], options['gzip'], options['chunk_size'],
+        )
+        inicio = time.monotonic()
+        total = 0
+        saida = open(options['saida'], 'wb') if options['saida'] else sys.stdout.buffer
+        try:
+            for bloco in blocos:
+                saida.write(bloco)
+                total += len(bloco)
+        finally:
+            if options['saida']:
+                saida.close()
+            else:
+                saida.flush()
+        if options['saida']:
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} bytes gravados em {options["saida"]} ({time.monotonic() - inicio:.1f}s).'
+            ))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import duplicados
+from core.models import ParDuplicado
+
+
+class Command(BaseCommand):
+    help = (
+        'Procura clientes cadastrados mais de uma vez (nome parecido, mesmo telefone ou endereço) '
+        'e refaz o relatório de possíveis duplicados do admin'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--janela', type=int, default=settings.DUPLICADOS_JANELA,
+                            help='Clientes anteriores comparados com cada um, em cada chave de bloco')
+        parser.add_argument('--minimo', type=float, default=settings.DUPLICADOS_PONTUACAO_MINIMA,
+                            help='Pontuação mínima (0 a 1) para um par entrar no relatório; nomes quase '
+                                 'iguais (DUPLICADOS_SIMILARIDADE_NOME) entram de qualquer forma')
+        parser.add_argument('--lote', type=int, default=settings.DUPLICADOS_LOTE, help='Pares gravados por vez')
+        parser.add_argument('--mostrar', type=int, default=10, help='Quantos pares mais prováveis listar no fim')
+
+    def handle(self, *args, **options):
+        if options['janela'] < 1 or options['lote'] < 1 or not 0 <= options['minimo'] <= 1:
+            raise CommandError('--janela e --lote devem ser positivos e --minimo deve estar entre 0 e 1.')
+        inicio = time.monotonic()
+        for chave, comparacoes, gravados in duplicados.encontrar(options['janela'], options['minimo'], options['lote']):
+            self.stdout.write(f'{chave}: {comparacoes} comparações, {gravados} pares para o relatório')
+        pares = ParDuplicado.objects.filter(descartado=False)
+        for par in pares.select_related('cliente', 'duplicado')[:options['mostrar']]:
+            self.stdout.write(f'  {par.pontuacao:.0%}  {par.cliente} (#{par.cliente_id}) / {par.duplicado} (#{par.duplicado_id}): {par.motivos}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{pares.count()} possíveis duplicados em {time.monotonic() - inicio:.1f}s '
+            f'(veja e mescle em Admin > Possíveis duplicados).'
+        ))
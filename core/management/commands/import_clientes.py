@@ -0,0 +1,76 @@
+import csv
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.forms import ClienteForm
+from core.importacao import ValidadorClientes, erros_como_texto, gravar_clientes
+
+
+class Command(BaseCommand):
+    help = 'Importa clientes de um CSV, validando com as regras do ClienteForm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='CSV com cabeçalho usando os nomes dos campos do ClienteForm')
+        parser.add_argument('--rejeitados', help='CSV de saída com as linhas recusadas (padrão: <arquivo>.rejeitados.csv)')
+        parser.add_argument('--delimitador', default=None, help='Separador de colunas (padrão: detectado pelo cabeçalho)')
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument('--lote', type=int, default=1000, help='Linhas validadas e gravadas por transação')
+
+    def handle(self, *args, **options):
+        origem = Path(options['arquivo'])
+        destino = Path(options['rejeitados'] or f'{origem}.rejeitados.csv')
+        try:
+            arquivo = origem.open(encoding=options['encoding'], newline='')
+        except OSError as e:
+            raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+
+        with arquivo, destino.open('w', encoding='utf-8', newline='') as saida:
+            cabecalho = arquivo.readline()
+            delimitador = options['delimitador'] or (';' if cabecalho.count(';') > cabecalho.count(',') else ',')
+            colunas = [coluna.strip() for coluna in next(csv.reader([cabecalho], delimiter=delimitador))]
+            faltando = set(ClienteForm.base_fields) - {'complemento'} - set(colunas)
+            if faltando:
+                raise CommandError(f'Colunas ausentes no cabeçalho: {", ".join(sorted(faltando))}')
+
+            rejeitos = csv.writer(saida)
+            rejeitos.writerow(['linha', *colunas, 'erros'])
+
+            validador = ValidadorClientes()
+            self.inicio = time.monotonic()
+            self.total = self.importados = self.recusados = 0
+            lote = []
+            # Linha 1 é o cabeçalho
+            for numero, valores in enumerate(csv.reader(arquivo, delimiter=delimitador), start=2):
+                lote.append((numero, dict(zip(colunas, valores))))
+                if len(lote) >= options['lote']:
+                    self._processar(lote, validador, rejeitos)
+                    lote = []
+            if lote:
+                self._processar(lote, validador, rejeitos)
+
+        duracao = time.monotonic() - self.inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.importados} clientes importados, {self.recusados} recusados, '
+            f'{self.total} linhas em {duracao:.1f}s ({self.total / duracao if duracao else self.total:.0f} linhas/s).'
+        ))
+        if self.recusados:
+            self.stdout.write(f'Linhas recusadas em {destino}')
+
+    def _processar(self, lote, validador, rejeitos):
+        dados_por_linha = dict(lote)
+        validos, recusados = validador.validar_lote(lote)
+        gravados, conflitos = gravar_clientes(validos)
+        recusados += conflitos
+        for numero, erros in sorted(recusados):
+            dados = dados_por_linha[numero]
+            rejeitos.writerow([numero, *dados.values(), erros_como_texto(erros)])
+
+        self.total += len(lote)
+        self.importados += len(gravados)
+        self.recusados += len(recusados)
+        duracao = time.monotonic() - self.inicio
+        self.stdout.write(
+            f'{self.total} linhas processadas ({self.total / duracao if duracao else self.total:.0f} linhas/s)'
+        )
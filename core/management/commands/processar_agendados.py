@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import lembretes
+
+
+class Command(BaseCommand):
+    help = (
+        'Marca os agendados vencidos como atrasados, enfileira e envia os lembretes dos próximos '
+        'atendimentos (rodar via cron ou com --intervalo; pode ser interrompido e retomado)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=settings.LEMBRETES_LOTE, help='Registros por transação')
+        parser.add_argument('--sem-envio', action='store_true', help='Só marca atrasados e enfileira os lembretes')
+        parser.add_argument('--intervalo', type=int, default=None,
+                            help='Repete a cada tantos segundos, até ser interrompido (Ctrl+C)')
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1 or (options['intervalo'] is not None and options['intervalo'] < 1):
+            raise CommandError('--lote e --intervalo devem ser positivos.')
+        backend = None if options['sem_envio'] else lembretes.obter_backend()
+        try:
+            while True:
+                self.executar(backend, options['lote'])
+                if options['intervalo'] is None:
+                    break
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write('Interrompido.')
+
+    def executar(self, backend, lote):
+        inicio = time.monotonic()
+        atrasados = max(lembretes.marcar_atrasados(tamanho=lote), default=0)
+        enfileirados = max(lembretes.enfileirar(tamanho=lote), default=0)
+        enviados = descartados = falhas = 0
+        if backend is not None:
+            for enviados, descartados, falhas in lembretes.enviar(backend, lote):
+                pass
+        removidos = lembretes.limpar(tamanho=lote)
+        self.stdout.write(self.style.SUCCESS(
+            f'{atrasados} atrasados, {enfileirados} lembretes enfileirados, {enviados} enviados, '
+            f'{descartados} descartados, {falhas} falhas, {removidos} antigos removidos '
+            f'em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import exclusao
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove de vez os clientes excluídos e os seus atendimentos, em lotes '
+        '(rodar periodicamente, ex.: via cron; pode ser interrompido e retomado)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=settings.EXCLUSAO_LOTE, help='Atendimentos apagados por transação')
+        parser.add_argument('--max-clientes', type=int, default=None, help='Para depois desse número de clientes')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        clientes = atendimentos = 0
+        for cliente_id, apagados in exclusao.purgar_pendentes(options['lote'], options['max_clientes']):
+            clientes += 1
+            atendimentos += apagados
+            self.stdout.write(f'Cliente {cliente_id}: {apagados} atendimentos apagados')
+        self.stdout.write(self.style.SUCCESS(
+            f'{clientes} clientes e {atendimentos} atendimentos removidos em {time.monotonic() - inicio:.1f}s.'
+        ))
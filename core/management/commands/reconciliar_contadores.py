@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import contadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores do dashboard a partir das tabelas (rodar periodicamente, ex.: via cron)'
+
+    def handle(self, *args, **options):
+        totais = contadores.reconciliar()
+        self.stdout.write(self.style.SUCCESS(
+            'Contadores reconciliados: '
+            + ', '.join(f'{nome}={valor}' for nome, valor in totais.items())
+        ))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import busca
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os índices de busca textual (FTS5) de clientes e atendimentos'
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        if not busca.reconstruir_indices():
+            self.stdout.write(self.style.WARNING('Banco sem suporte a FTS5; nada a fazer.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Índices de busca reconstruídos em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import relatorios
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula as tabelas de totais dos relatórios (no SQLite e no PostgreSQL os triggers '
+        'já as mantêm; em outros bancos, rodar periodicamente, ex.: via cron)'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        relatorios.reconstruir()
+        relatorios.garantir_triggers()
+        self.stdout.write(self.style.SUCCESS(
+            f'Totais dos relatórios recalculados em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,29 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia o banco SQLite principal para os arquivos das réplicas (DB_REPLICAS). '
+        'Serve para simular a replicação em testes locais do roteamento de leituras.'
+    )
+
+    def handle(self, *args, **options):
+        principal = connections['default']
+        if principal.vendor != 'sqlite':
+            raise CommandError('Só faz sentido com o perfil sqlite; no PostgreSQL use a replicação do próprio banco.')
+        if not settings.DB_REPLICAS:
+            raise CommandError('Nenhuma réplica configurada em DB_REPLICAS.')
+        principal.ensure_connection()
+        for alias in settings.DB_REPLICAS:
+            connections[alias].close()
+            destino = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # API de backup do SQLite: cópia consistente mesmo com o principal em uso
+                principal.connection.backup(destino)
+            finally:
+                destino.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias} atualizada.'))
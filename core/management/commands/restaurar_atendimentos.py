@@ -0,0 +1,49 @@
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import arquivo
+from core.models import AtendimentoArquivado
+
+
+class Command(BaseCommand):
+    help = 'Devolve atendimentos do arquivo para a tabela principal, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--de', help='Data inicial (AAAA-MM-DD), inclusive')
+        parser.add_argument('--ate', help='Data final (AAAA-MM-DD), inclusive')
+        parser.add_argument('--cliente', type=int, help='Só os atendimentos desse cliente (id)')
+        parser.add_argument('--id', type=int, nargs='+', dest='ids', help='Ids dos atendimentos')
+        parser.add_argument('--lote', type=int, default=settings.ARQUIVO_LOTE, help='Atendimentos movidos por transação')
+
+    def handle(self, *args, **options):
+        if not any(options[opcao] for opcao in ('de', 'ate', 'cliente', 'ids')):
+            raise CommandError('Informe ao menos um filtro (--de, --ate, --cliente ou --id).')
+        arquivados = AtendimentoArquivado.objects.all()
+        # Intervalo em data_hora (usa o índice), do início de --de ao fim de --ate
+        for opcao, lookup, dias in (('de', 'data_hora__gte', 0), ('ate', 'data_hora__lt', 1)):
+            if options[opcao]:
+                try:
+                    dia = parse_date(options[opcao])
+                except ValueError:
+                    dia = None
+                if dia is None:
+                    raise CommandError(f'--{opcao}: use o formato AAAA-MM-DD.')
+                limite = timezone.make_aware(datetime.combine(dia + timedelta(days=dias), datetime.min.time()))
+                arquivados = arquivados.filter(**{lookup: limite})
+        if options['cliente']:
+            arquivados = arquivados.filter(cliente_id=options['cliente'])
+        if options['ids']:
+            arquivados = arquivados.filter(pk__in=options['ids'])
+
+        inicio = time.monotonic()
+        total = 0
+        for total in arquivo.restaurar(arquivados, options['lote']):
+            self.stdout.write(f'{total} atendimentos restaurados')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} atendimentos restaurados em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,227 @@
+import random
+import time
+import unicodedata
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import busca, contadores, relatorios
+from core.models import Atendimento, Cliente
+
+# UF: (capital, DDD, faixa de CEP pelos 5 primeiros dígitos, peso na população)
+UFS = {
+    'SP': ('São Paulo', 11, (1000, 19999), 22.0),
+    'MG': ('Belo Horizonte', 31, (30000, 39999), 10.0),
+    'RJ': ('Rio de Janeiro', 21, (20000, 28999), 8.0),
+    'BA': ('Salvador', 71, (40000, 48999), 7.0),
+    'PR': ('Curitiba', 41, (80000, 87999), 5.5),
+    'RS': ('Porto Alegre', 51, (90000, 99999), 5.5),
+    'PE': ('Recife', 81, (50000, 56999), 4.5),
+    'CE': ('Fortaleza', 85, (60000, 63999), 4.5),
+    'PA': ('Belém', 91, (66000, 68899), 4.0),
+    'SC': ('Florianópolis', 48, (88000, 89999), 3.5),
+    'GO': ('Goiânia', 62, (74000, 76799), 3.3),
+    'MA': ('São Luís', 98, (65000, 65999), 3.3),
+    'AM': ('Manaus', 92, (69000, 69299), 2.0),
+    'ES': ('Vitória', 27, (29000, 29999), 2.0),
+    'PB': ('João Pessoa', 83, (58000, 58999), 2.0),
+    'RN': ('Natal', 84, (59000, 59999), 1.7),
+    'MT': ('Cuiabá', 65, (78000, 78899), 1.7),
+    'AL': ('Maceió', 82, (57000, 57999), 1.6),
+    'PI': ('Teresina', 86, (64000, 64999), 1.6),
+    'DF': ('Brasília', 61, (70000, 72799), 1.4),
+    'MS': ('Campo Grande', 67, (79000, 79999), 1.3),
+    'SE': ('Aracaju', 79, (49000, 49999), 1.1),
+    'RO': ('Porto Velho', 69, (76800, 76999), 0.8),
+    'TO': ('Palmas', 63, (77000, 77999), 0.7),
+    'AC': ('Rio Branco', 68, (69900, 69999), 0.4),
+    'AP': ('Macapá', 96, (68900, 68999), 0.4),
+    'RR': ('Boa Vista', 95, (69300, 69399), 0.3),
+}
+
+NOMES = (
+    'Ana', 'Antônio', 'Beatriz', 'Bruno', 'Camila', 'Carlos', 'Daniela', 'Diego', 'Eduarda', 'Felipe',
+    'Fernanda', 'Gabriel', 'Helena', 'Igor', 'Isabela', 'João', 'Júlia', 'Larissa', 'Lucas', 'Luiza',
+    'Marcos', 'Maria', 'Mateus', 'Natália', 'Paulo', 'Pedro', 'Rafaela', 'Ricardo', 'Sofia', 'Thiago',
+)
+SOBRENOMES = (
+    'Almeida', 'Alves', 'Araújo', 'Barbosa', 'Cardoso', 'Carvalho', 'Castro', 'Costa', 'Dias', 'Fernandes',
+    'Ferreira', 'Gomes', 'Lima', 'Martins', 'Melo', 'Moreira', 'Nascimento', 'Oliveira', 'Pereira', 'Ribeiro',
+    'Rocha', 'Rodrigues', 'Santos', 'Silva', 'Soares', 'Sousa', 'Teixeira', 'Vieira',
+)
+LOGRADOUROS = ('Rua', 'Avenida', 'Travessa', 'Alameda', 'Praça')
+NOMES_RUAS = (
+    'das Flores', 'Brasil', 'São João', 'XV de Novembro', 'Sete de Setembro', 'Tiradentes',
+    'Getúlio Vargas', 'Dom Pedro II', 'das Palmeiras', 'Santos Dumont', 'Rui Barbosa', 'da Liberdade',
+)
+BAIRROS = ('Centro', 'Jardim América', 'Vila Nova', 'Boa Vista', 'Santa Cruz', 'São José', 'Industrial', 'Cidade Nova')
+DESCRICOES = (
+    'Primeira consulta', 'Retorno', 'Revisão do contrato', 'Suporte técnico', 'Instalação de equipamento',
+    'Atualização cadastral', 'Negociação de débito', 'Visita de manutenção', 'Apresentação de proposta',
+    'Reclamação sobre atendimento anterior',
+)
+
+# Janela dos atendimentos em torno da data de referência, em minutos
+PASSADO = 2 * 365 * 24 * 60
+FUTURO = 180 * 24 * 60
+
+
+def digitos_cpf(base):
+    """CPF válido (11 dígitos) a partir de um número de 9 dígitos."""
+    digitos = [int(c) for c in f'{base:09d}']
+    for peso in (10, 11):
+        soma = sum(d * (peso - i) for i, d in enumerate(digitos))
+        resto = 11 - soma % 11
+        digitos.append(0 if resto >= 10 else resto)
+    return ''.join(map(str, digitos))
+
+
+def sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera clientes e atendimentos sintéticos para testes de carga. Com a mesma '
+        '--seed e a mesma --referencia os dados gerados são os mesmos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=10000)
+        parser.add_argument('--atendimentos', type=int, default=100000)
+        parser.add_argument('--usuarios', type=int, default=20, help='Atendentes entre os quais os atendimentos são distribuídos')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--referencia', help='Data (AAAA-MM-DD) em torno da qual os atendimentos são distribuídos (padrão: hoje)')
+        parser.add_argument('--lote', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.seed = options['seed']
+        self.lote = options['lote']
+        try:
+            dia = datetime.strptime(options['referencia'], '%Y-%m-%d').date() if options['referencia'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--referencia deve estar no formato AAAA-MM-DD')
+        self.referencia = timezone.make_aware(datetime.combine(dia, dt_time(12)))
+
+        inicio = time.monotonic()
+        # Índices FTS e totais dos relatórios refeitos uma vez no fim, em vez de um INSERT por linha
+        with busca.indexacao_adiada(), relatorios.totais_adiados():
+            criados = self._gerar_clientes(rng, options['clientes'])
+            self.stdout.write(f'{criados} clientes criados ({time.monotonic() - inicio:.1f}s)')
+            usuarios = self._usuarios(options['usuarios'])
+            criados = self._gerar_atendimentos(rng, options['atendimentos'], usuarios)
+            self.stdout.write(f'{criados} atendimentos criados ({time.monotonic() - inicio:.1f}s)')
+        # bulk_create não dispara os sinais dos contadores
+        contadores.reconciliar()
+        contadores.nova_versao('cliente', 'atendimento')
+        self.stdout.write(self.style.SUCCESS(f'Concluído em {time.monotonic() - inicio:.1f}s.'))
+
+    def _usuarios(self, quantidade):
+        usuarios = []
+        for numero in range(1, quantidade + 1):
+            usuario, criado = User.objects.get_or_create(
+                username=f'atendente{numero:03d}',
+                defaults={'first_name': NOMES[numero % len(NOMES)], 'last_name': SOBRENOMES[numero % len(SOBRENOMES)]},
+            )
+            if criado:
+                usuario.set_unusable_password()
+                usuario.save(update_fields=['password'])
+            usuarios.append(usuario.pk)
+        return usuarios
+
+    def _gerar_clientes(self, rng, quantidade):
+        ufs = list(UFS)
+        pesos = [UFS[uf][3] for uf in ufs]
+        criados = 0
+        for inicio in range(0, quantidade, self.lote):
+            clientes = []
+            for indice in range(inicio, min(inicio + self.lote, quantidade)):
+                uf = rng.choices(ufs, pesos)[0]
+                capital, ddd, (cep_min, cep_max), _ = UFS[uf]
+                nome, sobrenome = rng.choice(NOMES), rng.choice(SOBRENOMES)
+                # Base do CPF única por (seed, índice): 7919 é primo com 10^9
+                cpf = digitos_cpf((indice * 7919 + self.seed * 104729) % 10 ** 9)
+                cep = f'{rng.randint(cep_min, cep_max):05d}{rng.randint(0, 999):03d}'
+                cliente = Cliente(
+                    nome=f'{nome} {rng.choice(SOBRENOMES)} {sobrenome}',
+                    email=f'{sem_acentos(nome).lower()}.{sem_acentos(sobrenome).lower()}.{self.seed}.{indice}@exemplo.com.br',
+                    telefone=f'({ddd}) 9{rng.randint(0, 9999):04d}-{rng.randint(0, 9999):04d}',
+                    cpf=f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}',
+                    cep=f'{cep[:5]}-{cep[5:]}',
+                    logradouro=f'{rng.choice(LOGRADOUROS)} {rng.choice(NOMES_RUAS)}',
+                    numero=str(rng.randint(1, 3000)),
+                    complemento=rng.choice((None, None, None, f'Apto {rng.randint(1, 300)}', 'Casa 2')),
+                    bairro=rng.choice(BAIRROS),
+                    cidade=capital,
+                    estado=uf,
+                )
+                cliente.atualizar_derivados()
+                clientes.append(cliente)
+            criados += self._inserir_clientes(clientes)
+        return criados
+
+    def _inserir_clientes(self, clientes):
+        # Rodar de novo com a mesma seed não duplica: CPFs e emails já existentes são pulados
+        existentes = set(Cliente.todos.filter(cpf_digitos__in=[c.cpf_digitos for c in clientes]).values_list('cpf_digitos', flat=True))
+        existentes |= set(Cliente.todos.filter(email__in=[c.email for c in clientes]).values_list('email', flat=True))
+        novos = [c for c in clientes if c.cpf_digitos not in existentes and c.email not in existentes]
+        with transaction.atomic():
+            Cliente.objects.bulk_create(novos)
+        return len(novos)
+
+    def _gerar_atendimentos(self, rng, quantidade, usuarios):
+        clientes = list(Cliente.objects.order_by('id').values_list('id', flat=True))
+        if not clientes or not usuarios:
+            return 0
+        # Horários em minutos desde o início da janela; a referência (e não o relógio)
+        # separa passado e futuro, para o resultado não depender da hora da execução
+        inicio_janela = (self.referencia - timedelta(minutes=PASSADO)).astimezone(dt_timezone.utc)
+        referencia = PASSADO
+        # Horários ativos já ocupados (restrição atendimento_slot_unico)
+        ocupados = {
+            int((slot - inicio_janela).total_seconds() // 60)
+            for slot in Atendimento.objects.filter(slot__isnull=False).values_list('slot', flat=True)
+        }
+        adaptar = connection.ops.adapt_datetimefield_value
+        agora = adaptar(timezone.now())
+        tabela = connection.ops.quote_name(Atendimento._meta.db_table)
+        # executemany direto: o bulk_create gasta a maior parte do tempo montando
+        # objetos e SQL. Ao adicionar campos obrigatórios em Atendimento, incluí-los aqui.
+        sql = (
+            f'INSERT INTO {tabela} (cliente_id, usuario_id, data_hora, descricao, status, slot, created_at, updated_at) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)'
+        )
+        criados = 0
+        for inicio in range(0, quantidade, self.lote):
+            linhas = []
+            for _ in range(min(self.lote, quantidade - inicio)):
+                minuto = rng.randrange(PASSADO + FUTURO)
+                if minuto > referencia:
+                    status = rng.choices(('agendado', 'cancelado'), (85, 15))[0]
+                elif referencia - minuto < 120:
+                    status = rng.choices(('em_andamento', 'concluido'), (50, 50))[0]
+                else:
+                    status = rng.choices(('concluido', 'cancelado'), (85, 15))[0]
+                if status in Atendimento.STATUS_ATIVOS and minuto in ocupados:
+                    # Horário já tomado: o atendimento entra como cancelado
+                    status = 'cancelado'
+                data_hora = adaptar(inicio_janela + timedelta(minutes=minuto))
+                slot = None
+                if status in Atendimento.STATUS_ATIVOS:
+                    # data_hora já está no minuto exato, então o slot é o próprio horário
+                    ocupados.add(minuto)
+                    slot = data_hora
+                linhas.append((
+                    rng.choice(clientes), rng.choice(usuarios), data_hora,
+                    rng.choice(DESCRICOES), status, slot, agora, agora,
+                ))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, linhas)
+            criados += len(linhas)
+            if criados % 100000 < self.lote:
+                self.stdout.write(f'{criados} atendimentos...')
+        return criados
@@ -0,0 +1,266 @@
+"""
+Métricas por view no formato do Prometheus.
+
+MetricasMiddleware mede cada requisição e agrega por nome da URL (ex.:
+'cliente_list'): latência, consultas ao banco (quantidade e tempo), tempo de
+renderização de templates e tempo gasto em serviços externos (ViaCEP). Uma
+mesma consulta (mesmo SQL, parâmetros diferentes) repetida muitas vezes na
+mesma requisição é contada como suspeita de N+1 e registrada no log.
+
+Os agregados ficam em memória, um conjunto por thread (sem locks no caminho da
+requisição), e são somados só quando /metricas/ é lido. Cada processo expõe os
+próprios números; o Prometheus soma os processos.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DESCRICOES = {
+    'crm_requisicoes_total': ('counter', 'Requisições atendidas, por view e status HTTP'),
+    'crm_requisicao_segundos': ('histogram', 'Latência das requisições, por view'),
+    'crm_db_consultas_total': ('counter', 'Consultas ao banco, por view'),
+    'crm_db_segundos_total': ('counter', 'Tempo gasto em consultas ao banco, por view'),
+    'crm_template_segundos_total': ('counter', 'Tempo de renderização de templates, por view'),
+    'crm_upstream_segundos_total': ('counter', 'Tempo gasto em chamadas HTTP externas, por view e serviço'),
+    'crm_upstream_segundos': ('histogram', 'Latência das chamadas HTTP externas, por serviço'),
+    'crm_n_mais_um_total': ('counter', 'Requisições com a mesma consulta repetida (suspeita de N+1), por view'),
+}
+
+
+class Agregados:
+    """
+    Contadores e histogramas com rótulos. Cada thread escreve no próprio
+    dicionário; exportar() soma todos.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lojas = []
+        self._lock = threading.Lock()
+
+    def _loja(self):
+        loja = getattr(self._local, 'loja', None)
+        if loja is None:
+            loja = {}
+            # Só na primeira métrica de cada thread
+            with self._lock:
+                self._lojas.append(loja)
+            self._local.loja = loja
+        return loja
+
+    def somar(self, nome, rotulos, valor=1):
+        loja = self._loja()
+        chave = (nome, rotulos)
+        loja[chave] = loja.get(chave, 0) + valor
+
+    def observar(self, nome, rotulos, valor):
+        loja = self._loja()
+        chave = (nome, rotulos)
+        histograma = loja.get(chave)
+        if histograma is None:
+            # Contagem por bucket (o último é +Inf), soma e total
+            histograma = loja[chave] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histograma[0][bisect.bisect_left(BUCKETS, valor)] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+    def valores(self):
+        with self._lock:
+            lojas = list(self._lojas)
+        total = {}
+        for loja in lojas:
+            for chave, valor in loja.copy().items():
+                if isinstance(valor, list):
+                    atual = total.setdefault(chave, [[0] * (len(BUCKETS) + 1), 0.0, 0])
+                    atual[0] = [a + b for a, b in zip(atual[0], valor[0])]
+                    atual[1] += valor[1]
+                    atual[2] += valor[2]
+                else:
+                    total[chave] = total.get(chave, 0) + valor
+        return total
+
+    def limpar(self):
+        with self._lock:
+            for loja in self._lojas:
+                loja.clear()
+
+    def exportar(self):
+        por_metrica = {}
+        for (nome, rotulos), valor in self.valores().items():
+            por_metrica.setdefault(nome, []).append((rotulos, valor))
+        linhas = []
+        for nome in sorted(por_metrica):
+            tipo, descricao = DESCRICOES.get(nome, ('untyped', nome))
+            linhas.append(f'# HELP {nome} {descricao}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+            for rotulos, valor in sorted(por_metrica[nome]):
+                if tipo == 'histogram':
+                    buckets, soma, quantidade = valor
+                    acumulado = 0
+                    for limite, n in zip((*BUCKETS, '+Inf'), buckets):
+                        acumulado += n
+                        linhas.append(f'{nome}_bucket{_rotulos((*rotulos, ("le", str(limite))))} {acumulado}')
+                    linhas.append(f'{nome}_sum{_rotulos(rotulos)} {soma}')
+                    linhas.append(f'{nome}_count{_rotulos(rotulos)} {quantidade}')
+                else:
+                    linhas.append(f'{nome}{_rotulos(rotulos)} {valor}')
+        return '\n'.join(linhas) + '\n'
+
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ''
+    pares = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nome, valor in rotulos
+    )
+    return '{' + pares + '}'
+
+
+agregados = Agregados()
+
+
+class Medicao:
+    """Números de uma requisição em andamento."""
+    __slots__ = ('consultas', 'tempo_db', 'tempo_template', 'upstream', 'formatos')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.tempo_template = 0.0
+        self.upstream = {}
+        self.formatos = Counter()
+
+
+_medicao = ContextVar('medicao', default=None)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicao = _medicao.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.tempo_db += time.perf_counter() - inicio
+        medicao.consultas += 1
+        # O SQL vem com placeholders: a mesma string é a mesma consulta com outros
+        # parâmetros. Só leituras contam como N+1; INSERT/UPDATE repetidos são,
+        # em geral, os lotes de um bulk_create/bulk_update.
+        if sql[:6].upper() == 'SELECT':
+            medicao.formatos[sql] += 1
+
+
+@contextmanager
+def medir_upstream(servico):
+    """Mede uma chamada a um serviço externo (ex.: 'viacep')."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        agregados.observar('crm_upstream_segundos', (('servico', servico),), duracao)
+        medicao = _medicao.get()
+        if medicao is not None:
+            medicao.upstream[servico] = medicao.upstream.get(servico, 0.0) + duracao
+
+
+class TemplateMedido(Template):
+    def render(self, context=None, request=None):
+        medicao = _medicao.get()
+        if medicao is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicao.tempo_template += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidos(DjangoTemplates):
+    """Backend de templates do Django que mede o tempo de cada render()."""
+
+    def from_string(self, template_code):
+        return TemplateMedido(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TemplateMedido(template.template, self)
+
+
+class MetricasMiddleware:
+    # Também assíncrono: sob ASGI as views async não são levadas para uma thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICAS_ATIVAS', True):
+            return self.get_response(request)
+        inicio = time.perf_counter()
+        with self._medindo(request) as medicao:
+            response = self.get_response(request)
+        self._registrar(request, response, medicao, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICAS_ATIVAS', True):
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        with self._medindo(request) as medicao:
+            response = await self.get_response(request)
+        self._registrar(request, response, medicao, time.perf_counter() - inicio)
+        return response
+
+    @contextmanager
+    def _medindo(self, request):
+        medicao = Medicao()
+        # Também fica na requisição (o benchmark_views lê daqui)
+        request.medicao = medicao
+        token = _medicao.set(medicao)
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all(initialized_only=False):
+                    pilha.enter_context(conexao.execute_wrapper(_medir_consulta))
+                yield medicao
+        finally:
+            _medicao.reset(token)
+
+    def _registrar(self, request, response, medicao, duracao):
+        match = request.resolver_match
+        view = (('view', match.view_name if match else 'sem_rota'),)
+        agregados.somar('crm_requisicoes_total', (*view, ('status', str(response.status_code))))
+        agregados.observar('crm_requisicao_segundos', view, duracao)
+        agregados.somar('crm_db_consultas_total', view, medicao.consultas)
+        agregados.somar('crm_db_segundos_total', view, medicao.tempo_db)
+        agregados.somar('crm_template_segundos_total', view, medicao.tempo_template)
+        for servico, tempo in medicao.upstream.items():
+            agregados.somar('crm_upstream_segundos_total', (*view, ('servico', servico)), tempo)
+
+        limite = getattr(settings, 'METRICAS_LIMITE_REPETICOES', 10)
+        if medicao.formatos:
+            sql, vezes = medicao.formatos.most_common(1)[0]
+            if vezes >= limite:
+                agregados.somar('crm_n_mais_um_total', view)
+                logger.warning('Possível N+1 em %s: consulta repetida %d vezes: %s', view[0][1], vezes, sql[:300])
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CepCache',
+            fields=[
+                ('cep', models.CharField(max_length=8, primary_key=True, serialize=False, verbose_name='CEP')),
+                ('logradouro', models.CharField(blank=True, max_length=200, verbose_name='Logradouro')),
+                ('bairro', models.CharField(blank=True, max_length=100, verbose_name='Bairro')),
+                ('cidade', models.CharField(blank=True, max_length=100, verbose_name='Cidade')),
+                ('estado', models.CharField(blank=True, max_length=2, verbose_name='Estado')),
+                ('encontrado', models.BooleanField(default=True, verbose_name='Encontrado')),
+                ('consultado_em', models.DateTimeField(verbose_name='Consultado em')),
+            ],
+            options={
+                'verbose_name': 'CEP em cache',
+                'verbose_name_plural': 'CEPs em cache',
+            },
+        ),
+    ]
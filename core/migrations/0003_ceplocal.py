@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_cepcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CepLocal',
+            fields=[
+                ('cep', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='CEP')),
+                ('logradouro', models.CharField(blank=True, max_length=200, verbose_name='Logradouro')),
+                ('bairro', models.CharField(blank=True, max_length=100, verbose_name='Bairro')),
+                ('cidade', models.CharField(max_length=100, verbose_name='Cidade')),
+                ('estado', models.CharField(max_length=2, verbose_name='Estado')),
+            ],
+            options={
+                'verbose_name': 'CEP da base local',
+                'verbose_name_plural': 'CEPs da base local',
+            },
+        ),
+    ]
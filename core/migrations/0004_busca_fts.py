@@ -0,0 +1,101 @@
+from django.db import migrations
+
+# Índices FTS5 para a busca das listas de clientes e atendimentos.
+# Só existem no SQLite; nos outros bancos a busca continua usando icontains.
+# unicode61 com remove_diacritics 2 faz "José" casar com "jose".
+SQL_CRIAR = [
+    """
+    CREATE VIRTUAL TABLE core_cliente_fts USING fts5(
+        nome, email, cpf, telefone,
+        content='core_cliente', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER core_cliente_fts_ai AFTER INSERT ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER core_cliente_fts_ad AFTER DELETE ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER core_cliente_fts_au AFTER UPDATE OF nome, email, cpf, telefone ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE VIRTUAL TABLE core_atendimento_fts USING fts5(
+        cliente_nome, descricao,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER core_atendimento_fts_ai AFTER INSERT ON core_atendimento BEGIN
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER core_atendimento_fts_ad AFTER DELETE ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER core_atendimento_fts_au AFTER UPDATE OF cliente_id, descricao ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER core_cliente_nome_atendimento_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimento_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimento WHERE cliente_id = new.id);
+    END
+    """,
+    "INSERT INTO core_cliente_fts(core_cliente_fts) VALUES ('rebuild')",
+    """
+    INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+    SELECT a.id, c.nome, a.descricao FROM core_atendimento a JOIN core_cliente c ON c.id = a.cliente_id
+    """,
+]
+
+SQL_REMOVER = [
+    'DROP TRIGGER IF EXISTS core_cliente_nome_atendimento_fts_au',
+    'DROP TRIGGER IF EXISTS core_atendimento_fts_au',
+    'DROP TRIGGER IF EXISTS core_atendimento_fts_ad',
+    'DROP TRIGGER IF EXISTS core_atendimento_fts_ai',
+    'DROP TABLE IF EXISTS core_atendimento_fts',
+    'DROP TRIGGER IF EXISTS core_cliente_fts_au',
+    'DROP TRIGGER IF EXISTS core_cliente_fts_ad',
+    'DROP TRIGGER IF EXISTS core_cliente_fts_ai',
+    'DROP TABLE IF EXISTS core_cliente_fts',
+]
+
+
+def executar(comandos):
+    def operacao(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return operacao
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_ceplocal'),
+    ]
+
+    operations = [
+        migrations.RunPython(executar(SQL_CRIAR), executar(SQL_REMOVER)),
+    ]
@@ -0,0 +1,127 @@
+import re
+
+from django.db import migrations, models
+
+# Triggers do FTS como criados na migração 0004. O SQLite recria a tabela nas
+# alterações abaixo, então os triggers saem antes e voltam depois. O SQL fica
+# copiado aqui para a migração não depender da versão atual de core.busca.
+SQL_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ai AFTER INSERT ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ad AFTER DELETE ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_au AFTER UPDATE OF nome, email, cpf, telefone ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ai AFTER INSERT ON core_atendimento BEGIN
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ad AFTER DELETE ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_au AFTER UPDATE OF cliente_id, descricao ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_atendimento_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimento_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimento WHERE cliente_id = new.id);
+    END
+    """,
+]
+
+NOMES_TRIGGERS = [
+    'core_cliente_fts_ai',
+    'core_cliente_fts_ad',
+    'core_cliente_fts_au',
+    'core_atendimento_fts_ai',
+    'core_atendimento_fts_ad',
+    'core_atendimento_fts_au',
+    'core_cliente_nome_atendimento_fts_au',
+]
+
+
+def criar_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+def remover_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for nome in NOMES_TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {nome}')
+
+
+def preencher_digitos(apps, schema_editor):
+    Cliente = apps.get_model('core', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.only('cpf', 'telefone', 'cep').iterator(chunk_size=2000):
+        cliente.cpf_digitos = re.sub(r'\D', '', cliente.cpf)
+        cliente.telefone_digitos = re.sub(r'\D', '', cliente.telefone)
+        cliente.cep_digitos = re.sub(r'\D', '', cliente.cep)
+        lote.append(cliente)
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['cpf_digitos', 'telefone_digitos', 'cep_digitos'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['cpf_digitos', 'telefone_digitos', 'cep_digitos'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_busca_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_triggers, criar_triggers),
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_digitos',
+            field=models.CharField(editable=False, max_length=11, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_digitos',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=11),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='cep_digitos',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=8),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_digitos, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cliente',
+            name='cpf_digitos',
+            field=models.CharField(editable=False, max_length=11, unique=True),
+        ),
+        migrations.RunPython(criar_triggers, remover_triggers),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_cliente_digitos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='atendimento',
+            index=models.Index(fields=['data_hora', 'id'], name='atendimento_data_hora_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['nome', 'id'], name='cliente_nome_id_idx'),
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Triggers do FTS como criados na migração 0004. O SQLite recria a tabela nas
+# alterações abaixo, então os triggers saem antes e voltam depois. O SQL fica
+# copiado aqui para a migração não depender da versão atual de core.busca.
+SQL_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ai AFTER INSERT ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ad AFTER DELETE ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_au AFTER UPDATE OF nome, email, cpf, telefone ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ai AFTER INSERT ON core_atendimento BEGIN
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ad AFTER DELETE ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_au AFTER UPDATE OF cliente_id, descricao ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_atendimento_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimento_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimento WHERE cliente_id = new.id);
+    END
+    """,
+]
+
+NOMES_TRIGGERS = [
+    'core_cliente_fts_ai',
+    'core_cliente_fts_ad',
+    'core_cliente_fts_au',
+    'core_atendimento_fts_ai',
+    'core_atendimento_fts_ad',
+    'core_atendimento_fts_au',
+    'core_cliente_nome_atendimento_fts_au',
+]
+
+
+def criar_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+def remover_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for nome in NOMES_TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {nome}')
+
+
+def preencher_slots(apps, schema_editor):
+    # Se já houver dois atendimentos ativos no mesmo horário, só o mais antigo
+    # fica com o slot; os demais continuam existindo, mas sem reserva.
+    Atendimento = apps.get_model('core', 'Atendimento')
+    ocupados = set()
+    lote = []
+    ativos = Atendimento.objects.filter(status__in=('agendado', 'em_andamento')).only('data_hora').order_by('id')
+    for atendimento in ativos.iterator(chunk_size=2000):
+        slot = atendimento.data_hora.replace(second=0, microsecond=0)
+        if slot in ocupados:
+            continue
+        ocupados.add(slot)
+        atendimento.slot = slot
+        lote.append(atendimento)
+        if len(lote) >= 2000:
+            Atendimento.objects.bulk_update(lote, ['slot'])
+            lote = []
+    if lote:
+        Atendimento.objects.bulk_update(lote, ['slot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_contador'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_triggers, criar_triggers),
+        migrations.AddField(
+            model_name='atendimento',
+            name='slot',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='atendimento',
+            index=models.Index(fields=['status', 'data_hora'], name='atendimento_status_data_idx'),
+        ),
+        migrations.RunPython(preencher_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='atendimento',
+            constraint=models.UniqueConstraint(fields=('slot',), name='atendimento_slot_unico'),
+        ),
+        migrations.RunPython(criar_triggers, remover_triggers),
+    ]
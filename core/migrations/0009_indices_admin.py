@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_slot_atendimento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['estado', 'cidade'], name='cliente_estado_cidade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['created_at'], name='cliente_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Índice FTS5 do arquivo, igual ao de core_atendimento (migração 0004), e os
+# triggers que o mantêm; o SQL fica aqui para a migração não depender da
+# versão atual de core.busca.
+SQL_CRIAR_FTS = """
+CREATE VIRTUAL TABLE core_atendimentoarquivado_fts USING fts5(
+    cliente_nome, descricao,
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)
+"""
+
+SQL_TRIGGERS_FTS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_ai AFTER INSERT ON core_atendimentoarquivado BEGIN
+        INSERT INTO core_atendimentoarquivado_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_ad AFTER DELETE ON core_atendimentoarquivado BEGIN
+        DELETE FROM core_atendimentoarquivado_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_arquivado_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimentoarquivado_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimentoarquivado WHERE cliente_id = new.id);
+    END
+    """,
+]
+
+SQL_REMOVER_FTS = [
+    'DROP TRIGGER IF EXISTS core_cliente_nome_arquivado_fts_au',
+    'DROP TRIGGER IF EXISTS core_atendimentoarquivado_fts_ad',
+    'DROP TRIGGER IF EXISTS core_atendimentoarquivado_fts_ai',
+    'DROP TABLE IF EXISTS core_atendimentoarquivado_fts',
+]
+
+
+def criar_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(SQL_CRIAR_FTS)
+    for sql in SQL_TRIGGERS_FTS:
+        schema_editor.execute(sql)
+
+
+def remover_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_REMOVER_FTS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_admin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtendimentoArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data_hora', models.DateTimeField(verbose_name='Data e Hora do Atendimento')),
+                ('descricao', models.TextField(verbose_name='Descrição do Atendimento')),
+                ('status', models.CharField(choices=[('agendado', 'Agendado'), ('em_andamento', 'Em Andamento'), ('concluido', 'Concluído'), ('cancelado', 'Cancelado')], max_length=20, verbose_name='Status')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('arquivado_em', models.DateTimeField(verbose_name='Arquivado em')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.cliente', verbose_name='Cliente')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Atendido por')),
+            ],
+            options={
+                'verbose_name': 'Atendimento arquivado',
+                'verbose_name_plural': 'Atendimentos arquivados',
+                'ordering': ['-data_hora'],
+                'indexes': [models.Index(fields=['data_hora', 'id'], name='arquivado_data_hora_id_idx')],
+            },
+        ),
+        migrations.RunPython(criar_fts, remover_fts),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_arquivo_atendimentos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='excluido_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='atendimento',
+            index=models.Index(fields=['cliente', 'data_hora'], name='atendimento_cliente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(condition=models.Q(('excluido_em__isnull', False)), fields=['excluido_em'], name='cliente_excluido_em_idx'),
+        ),
+    ]
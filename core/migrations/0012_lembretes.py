@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_exclusao_clientes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='atendimento',
+            name='status',
+            field=models.CharField(choices=[('agendado', 'Agendado'), ('em_andamento', 'Em Andamento'), ('concluido', 'Concluído'), ('cancelado', 'Cancelado'), ('atrasado', 'Atrasado')], default='agendado', max_length=20, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='atendimentoarquivado',
+            name='status',
+            field=models.CharField(choices=[('agendado', 'Agendado'), ('em_andamento', 'Em Andamento'), ('concluido', 'Concluído'), ('cancelado', 'Cancelado'), ('atrasado', 'Atrasado')], max_length=20, verbose_name='Status'),
+        ),
+        migrations.CreateModel(
+            name='Lembrete',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_hora', models.DateTimeField(verbose_name='Horário do atendimento')),
+                ('situacao', models.CharField(choices=[('pendente', 'Pendente'), ('enviado', 'Enviado'), ('descartado', 'Descartado'), ('falhou', 'Falhou')], default='pendente', max_length=20, verbose_name='Situação')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('erro', models.CharField(blank=True, max_length=200, verbose_name='Último erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True, verbose_name='Processado em')),
+                ('atendimento', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='lembretes', to='core.atendimento', verbose_name='Atendimento')),
+            ],
+            options={
+                'verbose_name': 'Lembrete',
+                'verbose_name_plural': 'Lembretes',
+                'ordering': ['-id'],
+                'indexes': [models.Index(condition=models.Q(('situacao', 'pendente')), fields=['id'], name='lembrete_pendente_idx'), models.Index(fields=['processado_em'], name='lembrete_processado_em_idx')],
+                'constraints': [models.UniqueConstraint(fields=('atendimento', 'data_hora'), name='lembrete_atendimento_data_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,169 @@
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Cópia de core.models.chave_nome na época desta migração
+PARTICULAS_NOME = {'da', 'das', 'de', 'di', 'do', 'dos', 'du', 'e'}
+
+
+def chave_nome(nome):
+    sem_acentos = unicodedata.normalize('NFKD', nome or '').encode('ascii', 'ignore').decode('ascii')
+    palavras = re.findall(r'[a-z0-9]+', sem_acentos.lower())
+    return ' '.join(palavra for palavra in palavras if palavra not in PARTICULAS_NOME)
+
+# Triggers do FTS até a migração 0012 (0004 e 0010). O SQLite recria
+# core_cliente ao incluir nome_chave, então eles saem antes e voltam depois,
+# junto com o que passa a acompanhar a mesclagem de duplicados no arquivo.
+# O SQL fica copiado aqui para a migração não depender de core.busca.
+SQL_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ai AFTER INSERT ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ad AFTER DELETE ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_fts_au AFTER UPDATE OF nome, email, cpf, telefone ON core_cliente BEGIN
+        INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nome, email, cpf, telefone)
+        VALUES ('delete', old.id, old.nome, old.email, old.cpf, old.telefone);
+        INSERT INTO core_cliente_fts(rowid, nome, email, cpf, telefone)
+        VALUES (new.id, new.nome, new.email, new.cpf, new.telefone);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ai AFTER INSERT ON core_atendimento BEGIN
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_ad AFTER DELETE ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_fts_au AFTER UPDATE OF cliente_id, descricao ON core_atendimento BEGIN
+        DELETE FROM core_atendimento_fts WHERE rowid = old.id;
+        INSERT INTO core_atendimento_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_atendimento_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimento_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimento WHERE cliente_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_ai AFTER INSERT ON core_atendimentoarquivado BEGIN
+        INSERT INTO core_atendimentoarquivado_fts(rowid, cliente_nome, descricao)
+        SELECT new.id, c.nome, new.descricao FROM core_cliente c WHERE c.id = new.cliente_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_ad AFTER DELETE ON core_atendimentoarquivado BEGIN
+        DELETE FROM core_atendimentoarquivado_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_nome_arquivado_fts_au AFTER UPDATE OF nome ON core_cliente BEGIN
+        UPDATE core_atendimentoarquivado_fts SET cliente_nome = new.nome
+        WHERE rowid IN (SELECT id FROM core_atendimentoarquivado WHERE cliente_id = new.id);
+    END
+    """,
+]
+
+SQL_TRIGGERS_NOVOS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_fts_au AFTER UPDATE OF cliente_id ON core_atendimentoarquivado BEGIN
+        UPDATE core_atendimentoarquivado_fts SET cliente_nome = (SELECT nome FROM core_cliente WHERE id = new.cliente_id)
+        WHERE rowid = new.id;
+    END
+    """,
+]
+
+NOMES_TRIGGERS = [
+    'core_cliente_fts_ai',
+    'core_cliente_fts_ad',
+    'core_cliente_fts_au',
+    'core_atendimento_fts_ai',
+    'core_atendimento_fts_ad',
+    'core_atendimento_fts_au',
+    'core_cliente_nome_atendimento_fts_au',
+    'core_atendimentoarquivado_fts_ai',
+    'core_atendimentoarquivado_fts_ad',
+    'core_cliente_nome_arquivado_fts_au',
+    'core_atendimentoarquivado_fts_au',
+]
+
+
+def _executar(comandos):
+    def operacao(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return operacao
+
+
+criar_triggers_anteriores = _executar(SQL_TRIGGERS)
+criar_triggers = _executar(SQL_TRIGGERS + SQL_TRIGGERS_NOVOS)
+remover_triggers = _executar([f'DROP TRIGGER IF EXISTS {nome}' for nome in NOMES_TRIGGERS])
+
+
+def preencher_nome_chave(apps, schema_editor):
+    Cliente = apps.get_model('core', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.only('nome').iterator(chunk_size=2000):
+        cliente.nome_chave = chave_nome(cliente.nome)
+        lote.append(cliente)
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['nome_chave'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['nome_chave'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_lembretes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_triggers, criar_triggers_anteriores),
+        migrations.AddField(
+            model_name='cliente',
+            name='nome_chave',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(criar_triggers, remover_triggers),
+        migrations.RunPython(preencher_nome_chave, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ParDuplicado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pontuacao', models.FloatField(verbose_name='Pontuação')),
+                ('motivos', models.CharField(max_length=100, verbose_name='Motivos')),
+                ('descartado', models.BooleanField(default=False, verbose_name='Não é duplicado')),
+                ('encontrado_em', models.DateTimeField(verbose_name='Encontrado em')),
+                ('cliente', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cliente', verbose_name='Cliente')),
+                ('duplicado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cliente', verbose_name='Possível duplicado')),
+            ],
+            options={
+                'verbose_name': 'Possível duplicado',
+                'verbose_name_plural': 'Possíveis duplicados',
+                'ordering': ['-pontuacao', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('cliente', 'duplicado'), name='par_duplicado_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,264 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:19
+
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Totais dos relatórios (core.relatorios), mantidos por triggers no SQLite
+# (por linha) e no PostgreSQL (por comando). O SQL fica copiado aqui para a
+# migração não depender da versão atual de core.relatorios; {deslocamento}
+# e {fuso} vêm de TIME_ZONE.
+SQL_TRIGGERS_SQLITE = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_relatorio_ai AFTER INSERT ON core_cliente BEGIN
+        INSERT INTO core_relatorioclientes (estado, cidade, total)
+        SELECT new.estado, new.cidade, 1 WHERE new.excluido_em IS NULL
+        ON CONFLICT (estado, cidade) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_relatorio_ad AFTER DELETE ON core_cliente BEGIN
+        INSERT INTO core_relatorioclientes (estado, cidade, total)
+        SELECT old.estado, old.cidade, -1 WHERE old.excluido_em IS NULL
+        ON CONFLICT (estado, cidade) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_cliente_relatorio_au AFTER UPDATE OF estado, cidade, excluido_em ON core_cliente WHEN old.estado IS NOT new.estado OR old.cidade IS NOT new.cidade OR (old.excluido_em IS NULL) IS NOT (new.excluido_em IS NULL) BEGIN
+        INSERT INTO core_relatorioclientes (estado, cidade, total)
+        SELECT old.estado, old.cidade, -1 WHERE old.excluido_em IS NULL
+        ON CONFLICT (estado, cidade) DO UPDATE SET total = total + excluded.total;
+        INSERT INTO core_relatorioclientes (estado, cidade, total)
+        SELECT new.estado, new.cidade, 1 WHERE new.excluido_em IS NULL
+        ON CONFLICT (estado, cidade) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_relatorio_ai AFTER INSERT ON core_atendimento BEGIN
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(new.data_hora, '{deslocamento}', 'start of month'), new.status, new.usuario_id, 1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_relatorio_ad AFTER DELETE ON core_atendimento BEGIN
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(old.data_hora, '{deslocamento}', 'start of month'), old.status, old.usuario_id, -1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimento_relatorio_au AFTER UPDATE OF data_hora, status, usuario_id ON core_atendimento WHEN date(old.data_hora, '{deslocamento}', 'start of month') IS NOT date(new.data_hora, '{deslocamento}', 'start of month') OR old.status IS NOT new.status OR old.usuario_id IS NOT new.usuario_id BEGIN
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(old.data_hora, '{deslocamento}', 'start of month'), old.status, old.usuario_id, -1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(new.data_hora, '{deslocamento}', 'start of month'), new.status, new.usuario_id, 1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_relatorio_ai AFTER INSERT ON core_atendimentoarquivado BEGIN
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(new.data_hora, '{deslocamento}', 'start of month'), new.status, new.usuario_id, 1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_relatorio_ad AFTER DELETE ON core_atendimentoarquivado BEGIN
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(old.data_hora, '{deslocamento}', 'start of month'), old.status, old.usuario_id, -1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_atendimentoarquivado_relatorio_au AFTER UPDATE OF data_hora, status, usuario_id ON core_atendimentoarquivado WHEN date(old.data_hora, '{deslocamento}', 'start of month') IS NOT date(new.data_hora, '{deslocamento}', 'start of month') OR old.status IS NOT new.status OR old.usuario_id IS NOT new.usuario_id BEGIN
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(old.data_hora, '{deslocamento}', 'start of month'), old.status, old.usuario_id, -1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES (date(new.data_hora, '{deslocamento}', 'start of month'), new.status, new.usuario_id, 1)
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;
+    END
+    """,
+]
+
+SQL_TRIGGERS_POSTGRES = [
+    """
+    CREATE OR REPLACE FUNCTION core_relatorio_clientes() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO core_relatorioclientes AS r (estado, cidade, total)
+            SELECT estado, cidade, SUM(delta) FROM (SELECT estado, cidade, 1 AS delta FROM novas WHERE excluido_em IS NULL) AS d
+            GROUP BY estado, cidade HAVING SUM(delta) <> 0 ORDER BY estado, cidade
+            ON CONFLICT (estado, cidade) DO UPDATE SET total = r.total + excluded.total;
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO core_relatorioclientes AS r (estado, cidade, total)
+            SELECT estado, cidade, SUM(delta) FROM (SELECT estado, cidade, -1 AS delta FROM antigas WHERE excluido_em IS NULL) AS d
+            GROUP BY estado, cidade HAVING SUM(delta) <> 0 ORDER BY estado, cidade
+            ON CONFLICT (estado, cidade) DO UPDATE SET total = r.total + excluded.total;
+        ELSE
+            INSERT INTO core_relatorioclientes AS r (estado, cidade, total)
+            SELECT estado, cidade, SUM(delta) FROM (SELECT estado, cidade, -1 AS delta FROM antigas WHERE excluido_em IS NULL UNION ALL SELECT estado, cidade, 1 AS delta FROM novas WHERE excluido_em IS NULL) AS d
+            GROUP BY estado, cidade HAVING SUM(delta) <> 0 ORDER BY estado, cidade
+            ON CONFLICT (estado, cidade) DO UPDATE SET total = r.total + excluded.total;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION core_relatorio_atendimentos() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO core_relatorioatendimentos AS r (mes, status, usuario_id, total)
+            SELECT mes, status, usuario_id, SUM(delta) FROM (SELECT date_trunc('month', data_hora AT TIME ZONE '{fuso}')::date AS mes, status, usuario_id, 1 AS delta FROM novas) AS d
+            GROUP BY mes, status, usuario_id HAVING SUM(delta) <> 0 ORDER BY mes, status, usuario_id
+            ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = r.total + excluded.total;
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO core_relatorioatendimentos AS r (mes, status, usuario_id, total)
+            SELECT mes, status, usuario_id, SUM(delta) FROM (SELECT date_trunc('month', data_hora AT TIME ZONE '{fuso}')::date AS mes, status, usuario_id, -1 AS delta FROM antigas) AS d
+            GROUP BY mes, status, usuario_id HAVING SUM(delta) <> 0 ORDER BY mes, status, usuario_id
+            ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = r.total + excluded.total;
+        ELSE
+            INSERT INTO core_relatorioatendimentos AS r (mes, status, usuario_id, total)
+            SELECT mes, status, usuario_id, SUM(delta) FROM (SELECT date_trunc('month', data_hora AT TIME ZONE '{fuso}')::date AS mes, status, usuario_id, -1 AS delta FROM antigas UNION ALL SELECT date_trunc('month', data_hora AT TIME ZONE '{fuso}')::date AS mes, status, usuario_id, 1 AS delta FROM novas) AS d
+            GROUP BY mes, status, usuario_id HAVING SUM(delta) <> 0 ORDER BY mes, status, usuario_id
+            ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = r.total + excluded.total;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_cliente_relatorio_ai AFTER INSERT ON core_cliente REFERENCING NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_clientes()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_cliente_relatorio_ad AFTER DELETE ON core_cliente REFERENCING OLD TABLE AS antigas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_clientes()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_cliente_relatorio_au AFTER UPDATE ON core_cliente REFERENCING OLD TABLE AS antigas NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_clientes()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_atendimento_relatorio_ai AFTER INSERT ON core_atendimento REFERENCING NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_atendimentos()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_atendimento_relatorio_ad AFTER DELETE ON core_atendimento REFERENCING OLD TABLE AS antigas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_atendimentos()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_atendimento_relatorio_au AFTER UPDATE ON core_atendimento REFERENCING OLD TABLE AS antigas NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_atendimentos()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_atendimentoarquivado_relatorio_ai AFTER INSERT ON core_atendimentoarquivado REFERENCING NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_atendimentos()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_atendimentoarquivado_relatorio_ad AFTER DELETE ON core_atendimentoarquivado REFERENCING OLD TABLE AS antigas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_atendimentos()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER core_atendimentoarquivado_relatorio_au AFTER UPDATE ON core_atendimentoarquivado REFERENCING OLD TABLE AS antigas NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION core_relatorio_atendimentos()
+    """,
+]
+
+SQL_PREENCHER_CLIENTES = """
+    INSERT INTO core_relatorioclientes (estado, cidade, total)
+    SELECT estado, cidade, COUNT(*) FROM core_cliente WHERE excluido_em IS NULL GROUP BY estado, cidade
+"""
+
+SQL_PREENCHER_ATENDIMENTOS = """
+    INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+    SELECT mes, status, usuario_id, COUNT(*) FROM (
+        SELECT {mes} AS mes, status, usuario_id FROM core_atendimento
+        UNION ALL
+        SELECT {mes} AS mes, status, usuario_id FROM core_atendimentoarquivado
+    ) AS a
+    GROUP BY mes, status, usuario_id
+"""
+
+MES = {
+    'sqlite': "date(data_hora, '{deslocamento}', 'start of month')",
+    'postgresql': "date_trunc('month', data_hora AT TIME ZONE '{fuso}')::date",
+}
+
+SQL_TRIGGERS = {
+    'sqlite': SQL_TRIGGERS_SQLITE,
+    'postgresql': SQL_TRIGGERS_POSTGRES,
+}
+
+TRIGGERS = [
+    (tabela, f'{tabela}_relatorio_{evento}')
+    for tabela in ('core_cliente', 'core_atendimento', 'core_atendimentoarquivado') for evento in ('ai', 'ad', 'au')
+]
+
+
+def _parametros():
+    agora = datetime.now(ZoneInfo(settings.TIME_ZONE))
+    return {
+        'deslocamento': f'{int(agora.utcoffset().total_seconds() // 60):+d} minutes',
+        'fuso': settings.TIME_ZONE.replace("'", "''"),
+    }
+
+
+def criar(apps, schema_editor):
+    # Em outros bancos não há triggers: os totais vêm de manage.py reconstruir_relatorios
+    vendor = schema_editor.connection.vendor
+    if vendor not in SQL_TRIGGERS:
+        return
+    parametros = _parametros()
+    schema_editor.execute(SQL_PREENCHER_CLIENTES)
+    schema_editor.execute(SQL_PREENCHER_ATENDIMENTOS.format(mes=MES[vendor].format(**parametros)))
+    for sql in SQL_TRIGGERS[vendor]:
+        schema_editor.execute(sql.format(**parametros))
+
+
+def remover(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in SQL_TRIGGERS:
+        return
+    for tabela, nome in TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {nome}' + (f' ON {tabela}' if vendor == 'postgresql' else ''))
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP FUNCTION IF EXISTS core_relatorio_clientes(), core_relatorio_atendimentos()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_duplicados'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioClientes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(max_length=2, verbose_name='Estado')),
+                ('cidade', models.CharField(max_length=100, verbose_name='Cidade')),
+                ('total', models.IntegerField(default=0, verbose_name='Total')),
+            ],
+            options={
+                'verbose_name': 'Total de clientes',
+                'verbose_name_plural': 'Totais de clientes',
+                'constraints': [models.UniqueConstraint(fields=('estado', 'cidade'), name='relatorio_clientes_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatorioAtendimentos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('status', models.CharField(choices=[('agendado', 'Agendado'), ('em_andamento', 'Em Andamento'), ('concluido', 'Concluído'), ('cancelado', 'Cancelado'), ('atrasado', 'Atrasado')], max_length=20, verbose_name='Status')),
+                ('total', models.IntegerField(default=0, verbose_name='Total')),
+                ('usuario', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Atendente')),
+            ],
+            options={
+                'verbose_name': 'Total de atendimentos',
+                'verbose_name_plural': 'Totais de atendimentos',
+                'constraints': [models.UniqueConstraint(fields=('mes', 'status', 'usuario'), name='relatorio_atendimentos_unico')],
+            },
+        ),
+        migrations.RunPython(criar, remover),
+    ]
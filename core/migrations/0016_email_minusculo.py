@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:49
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_token_api'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='cliente_email_lower_idx'),
+        ),
+    ]
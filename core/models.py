@@ -1,6 +1,27 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
+import re
+import unicodedata
+
+def so_digitos(valor):
+    return re.sub(r'\D', '', valor or '')
+
+# Partículas ignoradas na comparação de nomes ("José da Silva" = "Jose Silva")
+PARTICULAS_NOME = {'da', 'das', 'de', 'di', 'do', 'dos', 'du', 'e'}
+
+def chave_nome(nome):
+    """Nome sem acentos, pontuação e partículas, em minúsculas: "José da Silva" vira "jose silva"."""
+    sem_acentos = unicodedata.normalize('NFKD', nome or '').encode('ascii', 'ignore').decode('ascii')
+    palavras = re.findall(r'[a-z0-9]+', sem_acentos.lower())
+    return ' '.join(palavra for palavra in palavras if palavra not in PARTICULAS_NOME)
+
+class ClientesVisiveisManager(models.Manager):
+    """Esconde os clientes excluídos que ainda aguardam a remoção definitiva (core.exclusao)."""
+    def get_queryset(self):
+        return super().get_queryset().filter(excluido_em__isnull=True)
 
 class Cliente(models.Model):
     nome = models.CharField(max_length=100, verbose_name="Nome completo")
@@ -30,16 +51,69 @@ class Cliente(models.Model):
     cidade = models.CharField(max_length=100, verbose_name="Cidade")
     estado = models.CharField(max_length=2, verbose_name="Estado")
     
+    # Versões só com dígitos de cpf, telefone e cep, preenchidas no save().
+    # São indexadas para busca exata ou por prefixo ("12345678900" encontra
+    # "123.456.789-00") sem varrer a tabela.
+    cpf_digitos = models.CharField(max_length=11, unique=True, editable=False)
+    telefone_digitos = models.CharField(max_length=11, db_index=True, editable=False)
+    cep_digitos = models.CharField(max_length=8, db_index=True, editable=False)
+    # Nome normalizado (chave_nome), em ordem no índice para a busca de
+    # cadastros duplicados (core.duplicados)
+    nome_chave = models.CharField(max_length=100, db_index=True, editable=False)
+    
+    # Preenchido na exclusão: o cliente some na hora e os atendimentos são
+    # removidos em lotes depois (core.exclusao)
+    excluido_em = models.DateTimeField(null=True, blank=True, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ClientesVisiveisManager()
+    # Inclui os excluídos; para a remoção e as verificações de unicidade
+    todos = models.Manager()
+    
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nome']
+        indexes = [
+            # Paginação por cursor da lista de clientes
+            models.Index(fields=['nome', 'id'], name='cliente_nome_id_idx'),
+            # Filtro de cidade do admin (DISTINCT direto no índice) e navegação por data
+            models.Index(fields=['estado', 'cidade'], name='cliente_estado_cidade_idx'),
+            models.Index(fields=['created_at'], name='cliente_created_at_idx'),
+            # Autocomplete por prefixo do email sem diferenciar maiúsculas (core.busca)
+            models.Index(Lower('email'), name='cliente_email_lower_idx'),
+            # Só os excluídos à espera da remoção: índice pequeno, usado pelos managers
+            models.Index(fields=['excluido_em'], name='cliente_excluido_em_idx', condition=Q(excluido_em__isnull=False)),
+        ]
     
     def __str__(self):
         return self.nome
+    
+    CAMPOS_DERIVADOS = {'cpf': 'cpf_digitos', 'telefone': 'telefone_digitos', 'cep': 'cep_digitos', 'nome': 'nome_chave'}
+    
+    def atualizar_derivados(self):
+        self.cpf_digitos = so_digitos(self.cpf)
+        self.telefone_digitos = so_digitos(self.telefone)
+        self.cep_digitos = so_digitos(self.cep)
+        self.nome_chave = chave_nome(self.nome)
+    
+    def save(self, *args, **kwargs):
+        self.atualizar_derivados()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.CAMPOS_DERIVADOS.values()}
+        super().save(*args, **kwargs)
+
+class AtendimentosVisiveisManager(models.Manager):
+    """
+    Esconde os atendimentos de clientes excluídos que aguardam a remoção. A
+    subconsulta só lê o índice parcial de excluido_em, que fica quase vazio.
+    """
+    def get_queryset(self):
+        excluidos = Cliente.todos.filter(excluido_em__isnull=False).values('pk')
+        return super().get_queryset().exclude(cliente__in=excluidos)
 
 class Atendimento(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, verbose_name="Cliente")
@@ -52,16 +126,282 @@ class Atendimento(models.Model):
         ('em_andamento', 'Em Andamento'),
         ('concluido', 'Concluído'),
         ('cancelado', 'Cancelado'),
+        # Agendados cujo horário passou sem atendimento (core.lembretes)
+        ('atrasado', 'Atrasado'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='agendado', verbose_name="Status")
+    # Status que ocupam o horário na agenda
+    STATUS_ATIVOS = ('agendado', 'em_andamento')
+    STATUS_ENCERRADOS = ('concluido', 'cancelado')
+    
+    # Horário reservado (data_hora truncada no minuto) enquanto o atendimento
+    # está ativo; NULL caso contrário. A restrição única garante no próprio
+    # banco que dois atendimentos ativos não ocupem o mesmo horário.
+    slot = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # AtendimentoArquivado tem True; a lista com histórico mostra os dois
+    arquivado = False
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AtendimentosVisiveisManager()
+    todos = models.Manager()
+    
     class Meta:
         verbose_name = "Atendimento"
         verbose_name_plural = "Atendimentos"
         ordering = ['-data_hora']
+        indexes = [
+            # Paginação por cursor da lista de atendimentos
+            models.Index(fields=['data_hora', 'id'], name='atendimento_data_hora_id_idx'),
+            # Consultas por status em um intervalo de datas (próximos, agenda, atrasados)
+            models.Index(fields=['status', 'data_hora'], name='atendimento_status_data_idx'),
+            # Atendimentos futuros de um cliente sem ler o histórico dele (core.exclusao)
+            models.Index(fields=['cliente', 'data_hora'], name='atendimento_cliente_data_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['slot'], name='atendimento_slot_unico'),
+        ]
     
     def __str__(self):
         return f"{self.cliente.nome} - {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
+    
+    # Campos cujo valor carregado do banco fica guardado em _originais, para que
+    # os sinais saibam o que mudou (ex.: o dia do atendimento nos contadores)
+    CAMPOS_RASTREADOS = ('data_hora',)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._originais = {campo: instance.__dict__.get(campo) for campo in cls.CAMPOS_RASTREADOS}
+        return instance
+    
+    @classmethod
+    def calcular_slot(cls, data_hora, status):
+        if data_hora is None or status not in cls.STATUS_ATIVOS:
+            return None
+        return data_hora.replace(second=0, microsecond=0)
+    
+    def save(self, *args, **kwargs):
+        self.slot = self.calcular_slot(self.data_hora, self.status)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'slot'}
+        super().save(*args, **kwargs)
+        self._originais = {campo: self.__dict__.get(campo) for campo in self.CAMPOS_RASTREADOS}
+    
+    def valor_original(self, campo):
+        """Valor de `campo` quando o objeto foi carregado (ou salvo pela última vez)."""
+        return getattr(self, '_originais', {}).get(campo)
+
+class AtendimentoArquivado(models.Model):
+    """
+    Atendimentos concluídos ou cancelados antigos, movidos de Atendimento por
+    core.arquivo com o mesmo id. Ficam fora das consultas do dia a dia; a lista
+    de atendimentos só os inclui com ?historico=1.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, verbose_name="Cliente")
+    data_hora = models.DateTimeField(verbose_name="Data e Hora do Atendimento")
+    descricao = models.TextField(verbose_name="Descrição do Atendimento")
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Atendido por")
+    status = models.CharField(max_length=20, choices=Atendimento.STATUS_CHOICES, verbose_name="Status")
+    # Valores originais do atendimento, preservados no arquivamento
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    arquivado_em = models.DateTimeField(verbose_name="Arquivado em")
+    
+    # Distingue as linhas do arquivo nos templates da lista de atendimentos
+    arquivado = True
+    
+    objects = AtendimentosVisiveisManager()
+    todos = models.Manager()
+    
+    class Meta:
+        verbose_name = "Atendimento arquivado"
+        verbose_name_plural = "Atendimentos arquivados"
+        ordering = ['-data_hora']
+        indexes = [
+            # Paginação por cursor da lista de atendimentos com histórico
+            models.Index(fields=['data_hora', 'id'], name='arquivado_data_hora_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cliente.nome} - {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
+
+class Lembrete(models.Model):
+    """
+    Lembrete de um atendimento agendado, enfileirado e entregue por
+    core.lembretes. Há um por atendimento e horário: remarcar gera outro.
+    """
+    SITUACAO_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviado', 'Enviado'),
+        ('descartado', 'Descartado'),
+        ('falhou', 'Falhou'),
+    ]
+    # Sem restrição no banco: o arquivamento e a remoção de clientes apagam
+    # atendimentos com DELETE direto, e os lembretes órfãos são descartados
+    # no envio. A restrição única abaixo já indexa atendimento_id.
+    atendimento = models.ForeignKey(
+        Atendimento, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name='lembretes', verbose_name="Atendimento"
+    )
+    data_hora = models.DateTimeField(verbose_name="Horário do atendimento")
+    situacao = models.CharField(max_length=20, choices=SITUACAO_CHOICES, default='pendente', verbose_name="Situação")
+    tentativas = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")
+    erro = models.CharField(max_length=200, blank=True, verbose_name="Último erro")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processado_em = models.DateTimeField(null=True, blank=True, verbose_name="Processado em")
+    
+    class Meta:
+        verbose_name = "Lembrete"
+        verbose_name_plural = "Lembretes"
+        ordering = ['-id']
+        indexes = [
+            # Fila de envio: só os pendentes, em ordem de id
+            models.Index(fields=['id'], name='lembrete_pendente_idx', condition=Q(situacao='pendente')),
+            models.Index(fields=['processado_em'], name='lembrete_processado_em_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['atendimento', 'data_hora'], name='lembrete_atendimento_data_unico'),
+        ]
+    
+    def __str__(self):
+        return f"Lembrete {self.atendimento_id} - {self.get_situacao_display()}"
+
+class ParDuplicado(models.Model):
+    """
+    Dois clientes que parecem ser a mesma pessoa, encontrados por
+    core.duplicados. `cliente` é o cadastro mais antigo (menor id).
+    """
+    # A restrição única já indexa cliente_id
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, db_index=False, related_name='+', verbose_name="Cliente")
+    duplicado = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+', verbose_name="Possível duplicado")
+    pontuacao = models.FloatField(verbose_name="Pontuação")
+    motivos = models.CharField(max_length=100, verbose_name="Motivos")
+    # Marcado no admin: o par continua na tabela para não voltar ao relatório
+    descartado = models.BooleanField(default=False, verbose_name="Não é duplicado")
+    encontrado_em = models.DateTimeField(verbose_name="Encontrado em")
+    
+    class Meta:
+        verbose_name = "Possível duplicado"
+        verbose_name_plural = "Possíveis duplicados"
+        ordering = ['-pontuacao', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['cliente', 'duplicado'], name='par_duplicado_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cliente_id} / {self.duplicado_id} ({self.pontuacao:.0%})"
+
+class RelatorioClientes(models.Model):
+    """Clientes por estado e cidade, mantido por triggers (core.relatorios)."""
+    estado = models.CharField(max_length=2, verbose_name="Estado")
+    cidade = models.CharField(max_length=100, verbose_name="Cidade")
+    total = models.IntegerField(default=0, verbose_name="Total")
+    
+    class Meta:
+        verbose_name = "Total de clientes"
+        verbose_name_plural = "Totais de clientes"
+        constraints = [
+            models.UniqueConstraint(fields=['estado', 'cidade'], name='relatorio_clientes_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cidade}/{self.estado} = {self.total}"
+
+class RelatorioAtendimentos(models.Model):
+    """
+    Atendimentos, inclusive os arquivados, por mês, status e atendente,
+    mantido por triggers (core.relatorios).
+    """
+    mes = models.DateField(verbose_name="Mês")  # primeiro dia do mês
+    status = models.CharField(max_length=20, choices=Atendimento.STATUS_CHOICES, verbose_name="Status")
+    # Sem restrição no banco: os totais de um atendente removido continuam no histórico
+    usuario = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name='+', verbose_name="Atendente"
+    )
+    total = models.IntegerField(default=0, verbose_name="Total")
+    
+    class Meta:
+        verbose_name = "Total de atendimentos"
+        verbose_name_plural = "Totais de atendimentos"
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'status', 'usuario'], name='relatorio_atendimentos_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.mes:%m/%Y} {self.status} {self.usuario_id} = {self.total}"
+
+class Contador(models.Model):
+    """
+    Contadores mantidos pelos sinais de Cliente e Atendimento (ver core.contadores),
+    para que o dashboard não precise de COUNT(*) a cada acesso.
+    """
+    chave = models.CharField(max_length=100, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Contador"
+        verbose_name_plural = "Contadores"
+    
+    def __str__(self):
+        return f"{self.chave} = {self.valor}"
+
+class CepCache(models.Model):
+    cep = models.CharField(max_length=8, primary_key=True, verbose_name="CEP")
+    logradouro = models.CharField(max_length=200, blank=True, verbose_name="Logradouro")
+    bairro = models.CharField(max_length=100, blank=True, verbose_name="Bairro")
+    cidade = models.CharField(max_length=100, blank=True, verbose_name="Cidade")
+    estado = models.CharField(max_length=2, blank=True, verbose_name="Estado")
+    encontrado = models.BooleanField(default=True, verbose_name="Encontrado")
+    consultado_em = models.DateTimeField(verbose_name="Consultado em")
+    
+    class Meta:
+        verbose_name = "CEP em cache"
+        verbose_name_plural = "CEPs em cache"
+    
+    def __str__(self):
+        return self.cep
+
+class CepLocal(models.Model):
+    # O CEP é guardado como inteiro (00000000 a 99999999) e usado como chave
+    # primária: busca exata e por prefixo são consultas diretas no índice.
+    cep = models.PositiveIntegerField(primary_key=True, verbose_name="CEP")
+    logradouro = models.CharField(max_length=200, blank=True, verbose_name="Logradouro")
+    bairro = models.CharField(max_length=100, blank=True, verbose_name="Bairro")
+    cidade = models.CharField(max_length=100, verbose_name="Cidade")
+    estado = models.CharField(max_length=2, verbose_name="Estado")
+    
+    class Meta:
+        verbose_name = "CEP da base local"
+        verbose_name_plural = "CEPs da base local"
+    
+    def __str__(self):
+        return self.cep_formatado
+    
+    @property
+    def cep_formatado(self):
+        cep = f'{self.cep:08d}'
+        return f'{cep[:5]}-{cep[5:]}'
+
+class TokenApi(models.Model):
+    """
+    Chave de acesso à API (/api/v1/) de um sistema integrado, enviada no
+    cabeçalho "Authorization: Token <chave>". Só o hash SHA-256 da chave é
+    guardado; ela aparece uma vez, ao ser criada (manage.py criar_token_api).
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tokens_api', verbose_name="Usuário")
+    nome = models.CharField(max_length=100, verbose_name="Nome")
+    chave_hash = models.CharField(max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Token da API"
+        verbose_name_plural = "Tokens da API"
+    
+    def __str__(self):
+        return f"{self.nome} ({self.usuario})"
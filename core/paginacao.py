@@ -0,0 +1,192 @@
+"""
+Paginação por cursor (keyset).
+
+Em vez de COUNT(*) + OFFSET, cada página continua a partir dos valores de
+ordenação do último (ou primeiro) item da página anterior:
+
+    WHERE (nome, id) > (:nome, :id) ORDER BY nome, id LIMIT n
+
+Com um índice sobre os campos de ordenação, a página 5000 custa o mesmo que a
+primeira, e inserções não deslocam os itens entre páginas.
+"""
+import hashlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from operator import attrgetter
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+SALT = 'core.paginacao'
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+class Pagina:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, total=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Total aproximado (pode estar alguns segundos desatualizado) ou None
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Pagina `queryset` pela ordenação `ordering` (ex.: ('nome', 'id')). O último
+    campo deve ser único (normalmente 'id') para que a ordem seja total, e
+    deve existir um índice com os mesmos campos.
+
+    Campos com '-' na frente são ordenados de forma decrescente.
+    `contagem` é o queryset contado no total aproximado, se não for o próprio
+    `queryset` (ex.: uma versão sem filtros que impedem o COUNT só no índice).
+    """
+
+    def __init__(self, queryset, ordering, per_page, total_aproximado=False, total_cache_timeout=60, contagem=None):
+        self.queryset = queryset
+        self.contagem = queryset if contagem is None else contagem
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.total_aproximado = total_aproximado
+        self.total_cache_timeout = total_cache_timeout
+        self._campos = [
+            queryset.model._meta.get_field(campo.lstrip('-')) for campo in self.ordering
+        ]
+
+    # ---------- cursores ----------
+    def _valores(self, obj):
+        return [getattr(obj, campo.attname) for campo in self._campos]
+
+    def codificar_cursor(self, valores, direcao):
+        return signing.dumps(
+            {'v': [_serializar(valor) for valor in valores], 'd': direcao},
+            salt=SALT, compress=True,
+        )
+
+    def decodificar_cursor(self, cursor):
+        try:
+            dados = signing.loads(cursor, salt=SALT)
+            valores = [campo.to_python(valor) for campo, valor in zip(self._campos, dados['v'], strict=True)]
+            direcao = dados['d']
+        except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+            raise CursorInvalido(str(e)) from e
+        if direcao not in ('p', 'a'):
+            raise CursorInvalido(direcao)
+        return valores, direcao
+
+    # ---------- consulta ----------
+    def _seek(self, valores, para_tras):
+        """(a, b, c) > (x, y, z) expandido em ORs, respeitando a direção de cada campo."""
+        condicao = Q()
+        iguais = Q()
+        for campo, valor in zip(self.ordering, valores):
+            nome = campo.lstrip('-')
+            crescente = not campo.startswith('-')
+            if para_tras:
+                crescente = not crescente
+            condicao |= iguais & Q(**{f'{nome}__{"gt" if crescente else "lt"}': valor})
+            iguais &= Q(**{nome: valor})
+        return condicao
+
+    def _ordenacao(self, para_tras):
+        if not para_tras:
+            return self.ordering
+        return tuple(campo[1:] if campo.startswith('-') else f'-{campo}' for campo in self.ordering)
+
+    def _buscar(self, queryset, valores, para_tras):
+        """Até per_page + 1 itens depois (ou antes) de `valores`, na ordem de leitura."""
+        if valores is not None:
+            queryset = queryset.filter(self._seek(valores, para_tras))
+        return list(queryset.order_by(*self._ordenacao(para_tras))[:self.per_page + 1])
+
+    def get_page(self, cursor=None):
+        valores, direcao = None, 'p'
+        if cursor:
+            try:
+                valores, direcao = self.decodificar_cursor(cursor)
+            except CursorInvalido:
+                valores, direcao = None, 'p'
+        para_tras = direcao == 'a'
+
+        itens = self._buscar(self.queryset, valores, para_tras)
+        tem_mais = len(itens) > self.per_page
+        itens = itens[:self.per_page]
+
+        if para_tras:
+            itens.reverse()
+            has_previous, has_next = tem_mais, True
+        else:
+            has_previous, has_next = valores is not None, tem_mais
+
+        next_cursor = self.codificar_cursor(self._valores(itens[-1]), 'p') if has_next and itens else None
+        previous_cursor = self.codificar_cursor(self._valores(itens[0]), 'a') if has_previous and itens else None
+        total = self.contar_aproximado() if self.total_aproximado else None
+        return Pagina(itens, has_next, has_previous, next_cursor, previous_cursor, total)
+
+    def contar_aproximado(self):
+        return contar_em_cache(self.contagem, self.total_cache_timeout)
+
+
+class KeysetPaginatorUniao(KeysetPaginator):
+    """
+    Pagina vários querysets como se fossem um só (ex.: atendimentos e
+    atendimentos arquivados). Os modelos precisam ter os campos de `ordering`,
+    e os valores do último campo não podem se repetir entre eles. Cada queryset
+    busca a página pelo próprio índice; os resultados são intercalados em memória.
+    """
+
+    def __init__(self, querysets, ordering, per_page, contagens=None, **kwargs):
+        # Querysets vazios (.none()) não geram consulta nem contagem
+        self.querysets = [qs for qs in querysets if not qs.query.is_empty()] or list(querysets[:1])
+        self.contagens = self.querysets if contagens is None else [qs for qs in contagens if not qs.query.is_empty()]
+        super().__init__(self.querysets[0], ordering, per_page, **kwargs)
+
+    def _buscar(self, queryset, valores, para_tras):
+        itens = []
+        for qs in self.querysets:
+            itens += super()._buscar(qs, valores, para_tras)
+        # Ordenações estáveis do último campo para o primeiro = ordenação pelos campos
+        for campo, ordem in reversed(list(zip(self._campos, self._ordenacao(para_tras)))):
+            itens.sort(key=attrgetter(campo.attname), reverse=ordem.startswith('-'))
+        return itens[:self.per_page + 1]
+
+    def contar_aproximado(self):
+        return sum(contar_em_cache(qs, self.total_cache_timeout) for qs in self.contagens)
+
+
+def contar_em_cache(queryset, timeout=60):
+    """COUNT(*) do queryset, guardado em cache por `timeout` segundos (chave pelo SQL)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    chave = 'paginacao:total:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+    return cache.get_or_set(chave, queryset.count, timeout)
+
+
+def _serializar(valor):
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
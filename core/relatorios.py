@@ -0,0 +1,339 @@
+"""
+Relatórios gerenciais servidos de tabelas de totais.
+
+Clientes por estado/cidade e atendimentos por mês, status e atendente ficam
+em RelatorioClientes e RelatorioAtendimentos, mantidas por triggers do banco
+em cada INSERT, UPDATE e DELETE, inclusive nas gravações em lote e com SQL
+direto (core.importacao, core.arquivo, core.exclusao, core.lembretes), que
+não passam pelos sinais. A página e os CSVs leem só essas tabelas, com
+algumas centenas de linhas: o tempo de resposta não depende do tamanho de
+core_cliente e core_atendimento.
+
+- SQLite: triggers por linha. O mês é o do fuso de TIME_ZONE com o
+  deslocamento em vigor quando os triggers são criados (o SQLite não conhece
+  fusos; o horário de verão não é considerado).
+- PostgreSQL: triggers por comando, com as tabelas de transição (as linhas
+  antigas e novas do comando), que somam cada grupo uma vez por comando. O
+  mês é calculado com AT TIME ZONE TIME_ZONE, com horário de verão.
+- Outros bancos: sem triggers; os totais só mudam com manage.py
+  reconstruir_relatorios (rodar periodicamente, ex.: via cron).
+
+Os atendimentos arquivados também contam; o arquivamento tira de uma tabela e
+põe na outra, e o total não muda. Clientes excluídos à espera da remoção
+(core.exclusao) saem dos totais na hora; os atendimentos deles, quando são
+apagados. reconstruir() recalcula tudo com a mesma regra de mês dos triggers.
+
+O SQL dos triggers está copiado na migração 0014; mudanças aqui precisam de
+uma migração que os recrie.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Atendimento, AtendimentoArquivado, Cliente, RelatorioAtendimentos, RelatorioClientes
+
+TABELAS_ATENDIMENTOS = ('core_atendimento', 'core_atendimentoarquivado')
+
+# (tabela, trigger); os nomes são os mesmos nos dois bancos
+TRIGGERS = [
+    (tabela, f'{tabela}_relatorio_{evento}')
+    for tabela in ('core_cliente', *TABELAS_ATENDIMENTOS) for evento in ('ai', 'ad', 'au')
+]
+
+FUNCOES_POSTGRES = ('core_relatorio_clientes', 'core_relatorio_atendimentos')
+
+
+# ========== SQLITE ==========
+
+def _deslocamento():
+    """Modificador de data do SQLite para o fuso de TIME_ZONE, ex.: '-180 minutes'."""
+    minutos = int(timezone.localtime().utcoffset().total_seconds() // 60)
+    return f'{minutos:+d} minutes'
+
+
+def _mes(linha):
+    return f"date({linha}.data_hora, '{_deslocamento()}', 'start of month')"
+
+
+def _somar_cliente(linha, delta):
+    return f"""
+        INSERT INTO core_relatorioclientes (estado, cidade, total)
+        SELECT {linha}.estado, {linha}.cidade, {delta} WHERE {linha}.excluido_em IS NULL
+        ON CONFLICT (estado, cidade) DO UPDATE SET total = total + excluded.total;"""
+
+
+def _somar_atendimento(linha, delta):
+    return f"""
+        INSERT INTO core_relatorioatendimentos (mes, status, usuario_id, total)
+        VALUES ({_mes(linha)}, {linha}.status, {linha}.usuario_id, {delta})
+        ON CONFLICT (mes, status, usuario_id) DO UPDATE SET total = total + excluded.total;"""
+
+
+def sql_triggers_sqlite():
+    sql = [
+        f'CREATE TRIGGER IF NOT EXISTS core_cliente_relatorio_ai AFTER INSERT ON core_cliente BEGIN'
+        f'{_somar_cliente("new", 1)}\nEND',
+        f'CREATE TRIGGER IF NOT EXISTS core_cliente_relatorio_ad AFTER DELETE ON core_cliente BEGIN'
+        f'{_somar_cliente("old", -1)}\nEND',
+        f'CREATE TRIGGER IF NOT EXISTS core_cliente_relatorio_au AFTER UPDATE OF estado, cidade, excluido_em ON core_cliente '
+        f'WHEN old.estado IS NOT new.estado OR old.cidade IS NOT new.cidade '
+        f'OR (old.excluido_em IS NULL) IS NOT (new.excluido_em IS NULL) BEGIN'
+        f'{_somar_cliente("old", -1)}{_somar_cliente("new", 1)}\nEND',
+    ]
+    for tabela in TABELAS_ATENDIMENTOS:
+        sql += [
+            f'CREATE TRIGGER IF NOT EXISTS {tabela}_relatorio_ai AFTER INSERT ON {tabela} BEGIN'
+            f'{_somar_atendimento("new", 1)}\nEND',
+            f'CREATE TRIGGER IF NOT EXISTS {tabela}_relatorio_ad AFTER DELETE ON {tabela} BEGIN'
+            f'{_somar_atendimento("old", -1)}\nEND',
+            # Só quando a linha muda de total (mudar o horário dentro do mês não conta)
+            f'CREATE TRIGGER IF NOT EXISTS {tabela}_relatorio_au AFTER UPDATE OF data_hora, status, usuario_id ON {tabela} '
+            f'WHEN {_mes("old")} IS NOT {_mes("new")} OR old.status IS NOT new.status '
+            f'OR old.usuario_id IS NOT new.usuario_id BEGIN'
+            f'{_somar_atendimento("old", -1)}{_somar_atendimento("new", 1)}\nEND',
+        ]
+    return sql
+
+
+# ========== POSTGRESQL ==========
+
+def _mes_postgres():
+    fuso = settings.TIME_ZONE.replace("'", "''")
+    return f"date_trunc('month', data_hora AT TIME ZONE '{fuso}')::date"
+
+
+def _somar_postgres(tabela, colunas, chave, fontes):
+    """
+    UPSERT em `tabela` com a soma, por `chave`, de -1 por linha antiga e +1 por
+    linha nova; os grupos que não mudaram (ex.: só a descrição foi editada)
+    ficam de fora. A ordem fixa evita deadlocks entre comandos simultâneos.
+    """
+    linhas = ' UNION ALL '.join(f'SELECT {colunas}, {delta} AS delta FROM {fonte}' for fonte, delta in fontes)
+    return f"""
+            INSERT INTO {tabela} AS r ({chave}, total)
+            SELECT {chave}, SUM(delta) FROM ({linhas}) AS d
+            GROUP BY {chave} HAVING SUM(delta) <> 0 ORDER BY {chave}
+            ON CONFLICT ({chave}) DO UPDATE SET total = r.total + excluded.total;"""
+
+
+def _funcao_postgres(nome, somar):
+    return f"""
+    CREATE OR REPLACE FUNCTION {nome}() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN{somar([('novas', 1)])}
+        ELSIF TG_OP = 'DELETE' THEN{somar([('antigas', -1)])}
+        ELSE{somar([('antigas', -1), ('novas', 1)])}
+        END IF;
+        RETURN NULL;
+    END
+    $$"""
+
+
+def sql_triggers_postgres():
+    def somar_clientes(fontes):
+        fontes = [(f'{fonte} WHERE excluido_em IS NULL', delta) for fonte, delta in fontes]
+        return _somar_postgres('core_relatorioclientes', 'estado, cidade', 'estado, cidade', fontes)
+
+    def somar_atendimentos(fontes):
+        return _somar_postgres(
+            'core_relatorioatendimentos', f'{_mes_postgres()} AS mes, status, usuario_id',
+            'mes, status, usuario_id', fontes,
+        )
+
+    sql = [
+        _funcao_postgres('core_relatorio_clientes', somar_clientes),
+        _funcao_postgres('core_relatorio_atendimentos', somar_atendimentos),
+    ]
+    for tabela, funcao in (
+        ('core_cliente', 'core_relatorio_clientes'),
+        *((tabela, 'core_relatorio_atendimentos') for tabela in TABELAS_ATENDIMENTOS),
+    ):
+        sql += [
+            f'CREATE OR REPLACE TRIGGER {tabela}_relatorio_ai AFTER INSERT ON {tabela} '
+            f'REFERENCING NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION {funcao}()',
+            f'CREATE OR REPLACE TRIGGER {tabela}_relatorio_ad AFTER DELETE ON {tabela} '
+            f'REFERENCING OLD TABLE AS antigas FOR EACH STATEMENT EXECUTE FUNCTION {funcao}()',
+            f'CREATE OR REPLACE TRIGGER {tabela}_relatorio_au AFTER UPDATE ON {tabela} '
+            f'REFERENCING OLD TABLE AS antigas NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION {funcao}()',
+        ]
+    return sql
+
+
+SQL_TRIGGERS = {
+    'sqlite': sql_triggers_sqlite,
+    'postgresql': sql_triggers_postgres,
+}
+
+
+def garantir_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Receptor de post_migrate: recria os triggers dos totais que faltarem (como core.busca)."""
+    conexao = connections[using]
+    if conexao.vendor not in SQL_TRIGGERS:
+        return
+    with conexao.cursor() as cursor:
+        if 'core_relatorioatendimentos' not in conexao.introspection.table_names(cursor):
+            return
+        for sql in SQL_TRIGGERS[conexao.vendor]():
+            cursor.execute(sql)
+
+
+def remover_triggers(using=DEFAULT_DB_ALIAS):
+    conexao = connections[using]
+    if conexao.vendor not in SQL_TRIGGERS:
+        return
+    with conexao.cursor() as cursor:
+        for tabela, nome in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {nome}' + (f' ON {tabela}' if conexao.vendor == 'postgresql' else ''))
+        if conexao.vendor == 'postgresql':
+            for funcao in FUNCOES_POSTGRES:
+                cursor.execute(f'DROP FUNCTION IF EXISTS {funcao}()')
+
+
+def _totais_atendimentos():
+    """{(mes, status, usuario_id): total} das duas tabelas de atendimentos."""
+    totais = defaultdict(int)
+    if connection.vendor == 'sqlite':
+        # A mesma regra de mês dos triggers
+        for tabela in TABELAS_ATENDIMENTOS:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT date(data_hora, '{_deslocamento()}', 'start of month'), status, usuario_id, COUNT(*) "
+                    f'FROM {tabela} GROUP BY 1, 2, 3'
+                )
+                for mes, status, usuario_id, total in cursor.fetchall():
+                    totais[(date.fromisoformat(mes), status, usuario_id)] += total
+        return totais
+    for modelo in (Atendimento, AtendimentoArquivado):
+        linhas = (
+            modelo.todos.order_by().annotate(mes=TruncMonth('data_hora'))
+            .values_list('mes', 'status', 'usuario_id').annotate(total=Count('id'))
+        )
+        for mes, status, usuario_id, total in linhas:
+            totais[(mes.date(), status, usuario_id)] += total
+    return totais
+
+
+def reconstruir():
+    """Recalcula as tabelas de totais a partir de clientes, atendimentos e arquivo."""
+    clientes = (
+        Cliente.objects.order_by().values_list('estado', 'cidade').annotate(total=Count('id'))
+    )
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Os triggers de outras transações esperam o fim da contagem; sem
+            # isso, uma gravação concorrente poderia ser contada duas vezes
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE core_relatorioclientes, core_relatorioatendimentos IN EXCLUSIVE MODE')
+        RelatorioClientes.objects.all().delete()
+        RelatorioClientes.objects.bulk_create(
+            RelatorioClientes(estado=estado, cidade=cidade, total=total) for estado, cidade, total in clientes
+        )
+        RelatorioAtendimentos.objects.all().delete()
+        RelatorioAtendimentos.objects.bulk_create(
+            RelatorioAtendimentos(mes=mes, status=status, usuario_id=usuario_id, total=total)
+            for (mes, status, usuario_id), total in _totais_atendimentos().items()
+        )
+
+
+@contextmanager
+def totais_adiados():
+    """
+    Para cargas grandes (como busca.indexacao_adiada): remove os triggers
+    durante o bloco e, no fim, recria os triggers e recalcula os totais de
+    uma vez. No PostgreSQL um executemany dispara o trigger a cada linha.
+    """
+    if connection.vendor not in SQL_TRIGGERS:
+        yield
+        return
+    remover_triggers()
+    try:
+        yield
+    finally:
+        garantir_triggers()
+        reconstruir()
+
+
+# ========== CONSULTAS DOS RELATÓRIOS ==========
+
+STATUS = [valor for valor, _ in Atendimento.STATUS_CHOICES]
+
+
+def clientes_por_estado():
+    """[(estado, total, [(cidade, total), ...])], dos estados com mais clientes para os com menos."""
+    cidades = defaultdict(list)
+    for estado, cidade, total in (
+        RelatorioClientes.objects.filter(total__gt=0).order_by('-total', 'cidade').values_list('estado', 'cidade', 'total')
+    ):
+        cidades[estado].append((cidade, total))
+    estados = [(estado, sum(total for _, total in lista), lista) for estado, lista in cidades.items()]
+    return sorted(estados, key=lambda linha: (-linha[1], linha[0]))
+
+
+def anos():
+    """Anos com atendimentos, do mais recente para o mais antigo."""
+    meses = RelatorioAtendimentos.objects.filter(total__gt=0).dates('mes', 'year', order='DESC')
+    return [mes.year for mes in meses]
+
+
+def _por_status(linhas):
+    """{chave: [total de cada status em STATUS..., total geral]} a partir de (chave, status, total)."""
+    tabela = defaultdict(lambda: [0] * (len(STATUS) + 1))
+    for chave, status, total in linhas:
+        colunas = tabela[chave]
+        if status in STATUS:
+            colunas[STATUS.index(status)] += total
+        colunas[-1] += total
+    return tabela
+
+
+def atendimentos_por_mes(ano):
+    """[(mês, [total de cada status..., total])] dos meses de `ano`."""
+    linhas = (
+        RelatorioAtendimentos.objects.filter(mes__year=ano, total__gt=0).values_list('mes', 'status')
+        .annotate(soma=Sum('total')).order_by()
+    )
+    return sorted(_por_status(linhas).items())
+
+
+def atendimentos_por_usuario(ano):
+    """[(nome do atendente, [total de cada status..., total])] de `ano`, dos que mais atenderam."""
+    linhas = (
+        RelatorioAtendimentos.objects.filter(mes__year=ano, total__gt=0).values_list('usuario_id', 'status')
+        .annotate(soma=Sum('total')).order_by()
+    )
+    tabela = _por_status(linhas)
+    usuarios = User.objects.in_bulk(list(tabela))
+    resultado = []
+    for usuario_id, colunas in tabela.items():
+        usuario = usuarios.get(usuario_id)
+        nome = (usuario.get_full_name() or usuario.username) if usuario else f'(removido #{usuario_id})'
+        resultado.append((nome, colunas))
+    return sorted(resultado, key=lambda linha: (-linha[1][-1], linha[0]))
+
+
+def rotulos_status():
+    return [rotulo for _, rotulo in Atendimento.STATUS_CHOICES]
+
+
+def tabela_csv(tipo, ano):
+    """(cabeçalho, linhas) do CSV `tipo` ('clientes', 'atendimentos-mes' ou 'atendimentos-usuario'), ou None."""
+    if tipo == 'clientes':
+        linhas = [
+            (estado, cidade, total)
+            for estado, _, cidades in clientes_por_estado() for cidade, total in cidades
+        ]
+        return ['Estado', 'Cidade', 'Clientes'], linhas
+    if tipo == 'atendimentos-mes':
+        linhas = [(f'{mes:%m/%Y}', *colunas) for mes, colunas in atendimentos_por_mes(ano)]
+        return ['Mês', *rotulos_status(), 'Total'], linhas
+    if tipo == 'atendimentos-usuario':
+        linhas = [(nome, *colunas) for nome, colunas in atendimentos_por_usuario(ano)]
+        return ['Atendente', *rotulos_status(), 'Total'], linhas
+    return None
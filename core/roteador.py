@@ -0,0 +1,185 @@
+"""
+Roteamento de leituras para réplicas.
+
+Escritas vão sempre para o banco principal ('default'). Leituras vão para uma
+das réplicas em settings.DB_REPLICAS, exceto quando:
+
+- a requisição atual já escreveu ou está dentro de uma transação no principal;
+- o navegador escreveu há pouco (cookie colocado por FixarPrimarioMiddleware),
+  para que quem acabou de cadastrar um cliente o veja na lista em seguida;
+- a réplica está atrasada mais do que DB_REPLICA_ATRASO_MAXIMO segundos.
+
+O atraso é medido com pg_last_xact_replay_timestamp() no PostgreSQL. Nos
+outros bancos (ex.: dois arquivos SQLite em testes locais) é comparado o
+batimento gravado pelo middleware a cada requisição de escrita; com réplicas
+PostgreSQL ele não é gravado.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+COOKIE = 'db_primario'
+CHAVE_BATIMENTO = 'replicacao:batimento'
+# Apps lidos sempre no principal: sessão e autenticação logo após o login
+APPS_PRIMARIO = {'sessions'}
+# Por quanto tempo (segundos) o estado de uma réplica é reaproveitado
+INTERVALO_VERIFICACAO = 2
+
+_usar_primario = ContextVar('usar_primario', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DB_REPLICAS', [])
+
+
+def fixar_primario():
+    """Faz as próximas leituras desta requisição (ou tarefa) irem para o principal."""
+    _usar_primario.set(True)
+
+
+def atraso_replica(alias):
+    """Atraso da réplica em segundos (0 se estiver em dia)."""
+    conexao = connections[alias]
+    with conexao.cursor() as cursor:
+        if conexao.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+            )
+            return float(cursor.fetchone()[0])
+        sql = 'SELECT valor FROM core_contador WHERE chave = %s'
+        cursor.execute(sql, [CHAVE_BATIMENTO])
+        linha = cursor.fetchone()
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(sql, [CHAVE_BATIMENTO])
+        principal = cursor.fetchone()
+    if principal is None:
+        return 0.0
+    na_replica = linha[0] if linha else 0
+    return max(principal[0] - na_replica, 0) / 1000
+
+
+def usa_batimento():
+    """Se alguma réplica tem o atraso medido pelo batimento (não é PostgreSQL)."""
+    return any(connections[alias].vendor != 'postgresql' for alias in replicas())
+
+
+def registrar_batimento():
+    """Grava o horário da última escrita no principal (usado por atraso_replica)."""
+    from .models import Contador
+    Contador.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        pk=CHAVE_BATIMENTO, defaults={'valor': int(time.time() * 1000)},
+    )
+
+
+class _EstadoReplicas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saudaveis = {}
+
+    def saudavel(self, alias):
+        agora = time.monotonic()
+        with self._lock:
+            saudavel, verificado_em = self._saudaveis.get(alias, (True, None))
+            if verificado_em is not None and agora - verificado_em < INTERVALO_VERIFICACAO:
+                return saudavel
+            # Marca antes de consultar para que só uma thread verifique por vez
+            self._saudaveis[alias] = (saudavel, agora)
+        try:
+            saudavel = atraso_replica(alias) <= getattr(settings, 'DB_REPLICA_ATRASO_MAXIMO', 5)
+        except DatabaseError:
+            saudavel = False
+        with self._lock:
+            self._saudaveis[alias] = (saudavel, agora)
+        return saudavel
+
+    def limpar(self):
+        with self._lock:
+            self._saudaveis.clear()
+
+
+estado = _EstadoReplicas()
+
+
+class RoteadorReplicas:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _usar_primario.get() or model._meta.app_label in APPS_PRIMARIO:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Dentro de uma transação a leitura tem que ver o que a transação escreveu
+            return DEFAULT_DB_ALIAS
+        disponiveis = [alias for alias in aliases if estado.saudavel(alias)]
+        return random.choice(disponiveis) if disponiveis else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if replicas():
+            fixar_primario()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas têm os mesmos dados do principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class FixarPrimarioMiddleware:
+    """
+    Depois de uma requisição de escrita (POST, PUT, PATCH, DELETE), as
+    leituras do mesmo navegador vão para o principal por
+    DB_REPLICA_FIXAR_PRIMARIO segundos.
+    """
+    METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not replicas():
+            return self.get_response(request)
+        token = _usar_primario.set(COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _usar_primario.reset(token)
+        if request.method not in self.METODOS_SEGUROS:
+            if usa_batimento():
+                registrar_batimento()
+            self._fixar(response)
+        return response
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+        token = _usar_primario.set(COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _usar_primario.reset(token)
+        if request.method not in self.METODOS_SEGUROS:
+            if usa_batimento():
+                await sync_to_async(registrar_batimento)()
+            self._fixar(response)
+        return response
+
+    def _fixar(self, response):
+        response.set_cookie(
+            COOKIE, '1',
+            max_age=getattr(settings, 'DB_REPLICA_FIXAR_PRIMARIO', 10),
+            httponly=True, samesite='Lax',
+        )
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import contadores
+from .models import Atendimento, AtendimentoArquivado, Cliente
+
+
+@receiver(post_save, sender=Cliente)
+def cliente_salvo(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    contadores.nova_versao('cliente')
+    if created:
+        contadores.incrementar(contadores.CLIENTES)
+
+
+@receiver(post_delete, sender=Cliente)
+def cliente_excluido(sender, instance, **kwargs):
+    contadores.nova_versao('cliente')
+    contadores.incrementar(contadores.CLIENTES, -1)
+
+
+@receiver(post_save, sender=Atendimento)
+def atendimento_salvo(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    contadores.nova_versao('atendimento')
+    dia_novo = contadores.dia_local(instance.data_hora)
+    original = instance.valor_original('data_hora')
+    if created:
+        contadores.incrementar(contadores.ATENDIMENTOS)
+        contadores.incrementar(contadores.chave_dia(dia_novo))
+        return
+    if original is not None and contadores.dia_local(original) != dia_novo:
+        contadores.incrementar(contadores.chave_dia(contadores.dia_local(original)), -1)
+        contadores.incrementar(contadores.chave_dia(dia_novo))
+
+
+@receiver(post_delete, sender=Atendimento)
+def atendimento_excluido(sender, instance, **kwargs):
+    data_hora = instance.valor_original('data_hora') or instance.data_hora
+    contadores.nova_versao('atendimento')
+    contadores.incrementar(contadores.ATENDIMENTOS, -1)
+    contadores.incrementar(contadores.chave_dia(contadores.dia_local(data_hora)), -1)
+
+
+@receiver(post_delete, sender=AtendimentoArquivado)
+def arquivado_excluido(sender, instance, **kwargs):
+    # Exclusão em cascata de um cliente; o arquivamento em si não dispara sinais
+    contadores.nova_versao('atendimento')
+    contadores.incrementar(contadores.ARQUIVADOS, -1)
+
+
+@receiver(post_save, sender=User)
+def usuario_salvo(sender, instance, raw=False, update_fields=None, **kwargs):
+    # O login grava só last_login, que nenhuma página mostra
+    if raw or update_fields == frozenset({'last_login'}):
+        return
+    contadores.nova_versao('usuario')
+
+
+@receiver(post_delete, sender=User)
+def usuario_excluido(sender, instance, **kwargs):
+    contadores.nova_versao('usuario')
@@ -1,3 +1,1051 @@
-from django.test import TestCase
+from datetime import datetime, time as hora, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+import asyncio
+import io
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    agenda, api, arquivo, busca, cep, contadores, duplicados, exclusao, importacao, lembretes, relatorios, roteador,
+)
+from .forms import AtendimentoForm
+from .models import (
+    Atendimento, AtendimentoArquivado, CepCache, Cliente, Contador, Lembrete, ParDuplicado,
+    RelatorioAtendimentos, RelatorioClientes,
+)
+from .paginacao import KeysetPaginator
+
+
+def cpf_valido(base):
+    """CPF formatado com dígitos verificadores válidos a partir de 9 dígitos."""
+    digitos = [int(c) for c in f'{base:09d}']
+    for peso in (10, 11):
+        soma = sum(d * (peso - i) for i, d in enumerate(digitos))
+        resto = 11 - soma % 11
+        digitos.append(0 if resto >= 10 else resto)
+    cpf = ''.join(map(str, digitos))
+    return f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}'
+
+
+def dados_cliente(n, **extra):
+    dados = {
+        'nome': f'Cliente {n}', 'email': f'cliente{n}@exemplo.com', 'telefone': '(11) 98765-4321',
+        'cpf': cpf_valido(100000000 + n * 7), 'cep': '01310-100', 'logradouro': 'Av. Paulista',
+        'numero': str(n), 'bairro': 'Bela Vista', 'cidade': 'São Paulo', 'estado': 'SP',
+    }
+    dados.update(extra)
+    return dados
+
+
+def criar_cliente(n, **extra):
+    return Cliente.objects.create(**dados_cliente(n, **extra))
+
+
+def criar_usuario(username='atendente'):
+    return User.objects.create_user(username, password='senha-de-teste', first_name='Ana', last_name='Lima')
+
+
+def proximo_horario(dias=2, hora=10):
+    """Horário local futuro, em minuto cheio."""
+    return (timezone.localtime() + timedelta(days=dias)).replace(hour=hora, minute=0, second=0, microsecond=0)
+
+
+class HorarioUnicoTest(TestCase):
+    """Dois atendimentos ativos não ocupam o mesmo horário (formulário e banco)."""
+
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.cliente = criar_cliente(1)
+        self.horario = proximo_horario()
+        self.client.force_login(self.usuario)
+
+    def dados(self, **extra):
+        dados = {
+            'cliente': self.cliente.pk, 'data_hora': self.horario.strftime('%Y-%m-%dT%H:%M'),
+            'descricao': 'Revisão', 'status': 'agendado',
+        }
+        dados.update(extra)
+        return dados
+
+    def agendar(self, data_hora=None, status='agendado'):
+        return Atendimento.objects.create(
+            cliente=self.cliente, usuario=self.usuario, data_hora=data_hora or self.horario,
+            descricao='Outro', status=status,
+        )
+
+    def test_formulario_recusa_horario_ocupado(self):
+        self.agendar()
+        form = AtendimentoForm(self.dados())
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.has_error('data_hora', 'conflito'))
+
+    def test_formulario_aceita_horario_de_cancelado(self):
+        self.agendar(status='cancelado')
+        self.assertTrue(AtendimentoForm(self.dados()).is_valid())
+
+    def test_edicao_nao_conflita_com_o_proprio_atendimento(self):
+        atendimento = self.agendar()
+        form = AtendimentoForm(self.dados(descricao='Alterada'), instance=atendimento)
+        self.assertTrue(form.is_valid())
+
+    def test_view_recusa_horario_ocupado(self):
+        self.assertEqual(self.client.post('/atendimentos/novo/', self.dados()).status_code, 302)
+        response = self.client.post('/atendimentos/novo/', self.dados())
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, AtendimentoForm.MENSAGEM_CONFLITO)
+        self.assertEqual(Atendimento.objects.count(), 1)
+
+    def test_banco_recusa_mesmo_minuto(self):
+        self.agendar()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.agendar(self.horario + timedelta(seconds=30))
+        # Encerrado libera o horário
+        self.agendar(self.horario + timedelta(seconds=30), status='concluido')
+        self.assertEqual(Atendimento.objects.filter(slot=self.horario).count(), 1)
+
+    def test_corrida_entre_validacao_e_gravacao(self):
+        clean = AtendimentoForm.clean
+
+        def clean_com_corrida(form):
+            # Outra requisição grava o mesmo horário logo depois da verificação
+            dados = clean(form)
+            self.agendar()
+            return dados
+
+        with mock.patch.object(AtendimentoForm, 'clean', clean_com_corrida):
+            response = self.client.post('/atendimentos/novo/', self.dados())
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, AtendimentoForm.MENSAGEM_CONFLITO)
+        self.assertEqual(Atendimento.objects.filter(slot=self.horario).count(), 1)
+
+
+
+
+class CepCacheTest(TestCase):
+    """Cache de CEPs em memória e no banco, com TTL e uso da entrada expirada."""
+    CEP = '01310100'
+    VIACEP = {'logradouro': 'Avenida Paulista', 'bairro': 'Bela Vista', 'localidade': 'São Paulo', 'uf': 'SP'}
+
+    def setUp(self):
+        cep.memoria.clear()
+        cep.estatisticas.zerar()
+        # Circuito novo a cada teste: as falhas de um não abrem o do seguinte
+        circuito = mock.patch.object(cep, 'circuito', cep.CircuitBreaker(5, 30))
+        circuito.start()
+        self.addCleanup(circuito.stop)
+        upstream = mock.patch.object(cep._sessao, 'get')
+        self.upstream = upstream.start()
+        self.addCleanup(upstream.stop)
+        self.responder(self.VIACEP)
+
+    def responder(self, dados, status=200):
+        self.upstream.side_effect = None
+        self.upstream.return_value = mock.Mock(status_code=status, **{'json.return_value': dados})
+
+    def buscar(self):
+        return self.client.get('/api/buscar-cep/', {'cep': '01310-100'}).json()
+
+    def envelhecer(self, segundos):
+        """Leva a consulta gravada `segundos` para trás e esquece a memória."""
+        cep.memoria.clear()
+        CepCache.objects.filter(cep=self.CEP).update(consultado_em=timezone.now() - timedelta(seconds=segundos))
+
+    def test_memoria_e_banco(self):
+        self.assertEqual(self.buscar(), {
+            'success': True, 'logradouro': 'Avenida Paulista', 'bairro': 'Bela Vista',
+            'cidade': 'São Paulo', 'estado': 'SP',
+        })
+        self.assertTrue(CepCache.objects.get(cep=self.CEP).encontrado)
+        self.assertTrue(self.buscar()['success'])
+        cep.memoria.clear()
+        self.assertTrue(self.buscar()['success'])
+        self.assertEqual(self.upstream.call_count, 1)
+        estatisticas = cep.estatisticas.como_dict()
+        self.assertEqual(
+            (estatisticas['misses'], estatisticas['hits_memoria'], estatisticas['hits_banco']), (1, 1, 1),
+        )
+
+    def test_cep_inexistente_fica_em_cache_por_pouco_tempo(self):
+        self.responder({'erro': True})
+        self.assertEqual(self.buscar(), {'success': False})
+        self.assertEqual(self.buscar(), {'success': False})
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertFalse(CepCache.objects.get(cep=self.CEP).encontrado)
+        self.envelhecer(settings.CEP_CACHE_TTL_NEGATIVO + 1)
+        self.buscar()
+        self.assertEqual(self.upstream.call_count, 2)
+
+    def test_entrada_expirada_consulta_de_novo(self):
+        self.buscar()
+        self.envelhecer(settings.CEP_CACHE_TTL - 60)
+        self.buscar()
+        self.assertEqual(self.upstream.call_count, 1)
+        self.envelhecer(settings.CEP_CACHE_TTL + 1)
+        self.responder({**self.VIACEP, 'bairro': 'Cerqueira César'})
+        self.assertEqual(self.buscar()['bairro'], 'Cerqueira César')
+        self.assertEqual(self.upstream.call_count, 2)
+        self.assertEqual(CepCache.objects.get(cep=self.CEP).bairro, 'Cerqueira César')
+
+    def test_upstream_fora_do_ar_usa_entrada_expirada(self):
+        self.buscar()
+        self.envelhecer(settings.CEP_CACHE_TTL + 1)
+        self.upstream.side_effect = requests.ConnectionError
+        self.assertEqual(self.buscar()['bairro'], 'Bela Vista')
+        self.responder({}, status=503)
+        self.assertEqual(self.buscar()['bairro'], 'Bela Vista')
+        estatisticas = cep.estatisticas.como_dict()
+        self.assertEqual((estatisticas['stale'], estatisticas['erros_upstream']), (2, 2))
+
+    def test_upstream_fora_do_ar_sem_cache(self):
+        self.upstream.side_effect = requests.Timeout
+        self.assertEqual(self.buscar(), {'success': False})
+        self.assertFalse(CepCache.objects.exists())
+        self.assertEqual(cep.estatisticas.como_dict()['misses'], 1)
+
+    def test_limite_da_memoria(self):
+        memoria = cep.CacheLRU(2)
+        memoria.set('a', 1)
+        memoria.set('b', 2)
+        memoria.get('a')
+        memoria.set('c', 3)
+        self.assertIsNone(memoria.get('b'))
+        self.assertEqual((memoria.get('a'), memoria.get('c'), len(memoria)), (1, 3, 2))
+
+
+class RespostaViaCepFalso(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # mantém a conexão aberta entre chamadas
+    ENDERECO = {'logradouro': 'Rua Barão de Jaguara', 'bairro': 'Centro', 'localidade': 'Campinas', 'uf': 'SP'}
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexoes += 1
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.chamadas += 1
+            servidor.simultaneas += 1
+            servidor.pico = max(servidor.pico, servidor.simultaneas)
+        time.sleep(servidor.atraso)
+        with servidor.lock:
+            servidor.simultaneas -= 1
+        corpo = json.dumps(self.ENDERECO).encode()
+        self.send_response(servidor.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class ViaCepFalso(ThreadingHTTPServer):
+    """ViaCEP local que conta chamadas, conexões e chamadas simultâneas."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespostaViaCepFalso)
+        self.url = f'http://127.0.0.1:{self.server_port}/ws'
+        self.lock = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        self.status = 200
+        self.atraso = 0
+        self.chamadas = self.conexoes = self.simultaneas = self.pico = 0
+
+
+class CepUpstreamTest(TestCase):
+    """Chamadas ao ViaCEP: single-flight, limite de concorrência e circuit breaker."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.viacep = ViaCepFalso()
+        threading.Thread(target=cls.viacep.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.viacep.shutdown()
+        cls.viacep.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.viacep.zerar()
+        cep.memoria.clear()
+        cep.estatisticas.zerar()
+        configuracao = override_settings(CEP_UPSTREAM_URL=self.viacep.url)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.circuito = cep.CircuitBreaker(2, 0.2)
+        circuito = mock.patch.object(cep, 'circuito', self.circuito)
+        circuito.start()
+        self.addCleanup(circuito.stop)
+
+    async def test_consultas_simultaneas_viram_uma_chamada(self):
+        self.viacep.atraso = 0.2
+        resultados = await asyncio.gather(*(cep.aconsultar_cep('13010111') for _ in range(20)))
+        self.assertEqual(self.viacep.chamadas, 1)
+        self.assertEqual({r['cidade'] for r in resultados}, {'Campinas'})
+        self.assertEqual(cep.estatisticas.como_dict()['deduplicadas'], 19)
+        self.assertTrue(await CepCache.objects.filter(cep='13010111').aexists())
+        response = await self.async_client.get('/api/buscar-cep/async/', {'cep': '13010-111'})
+        self.assertEqual(response.json()['bairro'], 'Centro')
+        self.assertEqual(self.viacep.chamadas, 1)
+
+    async def test_limite_de_chamadas_simultaneas(self):
+        self.viacep.atraso = 0.3
+        limite = settings.CEP_UPSTREAM_CONCORRENCIA
+        await asyncio.gather(*(cep.aconsultar_cep(f'130100{n:02d}') for n in range(limite + 5)))
+        self.assertEqual(self.viacep.chamadas, limite + 5)
+        self.assertEqual(self.viacep.pico, limite)
+
+    def test_conexao_reaproveitada(self):
+        for sufixo in range(3):
+            self.assertIsNotNone(cep.consultar_cep(f'1302000{sufixo}'))
+        self.assertEqual(self.viacep.chamadas, 3)
+        self.assertLessEqual(self.viacep.conexoes, 1)
+
+    def test_circuito_abre_e_fecha(self):
+        self.viacep.status = 500
+        self.assertIsNone(cep.consultar_cep('13010111'))
+        self.assertIsNone(cep.consultar_cep('13010111'))
+        self.assertEqual(self.circuito.estado, 'aberto')
+        # Aberto: responde sem chamar o ViaCEP
+        self.assertIsNone(cep.consultar_cep('13010111'))
+        self.assertEqual(self.viacep.chamadas, 2)
+        self.assertEqual(cep.estatisticas.como_dict()['circuito_aberto'], 1)
+        time.sleep(0.25)
+        self.assertEqual(self.circuito.estado, 'meio-aberto')
+        self.viacep.status = 200
+        self.assertEqual(cep.consultar_cep('13010111')['cidade'], 'Campinas')
+        self.assertEqual(self.circuito.estado, 'fechado')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'índices FTS5 só existem no SQLite')
+class IndicesBuscaTest(TestCase):
+    """Os triggers mantêm os índices FTS iguais às tabelas."""
+
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.cliente = criar_cliente(1, nome='José da Silva')
+
+    def indexados(self, tabela, texto):
+        tabela = busca.TABELAS_FTS[tabela]
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {tabela} WHERE {tabela} MATCH %s', [busca.consulta_fts(texto)])
+            return {linha[0] for linha in cursor.fetchall()}
+
+    def conteudo(self):
+        with connection.cursor() as cursor:
+            linhas = {}
+            for tabela in busca.TABELAS_FTS.values():
+                cursor.execute(f'SELECT rowid, * FROM {tabela} ORDER BY rowid')
+                linhas[tabela] = cursor.fetchall()
+            return linhas
+
+    def assertIgualAReconstrucao(self):
+        antes = self.conteudo()
+        busca.reconstruir_indices()
+        self.assertEqual(antes, self.conteudo())
+
+    def atender(self, descricao='Instalação de ar-condicionado', **extra):
+        extra.setdefault('data_hora', proximo_horario())
+        return Atendimento.objects.create(cliente=self.cliente, usuario=self.usuario, descricao=descricao, **extra)
+
+    def test_cliente(self):
+        self.assertEqual(self.indexados('cliente', 'jose sil'), {self.cliente.pk})
+        self.assertEqual(list(busca.filtrar_clientes(Cliente.objects.all(), 'JOSE SIL')), [self.cliente])
+        self.cliente.nome = 'Joaquim Pereira'
+        self.cliente.email = 'joaquim@exemplo.com'
+        self.cliente.save()
+        self.assertEqual(self.indexados('cliente', 'jose'), set())
+        self.assertEqual(self.indexados('cliente', 'joaquim pereira'), {self.cliente.pk})
+        self.assertIgualAReconstrucao()
+        self.cliente.delete()
+        self.assertEqual(self.indexados('cliente', 'joaquim'), set())
+
+    def test_atendimento(self):
+        atendimento = self.atender()
+        self.assertEqual(self.indexados('atendimento', 'instalacao'), {atendimento.pk})
+        self.assertEqual(self.indexados('atendimento', 'jose'), {atendimento.pk})
+        atendimento.descricao = 'Troca de filtro'
+        atendimento.save()
+        self.assertEqual(self.indexados('atendimento', 'instalacao'), set())
+        self.assertEqual(self.indexados('atendimento', 'filtro'), {atendimento.pk})
+        # O nome do cliente também é indexado no atendimento
+        self.cliente.nome = 'Joaquim Pereira'
+        self.cliente.save()
+        self.assertEqual(self.indexados('atendimento', 'joaquim filtro'), {atendimento.pk})
+        self.assertIgualAReconstrucao()
+        atendimento.delete()
+        self.assertEqual(self.indexados('atendimento', 'filtro'), set())
+
+    def test_arquivo(self):
+        antigo = self.atender(data_hora=timezone.now() - timedelta(days=400), status='concluido')
+        self.assertEqual(list(arquivo.arquivar(arquivo.data_de_corte(30))), [1])
+        self.assertEqual(self.indexados('atendimento', 'instalacao'), set())
+        arquivado = AtendimentoArquivado.objects.get()
+        self.assertEqual(self.indexados('arquivado', 'jose instalacao'), {arquivado.pk})
+        self.cliente.nome = 'Joaquim Pereira'
+        self.cliente.save()
+        self.assertEqual(self.indexados('arquivado', 'joaquim'), {arquivado.pk})
+        self.assertIgualAReconstrucao()
+        self.assertEqual(list(arquivo.restaurar(AtendimentoArquivado.objects.all())), [1])
+        self.assertEqual(self.indexados('arquivado', 'joaquim'), set())
+        self.assertEqual(self.indexados('atendimento', 'joaquim'), {antigo.pk})
+
+    def test_cliente_excluido(self):
+        atendimento = self.atender()
+        exclusao.ocultar(self.cliente)
+        # Oculto: continua no índice até a purga, mas sai das listas
+        self.assertEqual(self.indexados('cliente', 'jose'), {self.cliente.pk})
+        self.assertEqual(list(busca.filtrar_clientes(Cliente.objects.all(), 'jose')), [])
+        self.assertEqual(list(busca.filtrar_atendimentos(Atendimento.objects.all(), 'instalacao')), [])
+        exclusao.purgar(self.cliente.pk)
+        self.assertEqual(self.indexados('cliente', 'jose'), set())
+        self.assertEqual(self.indexados('atendimento', 'instalacao'), set())
+        self.assertFalse(Atendimento.todos.filter(pk=atendimento.pk).exists())
+        self.assertIgualAReconstrucao()
+
+
+class PaginacaoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Nomes repetidos: o desempate é pelo id
+        for n in range(23):
+            criar_cliente(n, nome=f'Cliente {n % 4}')
+        self.esperado = list(Cliente.objects.order_by('nome', 'id'))
+
+    def test_avanca_e_volta(self):
+        paginador = KeysetPaginator(Cliente.objects.all(), ('nome', 'id'), 5)
+        pagina = paginador.get_page()
+        self.assertFalse(pagina.has_previous())
+        paginas = [list(pagina)]
+        while pagina.has_next():
+            pagina = paginador.get_page(pagina.next_cursor)
+            paginas.append(list(pagina))
+        self.assertEqual(sum(paginas, []), self.esperado)
+        self.assertEqual([len(p) for p in paginas], [5, 5, 5, 5, 3])
+
+        voltando = [list(pagina)]
+        while pagina.has_previous():
+            pagina = paginador.get_page(pagina.previous_cursor)
+            voltando.insert(0, list(pagina))
+        self.assertEqual(voltando, paginas)
+
+    def test_ordem_decrescente(self):
+        paginador = KeysetPaginator(Cliente.objects.all(), ('-nome', 'id'), 4)
+        pagina = paginador.get_page()
+        vistos = list(pagina)
+        while pagina.has_next():
+            pagina = paginador.get_page(pagina.next_cursor)
+            vistos += list(pagina)
+        self.assertEqual(vistos, list(Cliente.objects.order_by('-nome', 'id')))
+        anterior = paginador.get_page(pagina.previous_cursor)
+        self.assertEqual(list(anterior), vistos[-len(pagina) - 4:-len(pagina)])
+
+    def test_insercao_nao_desloca_a_proxima_pagina(self):
+        paginador = KeysetPaginator(Cliente.objects.all(), ('nome', 'id'), 5)
+        primeira = paginador.get_page()
+        criar_cliente(100, nome='Aaa')
+        segunda = paginador.get_page(primeira.next_cursor)
+        self.assertEqual(list(segunda), self.esperado[5:10])
+
+    def test_cursor_invalido_volta_ao_inicio(self):
+        paginador = KeysetPaginator(Cliente.objects.all(), ('nome', 'id'), 5)
+        self.assertEqual(list(paginador.get_page('lixo')), self.esperado[:5])
+
+
+class TotaisTest(TestCase):
+    """Contadores do dashboard e tabelas de relatório iguais a uma recontagem completa."""
+
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.outro = criar_usuario('outro')
+        self.clientes = [criar_cliente(1), criar_cliente(2, estado='RJ', cidade='Niterói')]
+        agora = timezone.now()
+        self.antigos = [
+            Atendimento.objects.create(
+                cliente=self.clientes[0], usuario=self.usuario, data_hora=agora - timedelta(days=400, hours=n),
+                descricao='Antigo', status='concluido' if n % 2 else 'cancelado',
+            )
+            for n in range(4)
+        ]
+        self.hoje = Atendimento.objects.create(
+            cliente=self.clientes[1], usuario=self.outro, data_hora=agora + timedelta(minutes=5), descricao='Hoje',
+        )
+
+    def conferir(self):
+        cache.clear()
+        self.assertEqual(contadores.dashboard(), contadores.contar_agora())
+        incrementais = self.relatorios()
+        relatorios.reconstruir()
+        self.assertEqual(incrementais, self.relatorios())
+
+    def relatorios(self):
+        clientes = {(e, c): t for e, c, t in RelatorioClientes.objects.values_list('estado', 'cidade', 'total') if t}
+        atendimentos = {
+            (m, s, u): t for m, s, u, t in RelatorioAtendimentos.objects.values_list('mes', 'status', 'usuario', 'total') if t
+        }
+        return clientes, atendimentos
+
+    def test_criar_alterar_excluir(self):
+        self.conferir()
+        self.assertEqual(contadores.dashboard()['atendimentos_hoje'], 1)
+        self.hoje.data_hora += timedelta(days=1)
+        self.hoje.status = 'em_andamento'
+        self.hoje.usuario = self.usuario
+        self.hoje.save()
+        self.conferir()
+        self.assertEqual(contadores.dashboard()['atendimentos_hoje'], 0)
+        cliente = self.clientes[0]
+        cliente.cidade = 'Campinas'
+        cliente.save()
+        self.conferir()
+        self.antigos[0].delete()
+        self.conferir()
+        self.clientes[1].delete()
+        self.conferir()
+
+    def test_operacoes_em_lote(self):
+        novos = [Cliente(**dados_cliente(n)) for n in range(10, 13)]
+        for cliente in novos:
+            cliente.atualizar_derivados()
+        importacao.inserir_clientes(novos)
+        self.conferir()
+        importacao.gravar_status(list(Atendimento.objects.filter(pk=self.hoje.pk)), 'concluido')
+        self.conferir()
+
+    def test_arquivar_restaurar(self):
+        # Gerador: o total movido até cada lote
+        self.assertEqual(list(arquivo.arquivar(arquivo.data_de_corte(30), 3)), [3, 4])
+        self.assertEqual(AtendimentoArquivado.objects.count(), 4)
+        self.conferir()
+        self.assertEqual(contadores.dashboard()['arquivados_count'], 4)
+        self.assertEqual(list(arquivo.restaurar(AtendimentoArquivado.objects.all(), 3)), [3, 4])
+        self.assertEqual(AtendimentoArquivado.objects.count(), 0)
+        self.conferir()
+
+    def test_excluir_e_purgar_cliente(self):
+        list(arquivo.arquivar(arquivo.data_de_corte(30), 2))
+        cliente = self.clientes[0]
+        self.assertEqual(exclusao.ocultar(cliente), 4)
+        self.assertIsNone(exclusao.ocultar(cliente))
+        self.conferir()
+        self.assertEqual(contadores.dashboard()['clientes_count'], 1)
+        self.assertEqual(exclusao.purgar(cliente.pk, tamanho=3), 4)
+        self.assertFalse(Cliente.todos.filter(pk=cliente.pk).exists())
+        self.assertFalse(AtendimentoArquivado.todos.exists())
+        self.conferir()
+
+    @override_settings(EXCLUSAO_LIMITE_IMEDIATO=3)
+    def test_exclusao_pela_interface(self):
+        # Até o limite a remoção é imediata; acima dele fica para purgar_pendentes()
+        self.assertFalse(exclusao.excluir_cliente(self.clientes[1]))
+        self.assertFalse(Cliente.todos.filter(pk=self.clientes[1].pk).exists())
+        self.assertTrue(exclusao.excluir_cliente(self.clientes[0]))
+        self.assertEqual(Atendimento.todos.count(), 4)
+        self.conferir()
+        self.assertEqual(list(exclusao.purgar_pendentes(tamanho=3)), [(self.clientes[0].pk, 4)])
+        self.assertFalse(Atendimento.todos.exists())
+        self.conferir()
+
+    def test_consultas_dos_relatorios(self):
+        self.assertEqual(relatorios.clientes_por_estado(), [('RJ', 1, [('Niterói', 1)]), ('SP', 1, [('São Paulo', 1)])])
+        hoje = timezone.localtime(self.hoje.data_hora)
+        antigo = timezone.localtime(self.antigos[0].data_hora)
+        self.assertEqual(relatorios.anos()[0], hoje.year)
+        self.assertIn(antigo.year, relatorios.anos())
+        por_mes = relatorios.atendimentos_por_mes(hoje.year)
+        self.assertEqual([(mes.month, colunas[-1]) for mes, colunas in por_mes], [(hoje.month, 1)])
+        self.assertEqual(por_mes[0][1][relatorios.STATUS.index('agendado')], 1)
+        self.assertEqual(relatorios.atendimentos_por_usuario(antigo.year), [('Ana Lima', [0, 0, 2, 2, 0, 4])])
+        self.client.force_login(self.usuario)
+        response = self.client.get('/relatorios/clientes.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('RJ,Niterói,1', response.content.decode('utf-8-sig'))
+
+    def test_fatias_e_reconciliacao(self):
+        # Cada gravação em uma fatia diferente
+        proxima = itertools.count()
+        with mock.patch.object(contadores.random, 'choice', lambda chaves: chaves[next(proxima) % len(chaves)]):
+            for n in range(10, 15):
+                criar_cliente(n)
+        fatias = Contador.objects.filter(pk__in=contadores.fatias(contadores.CLIENTES))
+        self.assertGreater(fatias.count(), 1)
+        self.conferir()
+        self.assertEqual(contadores.dashboard()['clientes_count'], 7)
+        # Desvio (alteração feita direto no banco): a reconciliação corrige
+        fatias.filter(pk=fatias.order_by('pk')[0].pk).update(valor=F('valor') + 10)
+        cache.clear()
+        self.assertEqual(contadores.dashboard()['clientes_count'], 17)
+        contadores.reconciliar()
+        self.assertEqual(list(fatias.values_list('chave', flat=True)), [contadores.CLIENTES])
+        self.conferir()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'a réplica é uma cópia do arquivo SQLite')
+class RoteadorReplicasTest(TransactionTestCase):
+    """Leituras na réplica (outro arquivo SQLite) e no principal depois de escrever."""
+    REPLICA = 'replica_teste'
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # O alias entra em '__all__' se existir antes de super().setUpClass()
+        descritor, cls.arquivo = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(descritor)
+        connections.settings[cls.REPLICA] = {**connections.settings['default'], 'NAME': cls.arquivo}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.REPLICA].close()
+        del connections[cls.REPLICA]
+        del connections.settings[cls.REPLICA]
+        os.remove(cls.arquivo)
+
+    def setUp(self):
+        roteador.estado.limpar()
+        cache.clear()
+        self.usuario = criar_usuario()
+        criar_cliente(1, nome='Cliente Copiado')
+        self.replicar()
+        criar_cliente(2, nome='Cliente Novo')
+        self.client.force_login(self.usuario)
+        configuracao = override_settings(DB_REPLICAS=[self.REPLICA])
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        # Escritas fora de uma requisição fixam o principal até o fim do teste
+        fixado = roteador._usar_primario.set(False)
+        self.addCleanup(roteador._usar_primario.reset, fixado)
+
+    def replicar(self):
+        """Copia o principal para a réplica, como manage.py replicar_sqlite."""
+        connections[self.REPLICA].close()
+        destino = sqlite3.connect(self.arquivo)
+        try:
+            connection.ensure_connection()
+            connection.connection.backup(destino)
+        finally:
+            destino.close()
+
+    def listar(self):
+        cache.clear()
+        return self.client.get('/clientes/').content.decode()
+
+    def test_leituras_vao_para_a_replica(self):
+        self.assertEqual(Cliente.objects.count(), 1)
+        self.assertEqual(Cliente.objects.using('default').count(), 2)
+        conteudo = self.listar()
+        self.assertIn('Cliente Copiado', conteudo)
+        self.assertNotIn('Cliente Novo', conteudo)
+        # Dentro de uma transação a leitura fica no principal
+        with transaction.atomic():
+            self.assertEqual(Cliente.objects.count(), 2)
+
+    # Atraso ignorado: só o cookie leva a leitura para o principal
+    @override_settings(DB_REPLICA_ATRASO_MAXIMO=float('inf'))
+    def test_escrita_fixa_o_primario(self):
+        response = self.client.post('/clientes/novo/', dados_cliente(3, nome='Cliente Cadastrado'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[roteador.COOKIE]['max-age'], settings.DB_REPLICA_FIXAR_PRIMARIO)
+        self.assertTrue(Contador.objects.using('default').filter(pk=roteador.CHAVE_BATIMENTO).exists())
+        self.assertIn('Cliente Cadastrado', self.listar())
+        del self.client.cookies[roteador.COOKIE]
+        self.assertNotIn('Cliente Cadastrado', self.listar())
+
+    def test_replica_atrasada_volta_ao_principal(self):
+        roteador.registrar_batimento()
+        batimento = Contador.objects.using('default').get(pk=roteador.CHAVE_BATIMENTO).valor
+        # A réplica viu a escrita de um segundo atrás
+        Contador.objects.using(self.REPLICA).create(chave=roteador.CHAVE_BATIMENTO, valor=batimento - 1000)
+        self.assertEqual(roteador.atraso_replica(self.REPLICA), 1)
+        self.assertEqual(Cliente.objects.count(), 1)
+        atraso = settings.DB_REPLICA_ATRASO_MAXIMO + 1
+        Contador.objects.using(self.REPLICA).filter(pk=roteador.CHAVE_BATIMENTO).update(valor=batimento - atraso * 1000)
+        # O estado da réplica é reaproveitado por INTERVALO_VERIFICACAO segundos
+        self.assertEqual(Cliente.objects.count(), 1)
+        roteador.estado.limpar()
+        self.assertEqual(Cliente.objects.count(), 2)
+        self.assertIn('Cliente Novo', self.listar())
+
+
+class GetCondicionalTest(TestCase):
+    """304 para o mesmo ETag sem consultar a lista; ETag novo a cada alteração."""
+
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.cliente = criar_cliente(1)
+        self.client.force_login(self.usuario)
+        # A primeira página cria o cookie CSRF, que também entra no ETag
+        self.client.get('/clientes/')
+
+    def etag(self, url='/clientes/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_304_sem_consultar_a_lista(self):
+        response = self.client.get('/clientes/')
+        with CaptureQueriesContext(connection) as consultas:
+            repetida = self.client.get('/clientes/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        self.assertFalse([c['sql'] for c in consultas if 'FROM "core_cliente"' in c['sql']])
+        repetida = self.client.get('/clientes/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repetida.status_code, 304)
+        # Outra página da lista tem outro ETag
+        self.assertNotEqual(self.etag('/clientes/?search=cliente'), response['ETag'])
+
+    def test_alteracoes_mudam_o_etag(self):
+        vistos = [self.etag()]
+        criar_cliente(2)
+        vistos.append(self.etag())
+        self.cliente.nome = 'Cliente Renomeado'
+        self.cliente.save()
+        vistos.append(self.etag())
+        Cliente.objects.get(nome='Cliente 2').delete()
+        vistos.append(self.etag())
+        exclusao.excluir_cliente(self.cliente)
+        vistos.append(self.etag())
+        # O nome do usuário aparece no menu
+        self.usuario.first_name = 'Beatriz'
+        self.usuario.save()
+        vistos.append(self.etag())
+        self.assertEqual(len(set(vistos)), len(vistos))
+        response = self.client.get('/clientes/', HTTP_IF_NONE_MATCH=vistos[0])
+        self.assertEqual(response.status_code, 200)
+
+    def test_atendimentos_mudam_o_etag_das_listas_que_os_mostram(self):
+        clientes, atendimentos = self.etag(), self.etag('/atendimentos/')
+        Atendimento.objects.create(
+            cliente=self.cliente, usuario=self.usuario, data_hora=proximo_horario(), descricao='Revisão',
+        )
+        self.assertEqual(self.etag(), clientes)
+        self.assertNotEqual(self.etag('/atendimentos/'), atendimentos)
+
+
+class ApiLoteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario()
+        self.api = Client(enforce_csrf_checks=True)
+        self.autorizacao = f'Token {api.criar_token(self.usuario, "Testes")}'
+
+    def chamar(self, metodo, url, dados=None, **extra):
+        extra.setdefault('HTTP_AUTHORIZATION', self.autorizacao)
+        corpo = json.dumps(dados) if dados is not None else None
+        return getattr(self.api, metodo)(url, corpo, content_type='application/json', **extra)
+
+    def test_autenticacao(self):
+        self.assertEqual(self.chamar('get', '/api/v1/clientes/', HTTP_AUTHORIZATION='Token errado').status_code, 401)
+        sessao = Client(enforce_csrf_checks=True)
+        sessao.force_login(self.usuario)
+        self.assertEqual(sessao.get('/api/v1/clientes/').status_code, 200)
+        # Com sessão, escrita sem o token CSRF é recusada; o motivo vai para o log
+        lote = json.dumps([dados_cliente(1)])
+        with self.assertLogs('django.security.csrf', 'WARNING') as log:
+            response = sessao.post('/api/v1/clientes/', lote, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'erro': api.MENSAGEM_CSRF})
+        self.assertIn('CSRF cookie not set', log.output[0])
+        sessao.get('/clientes/novo/')
+        token = sessao.cookies[settings.CSRF_COOKIE_NAME].value
+        response = sessao.post('/api/v1/clientes/', lote, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 201)
+
+    def test_criar_e_listar_por_cursor(self):
+        response = self.chamar('post', '/api/v1/clientes/', [dados_cliente(n) for n in range(12)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['criados'], 12)
+        self.assertEqual(contadores.dashboard()['clientes_count'], 12)
+
+        ids, cursor = [], None
+        while True:
+            url = '/api/v1/clientes/?limite=5&campos=nome' + (f'&cursor={cursor}' if cursor else '')
+            pagina = self.chamar('get', url).json()
+            ids += [item['id'] for item in pagina['resultados']]
+            self.assertEqual(set(pagina['resultados'][0]), {'id', 'nome'})
+            cursor = pagina['proximo']
+            if not cursor:
+                break
+        self.assertEqual(ids, sorted(Cliente.objects.values_list('id', flat=True)))
+        anterior = self.chamar('get', f'/api/v1/clientes/?limite=5&cursor={pagina["anterior"]}').json()
+        self.assertEqual([item['id'] for item in anterior['resultados']], ids[5:10])
+
+    def test_lote_com_erro_nao_grava_nada(self):
+        lote = [dados_cliente(1), dados_cliente(2, cpf='111.111.111-11'), dados_cliente(3, email='cliente1@exemplo.com')]
+        response = self.chamar('post', '/api/v1/clientes/', lote)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([erro['indice'] for erro in response.json()['erros']], [1, 2])
+        self.assertFalse(Cliente.objects.exists())
+
+    @override_settings(API_LOTE_MAXIMO=2)
+    def test_tamanho_maximo(self):
+        response = self.chamar('post', '/api/v1/clientes/', [dados_cliente(n) for n in range(3)])
+        self.assertEqual(response.status_code, 400)
+
+    def test_atendimentos_em_lote(self):
+        cliente = criar_cliente(1)
+        horario = proximo_horario()
+        lote = [
+            {'cliente': cliente.pk, 'data_hora': (horario + timedelta(hours=n)).isoformat(), 'descricao': f'Visita {n}', 'status': 'agendado'}
+            for n in range(3)
+        ]
+        response = self.chamar('post', '/api/v1/atendimentos/', lote)
+        self.assertEqual(response.status_code, 201)
+        ids = response.json()['ids']
+        self.assertEqual(set(Atendimento.objects.values_list('usuario', flat=True)), {self.usuario.pk})
+
+        # Horário repetido dentro do lote ou já ocupado: o lote todo é recusado
+        repetido = dict(lote[0], descricao='Repetido')
+        response = self.chamar('post', '/api/v1/atendimentos/', [repetido])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Atendimento.objects.count(), 3)
+
+        # Alteração parcial: só os campos enviados mudam
+        response = self.chamar('patch', '/api/v1/atendimentos/', [{'id': ids[0], 'descricao': 'Alterada'}])
+        self.assertEqual(response.status_code, 200)
+        alterado = Atendimento.objects.get(pk=ids[0])
+        self.assertEqual((alterado.descricao, alterado.slot), ('Alterada', horario))
+
+        # Cancelar libera os horários; reativar em cima de outro ocupado é recusado
+        response = self.chamar('post', '/api/v1/atendimentos/status/', {'ids': ids[:2], 'status': 'cancelado'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Atendimento.objects.filter(pk__in=ids[:2], slot__isnull=False).exists())
+        Atendimento.objects.create(cliente=cliente, usuario=self.usuario, data_hora=horario, descricao='Novo')
+        response = self.chamar('post', '/api/v1/atendimentos/status/', {'ids': [ids[0]], 'status': 'agendado'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Atendimento.objects.get(pk=ids[0]).status, 'cancelado')
+
+
+class HorariosLivresTest(TestCase):
+    """Horários livres em volta dos atendimentos ativos; cancelados não ocupam."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario()
+        self.cliente = criar_cliente(1)
+        # Uma segunda-feira daqui a duas semanas, longe do "agora"
+        self.dia = agenda.inicio_da_semana(timezone.localdate() + timedelta(days=14))
+
+    def agendar(self, horario, status='agendado'):
+        return Atendimento.objects.create(
+            cliente=self.cliente, usuario=self.usuario, descricao='Visita', status=status,
+            data_hora=timezone.make_aware(datetime.combine(self.dia, horario)),
+        )
+
+    def livres(self, duracao, dia=None):
+        dia = dia or self.dia
+        return agenda.horarios_livres(dia, dia, hora(8), hora(12), duracao)[dia]
+
+    def test_em_volta_dos_ocupados(self):
+        self.agendar(hora(9))
+        self.agendar(hora(11, 15))
+        self.agendar(hora(10, 30), status='cancelado')
+        self.assertEqual(self.livres(60), [hora(8), hora(10)])
+        self.assertEqual(self.livres(30), [hora(8), hora(8, 30), hora(9, 30), hora(10), hora(10, 30)])
+
+    def test_alteracao_libera_o_horario(self):
+        atendimento = self.agendar(hora(9))
+        self.assertNotIn(hora(9), self.livres(60))
+        # Os ocupados do dia ficam em cache; a versão nova de atendimentos o invalida
+        atendimento.status = 'cancelado'
+        atendimento.save()
+        self.assertEqual(self.livres(60), [hora(8), hora(9), hora(10), hora(11)])
+        self.agendar(hora(8))
+        self.assertEqual(self.livres(60), [hora(9), hora(10), hora(11)])
+
+    def test_fora_do_expediente(self):
+        self.assertEqual(self.livres(60, self.dia + timedelta(days=5)), [])
+        self.assertEqual(self.livres(60, timezone.localdate() - timedelta(days=1)), [])
+
+    def test_api(self):
+        self.client.force_login(self.usuario)
+        self.agendar(hora(9))
+        parametros = {
+            'inicio': self.dia.isoformat(), 'fim': (self.dia + timedelta(days=1)).isoformat(),
+            'abertura': '08:00', 'fechamento': '12:00', 'duracao': 60,
+        }
+        response = self.client.get('/api/v1/agenda/livres/', parametros)
+        self.assertEqual(response.json(), {'duracao': 60, 'dias': [
+            {'data': self.dia.isoformat(), 'livres': ['08:00', '10:00', '11:00']},
+            {'data': (self.dia + timedelta(days=1)).isoformat(), 'livres': ['08:00', '09:00', '10:00', '11:00']},
+        ]})
+        response = self.client.get('/api/v1/agenda/livres/', {**parametros, 'duracao': 2})
+        self.assertEqual(response.status_code, 400)
+
+
+class BackendMemoria(lembretes.BackendBase):
+    """Guarda as mensagens; os destinatários em `recusar` falham."""
+
+    def __init__(self, recusar=()):
+        self.mensagens = []
+        self.recusar = set(recusar)
+
+    def enviar_uma(self, mensagem):
+        if mensagem.destinatario in self.recusar:
+            raise ConnectionError('recusado')
+        self.mensagens.append(mensagem)
+
+
+class LembretesTest(TestCase):
+    """Cada etapa de processar_agendados pode rodar de novo sem repetir trabalho."""
+
+    def setUp(self):
+        self.usuario = criar_usuario()
+        self.cliente = criar_cliente(1)
+        self.agora = timezone.now().replace(second=0, microsecond=0)
+        self.vencidos = [self.agendar(-60 * horas) for horas in (1, 2, 3)]
+        # Dentro da tolerância, encerrado e cancelado: nenhum vira atrasado
+        self.tolerados = self.agendar(-10)
+        self.agendar(-120, status='concluido')
+        self.agendar(60, status='cancelado')
+        self.proximos = [self.agendar(60 * horas) for horas in (1, 2, 3)]
+        self.depois = self.agendar(60 * 30)
+
+    def agendar(self, minutos, status='agendado'):
+        return Atendimento.objects.create(
+            cliente=self.cliente, usuario=self.usuario, descricao='Visita', status=status,
+            data_hora=self.agora + timedelta(minutes=minutos),
+        )
+
+    def test_marcar_atrasados(self):
+        self.assertEqual(list(lembretes.marcar_atrasados(self.agora, tamanho=2)), [2, 3])
+        self.assertEqual(list(lembretes.marcar_atrasados(self.agora, tamanho=2)), [])
+        atrasados = Atendimento.objects.filter(status='atrasado')
+        self.assertEqual(set(atrasados), set(self.vencidos))
+        self.assertFalse(atrasados.filter(slot__isnull=False).exists())
+        self.assertEqual(Atendimento.objects.get(pk=self.tolerados.pk).status, 'agendado')
+
+    def test_enfileirar(self):
+        self.assertEqual(list(lembretes.enfileirar(self.agora, tamanho=2)), [2, 3])
+        self.assertEqual(max(lembretes.enfileirar(self.agora, tamanho=2)), 0)
+        self.assertEqual(
+            set(Lembrete.objects.values_list('atendimento', flat=True)), {a.pk for a in self.proximos},
+        )
+        # Remarcado: um lembrete novo para o novo horário
+        remarcado = self.proximos[0]
+        remarcado.data_hora += timedelta(minutes=30)
+        remarcado.save()
+        self.assertEqual(max(lembretes.enfileirar(self.agora)), 1)
+        self.assertEqual(Lembrete.objects.count(), 4)
+
+    def test_enviar(self):
+        list(lembretes.enfileirar(self.agora))
+        self.proximos[0].status = 'cancelado'
+        self.proximos[0].save()
+        backend = BackendMemoria()
+        self.assertEqual(list(lembretes.enviar(backend, tamanho=2)), [(1, 1, 0), (2, 1, 0)])
+        self.assertEqual(list(lembretes.enviar(backend)), [])
+        self.assertEqual(len(backend.mensagens), 2)
+        self.assertEqual(
+            dict(Lembrete.objects.values_list('atendimento', 'situacao')),
+            {self.proximos[0].pk: 'descartado', self.proximos[1].pk: 'enviado', self.proximos[2].pk: 'enviado'},
+        )
+
+    @override_settings(LEMBRETES_MAX_TENTATIVAS=2)
+    def test_falha_no_envio_volta_para_a_fila(self):
+        list(lembretes.enfileirar(self.agora))
+        backend = BackendMemoria(recusar=[self.cliente.email])
+        self.assertEqual(list(lembretes.enviar(backend)), [(0, 0, 3)])
+        self.assertEqual(set(Lembrete.objects.values_list('situacao', 'tentativas')), {('pendente', 1)})
+        list(lembretes.enviar(backend))
+        self.assertEqual(set(Lembrete.objects.values_list('situacao', 'tentativas')), {('falhou', 2)})
+        self.assertEqual(list(lembretes.enviar(backend)), [])
+
+    def test_comando_repetido(self):
+        saidas = []
+        for _ in range(2):
+            saida = io.StringIO()
+            call_command('processar_agendados', '--sem-envio', stdout=saida)
+            saidas.append(saida.getvalue())
+        self.assertIn('3 atrasados, 3 lembretes enfileirados', saidas[0])
+        self.assertIn('0 atrasados, 0 lembretes enfileirados', saidas[1])
+        self.assertEqual(Lembrete.objects.count(), 3)
+
+
+class DuplicadosTest(TestCase):
+    def setUp(self):
+        self.usuario = criar_usuario()
+
+    def test_mesma_pessoa_com_emails_diferentes(self):
+        # O exemplo do pedido: nada em comum além do nome
+        jose = criar_cliente(1, nome='Jose da Silva', email='jose.silva@exemplo.com')
+        outro = criar_cliente(
+            2, nome='José Silva', email='zezinho77@correio.com.br', telefone='(21) 91234-5678',
+            cep='20040-002', numero='7', cidade='Rio de Janeiro', estado='RJ',
+        )
+        criar_cliente(3, nome='Maria Souza', telefone='(31) 99876-5432', cep='30130-000')
+        saida = io.StringIO()
+        call_command('find_duplicate_clientes', stdout=saida)
+        par = ParDuplicado.objects.get()
+        self.assertEqual((par.cliente_id, par.duplicado_id, par.motivos), (jose.pk, outro.pk, 'nome'))
+        self.assertLess(par.pontuacao, settings.DUPLICADOS_PONTUACAO_MINIMA)
+        self.assertIn('1 possíveis duplicados', saida.getvalue())
+
+    def test_nomes_so_parecidos_precisam_de_mais_dados(self):
+        maria = criar_cliente(1, nome='Maria Silva', email='maria@exemplo.com', telefone='(11) 91111-1111')
+        criar_cliente(2, nome='Marina Silva', email='marina@exemplo.com', telefone='(11) 92222-2222', cep='04538-132')
+        list(duplicados.encontrar())
+        self.assertFalse(ParDuplicado.objects.exists())
+        # Com o mesmo telefone e o mesmo endereço o par passa da pontuação mínima
+        Cliente.objects.filter(nome='Marina Silva').update(
+            telefone_digitos=maria.telefone_digitos, cep_digitos=maria.cep_digitos, numero=maria.numero,
+        )
+        list(duplicados.encontrar())
+        par = ParDuplicado.objects.get()
+        self.assertEqual(par.motivos, 'nome, telefone, endereço')
+        self.assertGreaterEqual(par.pontuacao, settings.DUPLICADOS_PONTUACAO_MINIMA)
+
+    def test_mesclar(self):
+        destino = criar_cliente(1, nome='Jose da Silva')
+        origem = criar_cliente(2, nome='José Silva', cidade='Niterói', estado='RJ')
+        for cliente, dias, status in ((destino, 2, 'agendado'), (origem, 3, 'agendado'), (origem, -400, 'concluido')):
+            Atendimento.objects.create(
+                cliente=cliente, usuario=self.usuario, data_hora=proximo_horario(dias), descricao='Visita', status=status,
+            )
+        list(arquivo.arquivar(arquivo.data_de_corte(30)))
+        relatorio = list(RelatorioAtendimentos.objects.filter(total__gt=0).values_list('mes', 'status', 'usuario', 'total'))
+        totais = contadores.contar_agora()
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(duplicados.mesclar(destino, origem), 2)
+        atualizacoes = [c['sql'].split(' SET ')[0] for c in consultas if c['sql'].startswith('UPDATE "core_atendimento')]
+        self.assertEqual(sorted(atualizacoes), ['UPDATE "core_atendimento"', 'UPDATE "core_atendimentoarquivado"'])
+        self.assertEqual(Atendimento.objects.filter(cliente=destino).count(), 2)
+        self.assertEqual(AtendimentoArquivado.objects.get().cliente, destino)
+        self.assertFalse(Cliente.todos.filter(pk=origem.pk).exists())
+
+        cache.clear()
+        self.assertEqual(contadores.dashboard(), {**totais, 'clientes_count': totais['clientes_count'] - 1})
+        self.assertEqual(contadores.dashboard(), contadores.contar_agora())
+        self.assertEqual(
+            list(RelatorioAtendimentos.objects.filter(total__gt=0).values_list('mes', 'status', 'usuario', 'total')),
+            relatorio,
+        )
+        self.assertFalse(RelatorioClientes.objects.filter(estado='RJ', total__gt=0).exists())
+        with self.assertRaises(ValueError):
+            duplicados.mesclar(destino, destino)
 
-# Create your tests here.
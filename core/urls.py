@@ -14,13 +14,36 @@ urlpatterns = [
     path('clientes/novo/', views.cliente_create_view, name='cliente_create'),
     path('clientes/<int:pk>/editar/', views.cliente_update_view, name='cliente_update'),
     path('clientes/<int:pk>/excluir/', views.cliente_delete_view, name='cliente_delete'),
+    path('clientes/exportar/', views.exportar_view, {'modelo': 'clientes'}, name='cliente_export'),
     
     # Atendimentos
     path('atendimentos/', views.atendimento_list_view, name='atendimento_list'),
     path('atendimentos/novo/', views.atendimento_create_view, name='atendimento_create'),
     path('atendimentos/<int:pk>/editar/', views.atendimento_update_view, name='atendimento_update'),
     path('atendimentos/<int:pk>/excluir/', views.atendimento_delete_view, name='atendimento_delete'),
+    path('atendimentos/<int:pk>/restaurar/', views.atendimento_restaurar_view, name='atendimento_restaurar'),
+    path('atendimentos/exportar/', views.exportar_view, {'modelo': 'atendimentos'}, name='atendimento_export'),
+    path('agenda/', views.agenda_view, name='agenda'),
+    
+    # Relatórios
+    path('relatorios/', views.relatorios_view, name='relatorios'),
+    path('relatorios/<slug:tipo>.csv', views.relatorio_csv_view, name='relatorio_csv'),
     
     # API
     path('api/buscar-cep/', views.buscar_cep, name='buscar_cep'),
+    path('api/buscar-cep/async/', views.buscar_cep_async, name='buscar_cep_async'),
+    path('api/ceps/', views.sugerir_ceps, name='sugerir_ceps'),
+    path('api/clientes/', views.sugerir_clientes, name='sugerir_clientes'),
+    path('api/buscar-cep/estatisticas/', views.cep_estatisticas_view, name='cep_estatisticas'),
+    
+    # API JSON para integrações (core.api)
+    path('api/v1/clientes/', views.api_lista_view, {'modelo': 'clientes'}, name='api_clientes'),
+    path('api/v1/clientes/<int:pk>/', views.api_detalhe_view, {'modelo': 'clientes'}, name='api_cliente'),
+    path('api/v1/atendimentos/', views.api_lista_view, {'modelo': 'atendimentos'}, name='api_atendimentos'),
+    path('api/v1/atendimentos/<int:pk>/', views.api_detalhe_view, {'modelo': 'atendimentos'}, name='api_atendimento'),
+    path('api/v1/atendimentos/status/', views.api_status_view, name='api_atendimentos_status'),
+    path('api/v1/agenda/livres/', views.api_horarios_livres_view, name='api_horarios_livres'),
+    
+    # Métricas (Prometheus)
+    path('metricas/', views.metricas_view, name='metricas'),
 ]
\ No newline at end of file
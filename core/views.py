@@ -1,14 +1,25 @@
+import csv
+import secrets
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.core.paginator import Paginator
-from .models import Cliente, Atendimento
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from .models import Cliente, Atendimento, AtendimentoArquivado
 from .forms import CustomUserCreationForm, ClienteForm, AtendimentoForm
-import requests
+from .paginacao import KeysetPaginator, KeysetPaginatorUniao
+from . import agenda, api, arquivo, busca, contadores, exclusao, exportacao, metricas, relatorios
+from .condicional import condicional, minuto_atual
+from . import cep as cep_cache
 
 def register_view(request):
     if request.method == 'POST':
@@ -25,49 +36,43 @@ def register_view(request):
     return render(request, 'register.html', {'form': form})
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condicional('cliente', 'atendimento', extra=minuto_atual)
 def dashboard_view(request):
-    clientes_count = Cliente.objects.count()
-    atendimentos_count = Atendimento.objects.count()
-    atendimentos_hoje = Atendimento.objects.filter(
-        data_hora__date=timezone.now().date()
-    ).count()
-    
     # Próximos atendimentos
-    proximos_atendimentos = Atendimento.objects.filter(
+    proximos_atendimentos = Atendimento.objects.select_related('cliente').filter(
         data_hora__gte=timezone.now(),
         status='agendado'
     ).order_by('data_hora')[:5]
     
     context = {
-        'clientes_count': clientes_count,
-        'atendimentos_count': atendimentos_count,
-        'atendimentos_hoje': atendimentos_hoje,
+        # Contadores mantidos pelos sinais (core.contadores): vêm do cache ou de uma consulta
+        **contadores.dashboard(),
         'proximos_atendimentos': proximos_atendimentos,
     }
     return render(request, 'core/dashboard.html', context)
 
 # ========== VIEWS DE CLIENTE ==========
 @login_required
+@cache_control(private=True, no_cache=True)
+@condicional('cliente')
 def cliente_list_view(request):
     search = request.GET.get('search', '')
-    clientes = Cliente.objects.all()
-    
-    if search:
-        clientes = clientes.filter(
-            Q(nome__icontains=search) |
-            Q(email__icontains=search) |
-            Q(cpf__icontains=search) |
-            Q(telefone__icontains=search)
-        )
+    clientes = busca.clientes_da_lista(request.GET)
     
-    # Paginação
-    paginator = Paginator(clientes, 10)  # 10 clientes por página
-    page_number = request.GET.get('page')
-    clientes = paginator.get_page(page_number)
+    # Paginação por cursor (usa o índice nome, id). O total aproximado conta
+    # também os excluídos à espera da remoção: sem o filtro do manager, o
+    # COUNT(*) não precisa ler a tabela
+    paginator = KeysetPaginator(
+        clientes, ('nome', 'id'), 10, total_aproximado=True,  # 10 clientes por página
+        contagem=busca.clientes_da_lista(request.GET, todos=True),
+    )
+    clientes = paginator.get_page(request.GET.get('cursor'))
     
     return render(request, 'core/cliente_list.html', {
         'clientes': clientes,
-        'search': search
+        'search': search,
+        'cache_linhas': settings.LINHAS_CACHE_TIMEOUT,
     })
 
 @login_required
@@ -110,7 +115,8 @@ def cliente_delete_view(request, pk):
     cliente = get_object_or_404(Cliente, pk=pk)
     if request.method == 'POST':
         try:
-            cliente.delete()
+            # Oculta na hora; com muitos atendimentos a remoção fica para purgar_clientes
+            exclusao.excluir_cliente(cliente)
             messages.success(request, 'Cliente excluído com sucesso!')
         except Exception as e:
             messages.error(request, 'Erro ao excluir cliente. Verifique se não há atendimentos associados.')
@@ -119,65 +125,180 @@ def cliente_delete_view(request, pk):
 
 # ========== VIEWS DE ATENDIMENTO ==========
 @login_required
+@cache_control(private=True, no_cache=True)
+@condicional('atendimento', 'cliente')
 def atendimento_list_view(request):
     search = request.GET.get('search', '')
     status_filter = request.GET.get('status', '')
+    historico = busca.com_historico(request.GET)
     
-    atendimentos = Atendimento.objects.select_related('cliente', 'usuario')
+    atendimentos = busca.atendimentos_da_lista(request.GET).select_related('cliente', 'usuario')
     
-    if search:
-        atendimentos = atendimentos.filter(
-            Q(cliente__nome__icontains=search) |
-            Q(descricao__icontains=search)
+    # Paginação por cursor, ordenando por data (mais próximos primeiro). O total
+    # aproximado é contado sem o filtro de clientes excluídos, como na lista de clientes
+    contagem = busca.atendimentos_da_lista(request.GET, todos=True)
+    if historico:
+        # ?historico=1: intercala os atendimentos arquivados (core.arquivo)
+        arquivados = busca.atendimentos_da_lista(request.GET, arquivados=True).select_related('cliente', 'usuario')
+        paginator = KeysetPaginatorUniao(
+            [atendimentos, arquivados], ('data_hora', 'id'), 15, total_aproximado=True,
+            contagens=[contagem, busca.atendimentos_da_lista(request.GET, arquivados=True, todos=True)],
         )
-    
-    if status_filter:
-        atendimentos = atendimentos.filter(status=status_filter)
-    
-    # Ordenar por data (mais próximos primeiro)
-    atendimentos = atendimentos.order_by('data_hora')
-    
-    # Paginação
-    paginator = Paginator(atendimentos, 15)  # 15 atendimentos por página
-    page_number = request.GET.get('page')
-    atendimentos = paginator.get_page(page_number)
+    else:
+        paginator = KeysetPaginator(atendimentos, ('data_hora', 'id'), 15, total_aproximado=True, contagem=contagem)  # 15 atendimentos por página
+    atendimentos = paginator.get_page(request.GET.get('cursor'))
     
     return render(request, 'core/atendimento_list.html', {
         'atendimentos': atendimentos,
         'search': search,
         'status_filter': status_filter,
+        'historico': historico,
         'status_choices': Atendimento.STATUS_CHOICES,
+        'cache_linhas': settings.LINHAS_CACHE_TIMEOUT,
+    })
+
+# ========== AGENDA ==========
+def ler_data(valor):
+    """Data no formato AAAA-MM-DD, ou None se vazia ou inválida."""
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
+
+@login_required
+def agenda_view(request):
+    """Atendimentos e horários livres da semana (ou do dia, com ?modo=dia) de ?data=."""
+    dia = ler_data(request.GET.get('data')) or timezone.localdate()
+    modo = 'dia' if request.GET.get('modo') == 'dia' else 'semana'
+    if modo == 'dia':
+        inicio = fim = dia
+    else:
+        inicio = agenda.inicio_da_semana(dia)
+        fim = inicio + timedelta(days=6)
+    passo = timedelta(days=1 if modo == 'dia' else 7)
+    
+    atendimentos = agenda.atendimentos_por_dia(inicio, fim)
+    livres = agenda.horarios_livres(inicio, fim)
+    dias = [
+        {
+            'data': data,
+            'atendimentos': atendimentos[data],
+            # (horário, valor de ?data_hora= para o formulário de agendamento)
+            'livres': [(hora, f'{data.isoformat()}T{hora:%H:%M}') for hora in livres[data]],
+        }
+        for data in atendimentos
+    ]
+    return render(request, 'core/agenda.html', {
+        'dias': dias,
+        'modo': modo,
+        'inicio': inicio,
+        'fim': fim,
+        'anterior': inicio - passo,
+        'proximo': inicio + passo,
+        'hoje': timezone.localdate(),
     })
 
+# ========== EXPORTAÇÃO ==========
+@login_required
+def exportar_view(request, modelo):
+    """
+    Exporta clientes ou atendimentos com os filtros da lista (?search=&status=).
+    ?formato=csv|jsonl e ?gzip=1. A resposta é gerada em streaming.
+    """
+    formato = request.GET.get('formato', 'csv')
+    if modelo not in exportacao.COLUNAS or formato not in exportacao.FORMATOS:
+        raise Http404
+    gzip = request.GET.get('gzip') == '1'
+    response = StreamingHttpResponse(
+        exportacao.exportar(modelo, request.GET, formato, gzip),
+        content_type=exportacao.FORMATOS[formato] + '; charset=utf-8',
+    )
+    if gzip:
+        # O arquivo baixado é o .gz; não é Content-Encoding da resposta
+        response['Content-Type'] = 'application/gzip'
+    response['Content-Disposition'] = f'attachment; filename="{exportacao.nome_arquivo(modelo, formato, gzip)}"'
+    return response
+
+# ========== RELATÓRIOS ==========
+def ler_ano(request, anos):
+    """?ano= se for um dos `anos` com atendimentos; senão o mais recente (ou o atual)."""
+    try:
+        ano = int(request.GET.get('ano', ''))
+    except ValueError:
+        ano = None
+    if ano in anos:
+        return ano
+    return anos[0] if anos else timezone.localdate().year
+
+@login_required
+def relatorios_view(request):
+    """Clientes por estado/cidade e atendimentos do ano (?ano=) por mês e por atendente."""
+    anos = relatorios.anos()
+    ano = ler_ano(request, anos)
+    return render(request, 'core/relatorios.html', {
+        'anos': anos,
+        'ano': ano,
+        'status': relatorios.rotulos_status(),
+        'estados': relatorios.clientes_por_estado(),
+        'por_mes': relatorios.atendimentos_por_mes(ano),
+        'por_usuario': relatorios.atendimentos_por_usuario(ano),
+    })
+
+@login_required
+def relatorio_csv_view(request, tipo):
+    """Um dos relatórios em CSV (tipo: clientes, atendimentos-mes ou atendimentos-usuario)."""
+    ano = ler_ano(request, relatorios.anos())
+    tabela = relatorios.tabela_csv(tipo, ano)
+    if tabela is None:
+        raise Http404
+    cabecalho, linhas = tabela
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    nome = tipo if tipo == 'clientes' else f'{tipo}-{ano}'
+    response['Content-Disposition'] = f'attachment; filename="relatorio-{nome}.csv"'
+    writer = csv.writer(response)
+    writer.writerow(cabecalho)
+    writer.writerows(linhas)
+    return response
+
+def salvar_atendimento(request, form, **campos):
+    """
+    Salva o formulário de atendimento. Retorna False se o horário foi ocupado
+    por outra requisição entre a validação e o INSERT/UPDATE (a restrição
+    única de slot no banco recusa a gravação).
+    """
+    try:
+        with transaction.atomic():
+            atendimento = form.save(commit=False)
+            for campo, valor in campos.items():
+                setattr(atendimento, campo, valor)
+            atendimento.save()
+    except IntegrityError:
+        messages.error(request, AtendimentoForm.MENSAGEM_CONFLITO)
+        return False
+    return True
+
+def mensagem_erro_atendimento(request, form):
+    if form.has_error('data_hora', 'conflito'):
+        messages.error(request, AtendimentoForm.MENSAGEM_CONFLITO)
+    else:
+        messages.error(request, 'Erro no formulário. Verifique os dados informados.')
+
 @login_required
 def atendimento_create_view(request):
     if request.method == 'POST':
         form = AtendimentoForm(request.POST)
         if form.is_valid():
             try:
-                # Verificar se não há conflito de horário
-                data_hora = form.cleaned_data['data_hora']
-                conflito = Atendimento.objects.filter(
-                    data_hora__date=data_hora.date(),
-                    data_hora__time=data_hora.time(),
-                    status='agendado'
-                ).exists()
-                
-                if conflito:
-                    messages.error(request, 'Já existe um atendimento agendado para este horário.')
-                    return render(request, 'core/atendimento_form.html', {'form': form, 'title': 'Agendar Atendimento'})
-                
-                atendimento = form.save(commit=False)
-                atendimento.usuario = request.user
-                atendimento.save()
-                messages.success(request, 'Atendimento agendado com sucesso!')
-                return redirect('atendimento_list')
+                if salvar_atendimento(request, form, usuario=request.user):
+                    messages.success(request, 'Atendimento agendado com sucesso!')
+                    return redirect('atendimento_list')
             except Exception as e:
                 messages.error(request, 'Erro ao agendar atendimento.')
         else:
-            messages.error(request, 'Erro no formulário. Verifique os dados informados.')
+            mensagem_erro_atendimento(request, form)
     else:
-        form = AtendimentoForm()
+        # ?data_hora= vem dos horários livres da agenda
+        form = AtendimentoForm(initial={'data_hora': request.GET.get('data_hora')})
     return render(request, 'core/atendimento_form.html', {'form': form, 'title': 'Agendar Atendimento'})
 
 @login_required
@@ -187,13 +308,13 @@ def atendimento_update_view(request, pk):
         form = AtendimentoForm(request.POST, instance=atendimento)
         if form.is_valid():
             try:
-                form.save()
-                messages.success(request, 'Atendimento atualizado com sucesso!')
-                return redirect('atendimento_list')
+                if salvar_atendimento(request, form):
+                    messages.success(request, 'Atendimento atualizado com sucesso!')
+                    return redirect('atendimento_list')
             except Exception as e:
                 messages.error(request, 'Erro ao atualizar atendimento.')
         else:
-            messages.error(request, 'Erro no formulário. Verifique os dados informados.')
+            mensagem_erro_atendimento(request, form)
     else:
         form = AtendimentoForm(instance=atendimento)
     return render(request, 'core/atendimento_form.html', {'form': form, 'title': 'Editar Atendimento'})
@@ -210,22 +331,142 @@ def atendimento_delete_view(request, pk):
         return redirect('atendimento_list')
     return render(request, 'core/atendimento_confirm_delete.html', {'atendimento': atendimento})
 
+@login_required
+@require_POST
+def atendimento_restaurar_view(request, pk):
+    """Devolve um atendimento arquivado à lista principal."""
+    if arquivo.restaurar_lote(AtendimentoArquivado.objects.filter(pk=pk)):
+        messages.success(request, 'Atendimento restaurado do histórico!')
+    else:
+        messages.error(request, 'Atendimento arquivado não encontrado.')
+    return redirect('atendimento_list')
+
 # API para buscar CEP
 def buscar_cep(request):
-    cep = request.GET.get('cep', '').replace('-', '').replace('.', '')
+    cep = cep_cache.normalizar_cep(request.GET.get('cep', ''))
     if len(cep) == 8:
-        try:
-            response = requests.get(f'https://viacep.com.br/ws/{cep}/json/', timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if not data.get('erro'):
-                    return JsonResponse({
-                        'success': True,
-                        'logradouro': data.get('logradouro', ''),
-                        'bairro': data.get('bairro', ''),
-                        'cidade': data.get('localidade', ''),
-                        'estado': data.get('uf', ''),
-                    })
-        except requests.RequestException:
-            pass
+        dados = cep_cache.consultar_cep(cep)
+        if dados is not None:
+            return JsonResponse({'success': True, **dados})
+    return JsonResponse({'success': False})
+
+# Sugestões de CEP por prefixo (base local), usadas no campo CEP do cadastro de cliente
+def sugerir_ceps(request):
+    ceps = cep_cache.buscar_por_prefixo(request.GET.get('prefixo', ''))
+    return JsonResponse({'resultados': [
+        {
+            'cep': cep.cep_formatado,
+            'logradouro': cep.logradouro,
+            'bairro': cep.bairro,
+            'cidade': cep.cidade,
+            'estado': cep.estado,
+        }
+        for cep in ceps
+    ]})
+
+# Autocomplete de clientes do formulário de atendimento
+@login_required
+def sugerir_clientes(request):
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), 20)
+    except ValueError:
+        limite = 10
+    response = JsonResponse({'resultados': busca.sugerir_clientes(request.GET.get('q', ''), limite)})
+    patch_cache_control(response, private=True, max_age=30)
+    return response
+
+# Versão assíncrona (servida via CRM/asgi.py): não prende um worker enquanto o ViaCEP responde
+async def buscar_cep_async(request):
+    cep = cep_cache.normalizar_cep(request.GET.get('cep', ''))
+    if len(cep) == 8:
+        dados = await cep_cache.aconsultar_cep(cep)
+        if dados is not None:
+            return JsonResponse({'success': True, **dados})
     return JsonResponse({'success': False})
+
+@login_required
+def cep_estatisticas_view(request):
+    return JsonResponse({
+        **cep_cache.estatisticas.como_dict(),
+        'itens_memoria': len(cep_cache.memoria),
+        'circuito': cep_cache.circuito.estado,
+    })
+
+# ========== API JSON (/api/v1/) ==========
+@api.endpoint
+@require_http_methods(['GET', 'POST', 'PATCH'])
+def api_lista_view(request, modelo):
+    """
+    GET lista (?cursor=&limite=&campos= e filtros); POST cria e PATCH altera
+    uma lista de registros, tudo ou nada.
+    """
+    if request.method == 'GET':
+        return JsonResponse(api.listar(modelo, request.GET))
+    lote = api.ler_lote(request.body)
+    if request.method == 'POST':
+        return JsonResponse(api.criar(modelo, lote, request.user), status=201)
+    return JsonResponse(api.alterar(modelo, lote))
+
+@api.endpoint
+@require_GET
+def api_detalhe_view(request, modelo, pk):
+    dados = api.obter(modelo, pk, request.GET)
+    if dados is None:
+        return JsonResponse({'erro': 'Registro não encontrado.'}, status=404)
+    return JsonResponse(dados)
+
+@api.endpoint
+@require_POST
+def api_status_view(request):
+    return JsonResponse(api.alterar_status(api.ler_json(request.body)))
+
+@api.endpoint
+@require_GET
+def api_horarios_livres_view(request):
+    """
+    Horários livres de ?inicio= a ?fim= (AAAA-MM-DD; padrão: hoje e os 6 dias
+    seguintes), com ?abertura=, ?fechamento= (HH:MM) e ?duracao= (minutos)
+    opcionais.
+    """
+    parametros = request.GET
+    inicio = ler_data(parametros.get('inicio')) if parametros.get('inicio') else timezone.localdate()
+    fim = ler_data(parametros.get('fim')) if parametros.get('fim') else (inicio and inicio + timedelta(days=6))
+    if inicio is None or fim is None:
+        raise api.RequisicaoInvalida('inicio e fim: use o formato AAAA-MM-DD.')
+    if fim < inicio or (fim - inicio).days >= settings.AGENDA_DIAS_MAXIMO:
+        raise api.RequisicaoInvalida(f'O intervalo deve ter de 1 a {settings.AGENDA_DIAS_MAXIMO} dias.')
+    try:
+        abertura = parse_time(parametros.get('abertura', '')) or parse_time(settings.AGENDA_ABERTURA)
+        fechamento = parse_time(parametros.get('fechamento', '')) or parse_time(settings.AGENDA_FECHAMENTO)
+    except ValueError:
+        abertura = fechamento = None
+    if abertura is None or fechamento is None or fechamento <= abertura:
+        raise api.RequisicaoInvalida('abertura e fechamento: use o formato HH:MM, com a abertura antes do fechamento.')
+    try:
+        duracao = int(parametros.get('duracao') or settings.AGENDA_DURACAO)
+    except ValueError:
+        duracao = 0
+    if not 5 <= duracao <= 24 * 60:
+        raise api.RequisicaoInvalida('duracao: informe os minutos de cada horário (de 5 a 1440).')
+    
+    livres = agenda.horarios_livres(inicio, fim, abertura, fechamento, duracao)
+    return JsonResponse({
+        'duracao': duracao,
+        'dias': [
+            {'data': dia.isoformat(), 'livres': [f'{hora:%H:%M}' for hora in horas]}
+            for dia, horas in livres.items()
+        ],
+    })
+
+# Métricas no formato do Prometheus (por processo)
+def metricas_view(request):
+    token = settings.METRICAS_TOKEN
+    if token:
+        enviado = request.headers.get('Authorization', '').encode()
+        autorizado = secrets.compare_digest(enviado, f'Bearer {token}'.encode())
+    else:
+        # Sem token, só em desenvolvimento: os números expõem detalhes internos
+        autorizado = settings.DEBUG
+    if not autorizado:
+        return HttpResponseForbidden()
+    return HttpResponse(metricas.agregados.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')